@@ -0,0 +1,73 @@
+from typing import Dict, List, Optional
+
+# Airline filters are pushed down to Amadeus, and post-filtered only where they can't be:
+# lists longer than this are applied to the results instead
+AMADEUS_MAX_AIRLINE_CODES = 99
+
+
+def parse_airline_filter(airline: Optional[str], airlines: Optional[List[str]], excluded: Optional[List[str]]) -> Dict:
+    """
+    Normalise airline preferences into included/excluded carrier code lists
+
+    Returns:
+        Dictionary with 'included' and 'excluded' code lists and 'invalid' codes
+    """
+    included_codes = [c for c in (airline or '').split(',')] + list(airlines or [])
+    included_codes = [c.strip().upper() for c in included_codes if c and c.strip()]
+    excluded_codes = [c.strip().upper() for c in (excluded or []) if c and c.strip()]
+    invalid = [c for c in included_codes + excluded_codes if len(c) != 2 or not c.isalnum()]
+
+    # Amadeus takes only one of the two lists, so fold exclusions into the inclusion list
+    included_set = set(included_codes) - set(excluded_codes)
+    return {
+        'included': sorted(included_set),
+        'excluded': [] if included_codes else sorted(set(excluded_codes)),
+        'nothing_allowed': bool(included_codes) and not included_set,
+        'invalid': invalid
+    }
+
+
+def airline_search_kwargs(airline_filter: Dict) -> Dict:
+    """Carrier restrictions to pass to Amadeus (empty when the list is too long to push down)"""
+    if len(airline_filter['included']) > AMADEUS_MAX_AIRLINE_CODES or len(airline_filter['excluded']) > AMADEUS_MAX_AIRLINE_CODES:
+        return {}
+    return {
+        'included_airlines': airline_filter['included'] or None,
+        'excluded_airlines': airline_filter['excluded'] or None
+    }
+
+
+def flight_matches_airlines(flight: Dict, airline_filter: Dict) -> bool:
+    """Server-side check for filters Amadeus could not apply"""
+    carriers = {seg.get('carrier') for seg in flight.get('segments', []) + flight.get('return_segments', [])}
+    if airline_filter['included'] and not carriers.issubset(airline_filter['included']):
+        return False
+    return not carriers.intersection(airline_filter['excluded'])
+
+
+def invalid_airline_response(airline_filter: Dict) -> Optional[Dict]:
+    """Build an error response for malformed or mutually exclusive airline filters"""
+    if airline_filter['invalid']:
+        return {
+            'success': False,
+            'error': {
+                'code': 'INVALID_AIRLINE',
+                'message': f'Invalid airline code(s): {", ".join(airline_filter["invalid"])}',
+                'invalid_codes': airline_filter['invalid']
+            }
+        }
+    if airline_filter['nothing_allowed']:
+        return {
+            'success': False,
+            'error': {'code': 'INVALID_AIRLINE', 'message': 'Every selected airline is also excluded'}
+        }
+    return None
+
+
+def amadeus_airline_params(included_airlines: Optional[List[str]], excluded_airlines: Optional[List[str]]) -> Dict:
+    """Flight Offers Search parameters for carrier restrictions (Amadeus accepts one of the two)"""
+    if included_airlines:
+        return {'includedAirlineCodes': ','.join(sorted(included_airlines))}
+    if excluded_airlines:
+        return {'excludedAirlineCodes': ','.join(sorted(excluded_airlines))}
+    return {}
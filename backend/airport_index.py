@@ -0,0 +1,300 @@
+import json
+import unicodedata
+from bisect import bisect_left
+from pathlib import Path
+from typing import Optional, Dict, List, Set
+
+DEFAULT_DATA_PATH = Path(__file__).parent / 'data' / 'airports.json'
+
+# Tokens shorter than this are only matched by exact prefix, never fuzzily
+FUZZY_MIN_LENGTH = 4
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in text).split())
+
+
+def _deletes(term: str) -> Set[str]:
+    """All variants of term with a single character removed"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions)"""
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class AirportIndex:
+    """
+    In-memory airport/city lookup built from the bundled reference dataset.
+
+    Supports exact IATA code, word-prefix and typo-tolerant (edit distance 1)
+    matching. Results are ranked by match quality, then passenger traffic,
+    and returned in the same shape as Amadeus location results so callers
+    can fall back to the API transparently.
+    """
+
+    def __init__(self, data_path: Optional[Path] = None):
+        with open(data_path or DEFAULT_DATA_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+
+        self.version = data.get('version', 1)
+        self.airports: Dict[str, Dict] = {a['iata']: a for a in data['airports']}
+        self.cities: Dict[str, Dict] = {c['iata']: c for c in data['cities']}
+        # "Any London Airport"-style groups offered by the search form
+        self.groups: Dict[str, Dict] = {g['code']: g for g in data.get('groups', [])}
+
+        # Airport code -> metropolitan city code (LHR -> LON)
+        self.airport_city: Dict[str, str] = {}
+        for city in self.cities.values():
+            for code in city['airports']:
+                self.airport_city[code] = city['iata']
+
+        self._entries: List[Dict] = []
+        self._traffic: List[float] = []
+        self._code_entries: Dict[str, List[int]] = {}
+        self._term_entries: Dict[str, Set[int]] = {}
+        self._fuzzy: Dict[str, Set[str]] = {}
+
+        for city in self.cities.values():
+            if city['iata'] in self.airports:
+                # The code means the airport when searched (see resolve_codes), so a
+                # city entry would only list it twice
+                continue
+            traffic = sum(self.airports[code].get('traffic', 0) for code in city['airports'])
+            self._add_entry(self._city_location(city, traffic), traffic, city['iata'],
+                            [city['name']])
+        for airport in self.airports.values():
+            self._add_entry(self._airport_location(airport), airport.get('traffic', 0),
+                            airport['iata'], [airport['name'], airport['city']])
+
+        self._terms = sorted(self._term_entries)
+        for term in self._terms:
+            if len(term) < FUZZY_MIN_LENGTH:
+                continue
+            # Index prefixes too so a typo can be caught before the word is finished
+            for length in range(FUZZY_MIN_LENGTH, len(term) + 1):
+                prefix = term[:length]
+                for variant in _deletes(prefix) | {prefix}:
+                    self._fuzzy.setdefault(variant, set()).add(term)
+
+    def _add_entry(self, location: Dict, traffic: float, code: str, texts: List[str]):
+        idx = len(self._entries)
+        self._entries.append(location)
+        self._traffic.append(traffic)
+        self._code_entries.setdefault(code.lower(), []).append(idx)
+        for text in texts:
+            for term in normalize(text).split():
+                self._term_entries.setdefault(term, set()).add(idx)
+
+    def _airport_location(self, airport: Dict) -> Dict:
+        return {
+            'type': 'location',
+            'subType': 'AIRPORT',
+            'name': airport['name'],
+            'detailedName': f"{airport['city']}/{airport['name']}",
+            'iataCode': airport['iata'],
+            'address': {
+                'cityName': airport['city'],
+                'cityCode': self.airport_city.get(airport['iata'], airport['iata']),
+                'countryName': airport['country'],
+                'countryCode': airport['country_code']
+            },
+            'source': 'local'
+        }
+
+    def _city_location(self, city: Dict, traffic: float) -> Dict:
+        return {
+            'type': 'location',
+            'subType': 'CITY',
+            'name': city['name'],
+            'detailedName': f"{city['name']} (all airports)",
+            'iataCode': city['iata'],
+            'address': {
+                'cityName': city['name'],
+                'cityCode': city['iata'],
+                'countryName': city['country'],
+                'countryCode': city['country_code']
+            },
+            'airports': list(city['airports']),
+            'source': 'local'
+        }
+
+    def get_airport(self, code: str) -> Optional[Dict]:
+        """Look up an airport record by IATA code"""
+        return self.airports.get((code or '').upper())
+
+    def get_city(self, code: str) -> Optional[Dict]:
+        """Look up a metropolitan city record by IATA city code"""
+        return self.cities.get((code or '').upper())
+
+    def get_group(self, code: str) -> Optional[Dict]:
+        """Look up an airport group from the server-side catalog"""
+        return self.groups.get((code or '').upper())
+
+    def group_airports(self, code: str, airports: Optional[List[str]] = None) -> List[str]:
+        """
+        Authoritative airport list for a search location
+
+        When the client sends a group code with its own airport list, the
+        catalog's membership wins. Single airports and unknown codes are
+        returned unchanged for validation downstream.
+        """
+        group = self.get_group(code)
+        if group and (len(airports or []) > 1 or (not airports and code.upper() not in self.airports)):
+            return list(group['airports'])
+        return airports or [code]
+
+    def _prefix_matches(self, token: str) -> Set[int]:
+        matches: Set[int] = set()
+        i = bisect_left(self._terms, token)
+        while i < len(self._terms) and self._terms[i].startswith(token):
+            matches |= self._term_entries[self._terms[i]]
+            i += 1
+        return matches
+
+    def _fuzzy_matches(self, token: str) -> Set[int]:
+        if len(token) < FUZZY_MIN_LENGTH:
+            return set()
+        candidates: Set[str] = set()
+        for variant in _deletes(token) | {token}:
+            candidates |= self._fuzzy.get(variant, set())
+
+        matches: Set[int] = set()
+        for term in candidates:
+            lengths = (len(token) - 1, len(token), len(token) + 1)
+            if any(_edit_distance(token, term[:n]) <= 1 for n in lengths if n > 0):
+                matches |= self._term_entries[term]
+        return matches
+
+    def search(self, keyword: str, max_results: int = 10) -> List[Dict]:
+        """
+        Search airports and cities by code, name or city
+
+        Args:
+            keyword: Search term (city name, airport code, etc.)
+            max_results: Maximum number of results to return
+
+        Returns:
+            List of Amadeus-style location dicts, best match first
+        """
+        query = normalize(keyword)
+        if not query:
+            return []
+        tokens = query.split()
+
+        # score: 3 = exact IATA code, 2 = prefix match on every token, 1 = fuzzy match
+        scores: Dict[int, int] = {}
+        if len(tokens) == 1 and len(query) == 3:
+            for idx in self._code_entries.get(query, []):
+                scores[idx] = 3
+
+        prefix = None
+        for token in tokens:
+            matched = self._prefix_matches(token)
+            prefix = matched if prefix is None else prefix & matched
+        for idx in prefix or ():
+            scores.setdefault(idx, 2)
+
+        if len(scores) < max_results:
+            fuzzy = None
+            for token in tokens:
+                matched = self._prefix_matches(token) | self._fuzzy_matches(token)
+                fuzzy = matched if fuzzy is None else fuzzy & matched
+            for idx in fuzzy or ():
+                scores.setdefault(idx, 1)
+
+        ranked = sorted(scores, key=lambda idx: (-scores[idx], -self._traffic[idx]))
+        return [self._entries[idx] for idx in ranked[:max_results]]
+
+    def _code_traffic(self, code: str) -> float:
+        if code in self.cities:
+            return sum(self.airports[a].get('traffic', 0) for a in self.cities[code]['airports'])
+        return self.airports[code].get('traffic', 0)
+
+    def suggest(self, code: str, max_results: int = 3) -> List[str]:
+        """Suggest known IATA codes for an unknown code or a free-text place name"""
+        code = (code or '').strip().upper()
+        if len(code) == 3 and code.isalpha():
+            known = set(self.airports) | set(self.cities)
+            close = [c for c in known if _edit_distance(code, c) <= 1]
+            close.sort(key=lambda c: -self._code_traffic(c))
+            if close:
+                return close[:max_results]
+        return [loc['iataCode'] for loc in self.search(code, max_results)]
+
+    def resolve_codes(self, codes: List[str]) -> Dict:
+        """
+        Validate location codes and reduce them to the fewest upstream searches
+
+        City codes are passed through as-is (Amadeus searches every airport in
+        the city with one call) and airports already covered by a city code in
+        the same list are dropped. When the list contains every airport of a
+        metro area, they collapse to the city code. Single-airport cities
+        resolve to the airport. Codes that are both an airport and a city code
+        (BKK, IST) are treated as the airport, which is how the search form
+        uses them, and never used for collapsing. Codes missing from the
+        bundled IATA data are invalid, with suggestions.
+
+        Returns:
+            Dictionary with 'codes' to search, 'airports' the results may come
+            from, 'invalid' codes and 'suggestions' {invalid_code: [known codes]}
+        """
+        resolved: List[str] = []
+        invalid: List[str] = []
+        suggestions: Dict[str, List[str]] = {}
+
+        cleaned = [(c or '').strip().upper() for c in codes]
+        covered = set()
+        for code in cleaned:
+            if code in self.cities and code not in self.airports:
+                covered.update(self.cities[code]['airports'])
+
+        # Airport -> city code for metro areas requested in full
+        requested = set(cleaned)
+        collapse: Dict[str, str] = {}
+        for city_code, city in self.cities.items():
+            airports = city['airports']
+            if city_code not in self.airports and len(airports) > 1 and requested.issuperset(airports):
+                for airport in airports:
+                    collapse[airport] = city_code
+
+        airports_requested: List[str] = []
+        for code in cleaned:
+            if code in self.airports:
+                if code not in airports_requested:
+                    airports_requested.append(code)
+                if code in covered:
+                    continue
+                code = collapse.get(code, code)
+            elif code in self.cities:
+                airports = self.cities[code]['airports']
+                airports_requested.extend(a for a in airports if a not in airports_requested)
+                code = airports[0] if len(airports) == 1 else code
+            else:
+                if code not in invalid:
+                    invalid.append(code)
+                    suggestions[code] = self.suggest(code)
+                continue
+            if code not in resolved:
+                resolved.append(code)
+
+        return {
+            'codes': resolved,
+            'airports': airports_requested,
+            'invalid': invalid,
+            'suggestions': suggestions
+        }
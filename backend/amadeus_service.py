@@ -1,9 +1,20 @@
 from amadeus import Client, ResponseError
 import os
+import json
+import hashlib
 import asyncio
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional, Dict, List
-from datetime import datetime, timedelta
+from typing import Optional, Callable, Dict, List
+from datetime import datetime, timedelta, timezone
+from search_cache import SearchCache
+from airline_filter import amadeus_airline_params
+
+# How long a priced offer is trusted before the booking flow reprices it, in seconds
+PRICED_OFFER_TTL = 300
+# Longest a background call waits for in-flight pricing before going ahead anyway
+PRIORITY_WAIT_SECONDS = 5
 
 class AmadeusService:
     """Service to interact with Amadeus Flight Search API"""
@@ -14,6 +25,77 @@ class AmadeusService:
             client_secret=os.getenv('AMADEUS_API_SECRET'),
             hostname=os.getenv('AMADEUS_HOSTNAME', 'test')  # 'test' for sandbox, 'production' for live
         )
+        self.search_cache = SearchCache()
+        self.refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='amadeus-refresh')
+        self.priced_offer_cache = SearchCache(max_entries=1000)
+        # Pricing runs on its own threads so it never queues behind searches,
+        # and background sampling (fare calendar) yields while it is in flight
+        self.priority_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='amadeus-pricing')
+        self.priority_idle = threading.Event()
+        self.priority_idle.set()
+        self._priority_inflight = 0
+        self._priority_lock = threading.Lock()
+    
+    def _get_flight_offers(self, search_params: Dict) -> Dict:
+        """
+        Call Amadeus Flight Offers Search, answering from the negative cache when
+        the same search recently returned no offers or a 4xx error
+        """
+        cached = self.search_cache.get_negative(search_params)
+        if cached is not None:
+            if cached['negative_cache']['stale']:
+                self._revalidate_in_background(search_params)
+            return cached
+        
+        return self._fetch_flight_offers(search_params)
+    
+    def _revalidate_in_background(self, search_params: Dict):
+        """Refresh a stale negative entry once, off the request path"""
+        key = self.search_cache.make_key(search_params)
+        if not self.search_cache.begin_refresh(key):
+            return
+        
+        def refresh():
+            try:
+                result = self._fetch_flight_offers(search_params)
+                if result.get('success') and result.get('data'):
+                    # The route has offers again - stop answering "empty"
+                    self.search_cache.delete(key)
+            finally:
+                self.search_cache.end_refresh(key)
+        
+        self.refresh_executor.submit(refresh)
+    
+    def _fetch_flight_offers(self, search_params: Dict) -> Dict:
+        """Uncached Flight Offers Search call; negative outcomes are stored in the cache"""
+        try:
+            response = self.client.shopping.flight_offers_search.get(**search_params)
+            result = {
+                'success': True,
+                'data': response.data,
+                'meta': response.result.get('meta', {}),
+                'dictionaries': response.result.get('dictionaries', {})
+            }
+        except ResponseError as error:
+            result = {
+                'success': False,
+                'error': {
+                    'code': error.response.status_code,
+                    'message': str(error),
+                    'details': error.response.body if hasattr(error.response, 'body') else None
+                }
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': {
+                    'code': 500,
+                    'message': f'Unexpected error: {str(e)}'
+                }
+            }
+        
+        self.search_cache.store_negative(search_params, result)
+        return result
     
     async def search_flights_flexible(
         self,
@@ -26,19 +108,26 @@ class AmadeusService:
         infants: int = 0,
         travel_class: str = 'ECONOMY',
         non_stop: bool = False,
-        currency: str = 'GBP'
+        currency: str = 'GBP',
+        included_airlines: Optional[List[str]] = None,
+        excluded_airlines: Optional[List[str]] = None,
+        deadline: Optional[float] = None
     ) -> Dict:
         """
         Search for flights with flexible dates (±3 days)
         OPTIMIZED: Makes only 1 API call and generates matrix from the response.
         Uses Amadeus API's built-in date flexibility when available.
+        
+        deadline is a time.monotonic() value. Extra dates still running when it
+        passes are left out and listed in meta['timed_out_dates'].
         """
         try:
             base_dep_date = datetime.strptime(departure_date, '%Y-%m-%d')
             
             # Make SINGLE API call with larger result set
             # The API returns flights across nearby dates naturally
-            result = self._search_flights_sync(
+            result = await asyncio.to_thread(
+                self._search_flights_sync,
                 origin=origin,
                 destination=destination,
                 departure_date=departure_date,
@@ -49,7 +138,9 @@ class AmadeusService:
                 travel_class=travel_class,
                 non_stop=non_stop,
                 max_results=250,  # Get more results to find date variations
-                currency=currency
+                currency=currency,
+                included_airlines=included_airlines,
+                excluded_airlines=excluded_airlines
             )
             
             if not result.get('success') or not result.get('data'):
@@ -69,9 +160,11 @@ class AmadeusService:
                     if datetime.strptime(ret, '%Y-%m-%d') > datetime.strptime(dep, '%Y-%m-%d'):
                         additional_dates.append({'dep': dep, 'ret': ret, 'offset': offset})
             
-            # Make minimal additional calls
+            # Make minimal additional calls, concurrently and within the deadline
+            extra_searches = {}
             for combo in additional_dates:
-                extra_result = self._search_flights_sync(
+                extra_searches[combo['dep']] = (combo, asyncio.ensure_future(asyncio.to_thread(
+                    self._search_flights_sync,
                     origin=origin,
                     destination=destination,
                     departure_date=combo['dep'],
@@ -82,8 +175,21 @@ class AmadeusService:
                     travel_class=travel_class,
                     non_stop=non_stop,
                     max_results=50,
-                    currency=currency
-                )
+                    currency=currency,
+                    included_airlines=included_airlines,
+                    excluded_airlines=excluded_airlines
+                )))
+            
+            timed_out_dates = []
+            if extra_searches:
+                timeout = max(0, deadline - time.monotonic()) if deadline else None
+                await asyncio.wait([task for _, task in extra_searches.values()], timeout=timeout)
+            for dep_date, (combo, task) in extra_searches.items():
+                if not task.done():
+                    # Left running - its outcome still lands in the search cache
+                    timed_out_dates.append(dep_date)
+                    continue
+                extra_result = task.result()
                 if extra_result.get('success') and extra_result.get('data'):
                     for flight in extra_result['data']:
                         flight['date_offset'] = combo['offset']
@@ -101,8 +207,10 @@ class AmadeusService:
                 'meta': {
                     'count': len(all_flights), 
                     'flexible_search': True,
-                    'api_calls': 3  # Max 3 API calls now
-                }
+                    'api_calls': 3,  # Max 3 API calls now
+                    'timed_out_dates': timed_out_dates
+                },
+                'partial': bool(timed_out_dates)
             }
             
         except Exception as e:
@@ -126,7 +234,9 @@ class AmadeusService:
         travel_class: str = 'ECONOMY',
         non_stop: bool = False,
         max_results: int = 50,
-        currency: str = 'GBP'
+        currency: str = 'GBP',
+        included_airlines: Optional[List[str]] = None,
+        excluded_airlines: Optional[List[str]] = None
     ) -> Dict:
         """Synchronous version of search_flights for use in thread pool"""
         try:
@@ -147,24 +257,10 @@ class AmadeusService:
                 search_params['children'] = children
             if infants > 0:
                 search_params['infants'] = infants
+            search_params.update(amadeus_airline_params(included_airlines, excluded_airlines))
             
-            response = self.client.shopping.flight_offers_search.get(**search_params)
-            
-            return {
-                'success': True,
-                'data': response.data,
-                'meta': response.result.get('meta', {}),
-                'dictionaries': response.result.get('dictionaries', {})
-            }
+            return self._get_flight_offers(search_params)
             
-        except ResponseError as error:
-            return {
-                'success': False,
-                'error': {
-                    'code': error.response.status_code,
-                    'message': str(error)
-                }
-            }
         except Exception as e:
             return {
                 'success': False,
@@ -186,7 +282,9 @@ class AmadeusService:
         travel_class: str = 'ECONOMY',
         non_stop: bool = False,
         max_results: int = 50,
-        currency: str = 'GBP'
+        currency: str = 'GBP',
+        included_airlines: Optional[List[str]] = None,
+        excluded_airlines: Optional[List[str]] = None
     ) -> Dict:
         """
         Search for flight offers using Amadeus API
@@ -202,6 +300,8 @@ class AmadeusService:
             travel_class: ECONOMY, PREMIUM_ECONOMY, BUSINESS, or FIRST
             non_stop: True for direct flights only
             max_results: Maximum number of flight offers to return
+            included_airlines: Only return offers on these carriers (IATA codes)
+            excluded_airlines: Never return offers on these carriers
         
         Returns:
             Dictionary with flight offers from Amadeus API
@@ -228,25 +328,12 @@ class AmadeusService:
             if infants > 0:
                 search_params['infants'] = infants
             
-            # Call Amadeus API
-            response = self.client.shopping.flight_offers_search.get(**search_params)
+            # Let Amadeus apply the airline filter so we don't download offers we'd discard
+            search_params.update(amadeus_airline_params(included_airlines, excluded_airlines))
             
-            return {
-                'success': True,
-                'data': response.data,
-                'meta': response.result.get('meta', {}),
-                'dictionaries': response.result.get('dictionaries', {})
-            }
+            # Call Amadeus API
+            return self._get_flight_offers(search_params)
             
-        except ResponseError as error:
-            return {
-                'success': False,
-                'error': {
-                    'code': error.response.status_code,
-                    'message': str(error),
-                    'details': error.response.body if hasattr(error.response, 'body') else None
-                }
-            }
         except Exception as e:
             return {
                 'success': False,
@@ -303,7 +390,8 @@ class AmadeusService:
         departure_date: str,
         one_way: bool = False,
         duration: int = 7,
-        currency: str = 'GBP'
+        currency: str = 'GBP',
+        on_fare: Optional[Callable[[str, float], None]] = None
     ) -> Dict:
         """
         Get cheapest fares for 6 months - optimized sampling
@@ -315,6 +403,7 @@ class AmadeusService:
             one_way: True for one-way, False for round-trip
             duration: Trip duration in days (for round-trip)
             currency: Currency code (default GBP)
+            on_fare: Called with (date, price) as each date's lookup completes
         
         Returns:
             Dictionary with fare calendar data {date: price}
@@ -341,7 +430,9 @@ class AmadeusService:
             
             # Use thread pool for concurrent searches
             loop = asyncio.get_event_loop()
-            with ThreadPoolExecutor(max_workers=4) as executor:
+            # Shut down without waiting so a cancelled calendar doesn't block the event loop
+            executor = ThreadPoolExecutor(max_workers=4)
+            try:
                 for i in range(0, len(dates_to_search), 4):
                     batch = dates_to_search[i:i+4]
                     futures = []
@@ -376,11 +467,15 @@ class AmadeusService:
                             price = await future
                             if price is not None:
                                 fare_calendar[dep_date] = price
+                                if on_fare:
+                                    on_fare(dep_date, price)
                         except Exception:
                             pass
                     
                     # Small delay between batches
                     await asyncio.sleep(0.05)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
             
             return {
                 'success': True,
@@ -399,6 +494,81 @@ class AmadeusService:
                 }
             }
     
+    def _wait_for_priority_calls(self):
+        """Hold background calls back while booking-critical pricing is in flight"""
+        self.priority_idle.wait(timeout=PRIORITY_WAIT_SECONDS)
+    
+    async def price_flight_offers(self, offers: List[Dict]) -> Dict:
+        """
+        Confirm current price and availability of flight offers (Flight Offers Price)
+        
+        Results are cached for PRICED_OFFER_TTL seconds so moving back and forth
+        in the booking flow doesn't reprice the same offers.
+        
+        Args:
+            offers: Raw Amadeus flight offers as returned by the search (several
+                    for split tickets, priced together)
+        
+        Returns:
+            Dictionary with 'total_price', 'currency' and the priced 'offers'
+        """
+        digest = hashlib.sha256(json.dumps(offers, sort_keys=True, default=str).encode()).hexdigest()
+        cached = self.priced_offer_cache.get((digest,))
+        if cached is not None:
+            return {**cached, 'cached': True}
+        
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.priority_executor, self._price_flight_offers_sync, offers)
+        if result.get('success'):
+            self.priced_offer_cache.set((digest,), result, PRICED_OFFER_TTL)
+        return {**result, 'cached': False}
+    
+    def _price_flight_offers_sync(self, offers: List[Dict]) -> Dict:
+        """Synchronous pricing call, run on the priority executor"""
+        with self._priority_lock:
+            self._priority_inflight += 1
+            self.priority_idle.clear()
+        try:
+            response = self.client.shopping.flight_offers.pricing.post(offers)
+            priced = response.data.get('flightOffers', [])
+            if len(priced) != len(offers):
+                return {
+                    'success': False,
+                    'error': {
+                        'code': 409,
+                        'message': 'One or more flight offers are no longer available'
+                    }
+                }
+            return {
+                'success': True,
+                'total_price': round(sum(float(o.get('price', {}).get('total', 0)) for o in priced), 2),
+                'currency': priced[0].get('price', {}).get('currency', 'GBP') if priced else 'GBP',
+                'offers': priced,
+                'priced_at': datetime.now(timezone.utc).isoformat()
+            }
+        except ResponseError as error:
+            return {
+                'success': False,
+                'error': {
+                    'code': error.response.status_code,
+                    'message': str(error),
+                    'details': error.response.body if hasattr(error.response, 'body') else None
+                }
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': {
+                    'code': 500,
+                    'message': f'Pricing error: {str(e)}'
+                }
+            }
+        finally:
+            with self._priority_lock:
+                self._priority_inflight -= 1
+                if self._priority_inflight == 0:
+                    self.priority_idle.set()
+    
     def _get_cheapest_price_sync(
         self,
         origin: str,
@@ -421,10 +591,11 @@ class AmadeusService:
             if return_date:
                 search_params['returnDate'] = return_date
             
-            response = self.client.shopping.flight_offers_search.get(**search_params)
+            self._wait_for_priority_calls()
+            result = self._get_flight_offers(search_params)
             
-            if response.data and len(response.data) > 0:
-                price = response.data[0].get('price', {}).get('grandTotal')
+            if result.get('success') and result.get('data'):
+                price = result['data'][0].get('price', {}).get('grandTotal')
                 if price:
                     return float(price)
             return None
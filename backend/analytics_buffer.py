@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from typing import Dict, List
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+# A flush starts once this many events are buffered...
+FLUSH_SIZE = 200
+# ...or this long after the previous one
+FLUSH_SECONDS = 2.0
+# Beyond this many buffered events, add() waits for a flush (backpressure)...
+MAX_BUFFERED = 5000
+# ...for at most this long before dropping the event
+BACKPRESSURE_TIMEOUT = 1.0
+
+
+class AnalyticsBuffer:
+    """
+    Write-behind buffer for analytics events
+
+    add() only appends to memory; a background task writes the events with
+    insert_many when FLUSH_SIZE are buffered or every FLUSH_SECONDS, using an
+    unjournaled w=1 write concern since losing a few events on a crash is
+    acceptable. Whatever is buffered is flushed on shutdown. When writes
+    can't keep up and the buffer is full, add() waits for room instead of
+    growing memory without bound, and drops the event if none appears.
+    """
+
+    def __init__(
+        self,
+        collection,
+        flush_size: int = FLUSH_SIZE,
+        flush_seconds: float = FLUSH_SECONDS,
+        max_buffered: int = MAX_BUFFERED
+    ):
+        self.collection = collection.with_options(write_concern=WriteConcern(w=1, j=False))
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_buffered = max_buffered
+        self._buffer: List[Dict] = []
+        self._flush_now = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.stats = {
+            'added': 0,
+            'written': 0,
+            'flushes': 0,
+            'write_errors': 0,
+            'backpressure_waits': 0,
+            'dropped': 0
+        }
+
+    async def add(self, event: Dict) -> bool:
+        """Buffer an event; returns False if it was dropped because the buffer stayed full"""
+        if len(self._buffer) >= self.max_buffered:
+            self.stats['backpressure_waits'] += 1
+            self._space.clear()
+            self._flush_now.set()
+            try:
+                await asyncio.wait_for(self._space.wait(), timeout=BACKPRESSURE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.stats['dropped'] += 1
+                return False
+        self._buffer.append(event)
+        self.stats['added'] += 1
+        if len(self._buffer) >= self.flush_size:
+            self._flush_now.set()
+        return True
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        async with self._flush_lock:
+            while self._buffer:
+                batch, self._buffer = self._buffer[:self.flush_size], self._buffer[self.flush_size:]
+                try:
+                    await self.collection.insert_many(batch, ordered=False)
+                    self.stats['written'] += len(batch)
+                    self.stats['flushes'] += 1
+                except asyncio.CancelledError:
+                    # Stopped mid-write: put the batch back for the final flush
+                    self._buffer = batch + self._buffer
+                    raise
+                except BulkWriteError as e:
+                    # Rejected documents would be rejected again - keep what was written and move on
+                    written = e.details.get('nInserted', 0)
+                    self.stats['written'] += written
+                    self.stats['dropped'] += len(batch) - written
+                    self.stats['write_errors'] += 1
+                    logger.error(f"Analytics flush wrote {written}/{len(batch)} events: {e}")
+                except Exception as e:
+                    self.stats['write_errors'] += 1
+                    logger.error(f"Analytics flush of {len(batch)} events failed: {e}")
+                    # Keep the batch for the next flush if there is room, otherwise it is lost
+                    kept = batch[:max(self.max_buffered - len(self._buffer), 0)]
+                    self._buffer = kept + self._buffer
+                    self.stats['dropped'] += len(batch) - len(kept)
+                    break
+                finally:
+                    if len(self._buffer) < self.max_buffered:
+                        self._space.set()
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self):
+        """Stop the background flusher and write what is left"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            logger.warning(f"{len(self._buffer)} analytics events lost at shutdown")
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'pending': len(self._buffer)}
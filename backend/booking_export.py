@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+
+# Documents fetched from MongoDB per round trip - the cursor never holds more
+EXPORT_BATCH_SIZE = 500
+# Output is sent in chunks of about this many bytes
+CHUNK_SIZE = 64 * 1024
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# (CSV header, dotted path into the booking) - one row per booking
+CSV_COLUMNS = [
+    ('id', 'id'),
+    ('pnr', 'pnr'),
+    ('status', 'status'),
+    ('mock', 'mock'),
+    ('created_at', 'created_at'),
+    ('total_price', 'total_price'),
+    ('currency', 'currency'),
+    ('contact_email', 'contact.email'),
+    ('contact_phone', 'contact.phone'),
+    ('lead_passenger', None),
+    ('passengers', None),
+    ('from', 'flight_data.from'),
+    ('to', 'flight_data.to'),
+    ('airline', 'flight_data.airline'),
+    ('departure_time', 'flight_data.departure_time'),
+    ('return_departure_time', 'flight_data.return_departure_time'),
+    ('flight_id', 'flight_id')
+]
+CSV_PROJECTION = {
+    '_id': 0,
+    'passengers.first_name': 1,
+    'passengers.last_name': 1,
+    **{path: 1 for _, path in CSV_COLUMNS if path}
+}
+# Spreadsheets run cells starting with these as formulas, so such text cells get a leading quote
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# NDJSON carries whole bookings, less internal bookkeeping
+NDJSON_PROJECTION = {'_id': 0, 'outbox': 0}
+
+
+def export_query(date_from: Optional[date] = None, date_to: Optional[date] = None, statuses: Optional[List[str]] = None) -> Dict:
+    """
+    Filter for bookings created between date_from and date_to (inclusive, UTC)
+
+    created_at is an ISO string, so whole days compare as string prefixes.
+    """
+    query = {}
+    created = {}
+    if date_from:
+        created['$gte'] = date_from.isoformat()
+    if date_to:
+        created['$lt'] = (date_to + timedelta(days=1)).isoformat()
+    if created:
+        query['created_at'] = created
+    if statuses:
+        query['status'] = {'$in': statuses}
+    return query
+
+
+def _get(doc: Dict, path: str):
+    for key in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_row(booking: Dict) -> List:
+    passengers = booking.get('passengers') or []
+    row = []
+    for header, path in CSV_COLUMNS:
+        if header == 'lead_passenger':
+            value = f"{passengers[0].get('first_name', '')} {passengers[0].get('last_name', '')}".strip() if passengers else ''
+        elif header == 'passengers':
+            value = len(passengers)
+        else:
+            value = _get(booking, path)
+        row.append(csv_cell(value))
+    return row
+
+
+async def export_bookings(collection, query: Dict, fmt: str = 'csv', gzip: bool = False) -> AsyncIterator[bytes]:
+    """
+    Stream bookings matching query as CSV or NDJSON chunks, optionally gzipped
+
+    Rows are read from a cursor in EXPORT_BATCH_SIZE batches and written out
+    in CHUNK_SIZE chunks; the next batch is only fetched once the response
+    has taken the previous chunks, so memory stays the same however many
+    bookings are exported. Bookings come oldest first in (created_at, id)
+    order, which the bookings index serves without an in-memory sort.
+    """
+    projection = CSV_PROJECTION if fmt == 'csv' else NDJSON_PROJECTION
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow([header for header, _ in CSV_COLUMNS])
+
+    def take() -> bytes:
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    cursor = collection.find(query, projection).sort([('created_at', 1), ('id', 1)]).batch_size(EXPORT_BATCH_SIZE)
+    try:
+        async for booking in cursor:
+            if fmt == 'csv':
+                writer.writerow(csv_row(booking))
+            else:
+                buffer.write(json.dumps(booking, default=str))
+                buffer.write('\n')
+            if buffer.tell() >= CHUNK_SIZE:
+                chunk = take()
+                if chunk:
+                    yield chunk
+        chunk = take()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+    finally:
+        # Also reached when the client disconnects mid-export
+        await cursor.close()
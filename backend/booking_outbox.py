@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+from pymongo import UpdateOne
+from mail_service import MailQueue
+
+logger = logging.getLogger(__name__)
+
+# Bookings relayed per dispatcher pass
+BATCH_SIZE = 50
+# How often the dispatcher looks for intents it wasn't notified about (e.g. after a restart)
+POLL_SECONDS = 10
+
+# email_params(booking, recipient_type) -> (template ID, template parameters)
+EmailParams = Callable[[Dict, str], Tuple[str, Dict]]
+
+
+def email_intents(recipients: List[Tuple[str, str, str]]) -> List[Dict]:
+    """
+    Outbox entries to store on a new booking
+
+    Args:
+        recipients: (type, recipient_type, to) per email, e.g.
+                    ('customer_confirmation', 'customer', 'jane@example.com')
+    """
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "type": email_type,
+            "recipient": recipient,
+            "to": to_email,
+            "status": "PENDING"
+        }
+        for email_type, recipient, to_email in recipients
+    ]
+
+
+class BookingOutbox:
+    """
+    Transactional outbox for booking emails
+
+    A booking is written together with its email intents in one document, so
+    a confirmation can't be lost between the two writes. The dispatcher picks
+    up bookings with PENDING intents in batches, queues template messages
+    for them in the mail queue (which renders, delivers and retries them)
+    and marks the intents QUEUED. Queue documents reuse the intent IDs, so a
+    batch that is relayed twice is only queued once.
+    """
+
+    def __init__(self, db, mail_queue: MailQueue, email_params: EmailParams, batch_size: int = BATCH_SIZE):
+        self.bookings = db.bookings
+        self.mail_queue = mail_queue
+        self.email_params = email_params
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.stats = {
+            'batches': 0,
+            'queued': 0,
+            'failures': 0
+        }
+
+    def notify(self):
+        """Wake the dispatcher after a booking with intents has been written"""
+        self._wakeup.set()
+
+    async def start(self):
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._dispatcher())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _dispatcher(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                if await self.dispatch_batch() >= self.batch_size:
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Booking outbox dispatcher error: {e}")
+                await asyncio.sleep(POLL_SECONDS)
+
+    async def dispatch_batch(self) -> int:
+        """
+        Relay one batch of bookings with pending email intents
+
+        Returns:
+            Number of bookings processed
+        """
+        bookings = await self.bookings.find(
+            {"outbox.status": "PENDING"},
+            {"_id": 0}
+        ).sort("created_at", 1).to_list(self.batch_size)
+        if not bookings:
+            return 0
+
+        now = datetime.now(timezone.utc).isoformat()
+        messages = []
+        updates = []
+        for booking in bookings:
+            pending = [intent for intent in booking.get('outbox', []) if intent['status'] == 'PENDING']
+            try:
+                for intent in pending:
+                    template_id, params = self.email_params(booking, intent['recipient'])
+                    messages.append(self.mail_queue.template_message(
+                        intent['to'],
+                        template_id,
+                        params,
+                        category="booking",
+                        reference=booking['id'],
+                        message_id=intent['id'],
+                        booking_id=booking['id'],
+                        pnr=booking['pnr'],
+                        type=intent['type']
+                    ))
+                status = {"outbox.$[intent].status": "QUEUED", "outbox.$[intent].queued_at": now}
+            except Exception as e:
+                # A malformed booking must not block the rest of the batch
+                logger.error(f"Could not prepare emails for booking {booking.get('pnr')}: {e}")
+                self.stats['failures'] += 1
+                messages = [m for m in messages if m['booking_id'] != booking['id']]
+                status = {"outbox.$[intent].status": "FAILED", "outbox.$[intent].error": str(e)}
+            updates.append(UpdateOne(
+                {"id": booking['id']},
+                {"$set": status},
+                array_filters=[{"intent.id": {"$in": [intent['id'] for intent in pending]}}]
+            ))
+
+        # Queue first: if we stop before marking, the next pass re-relays idempotently
+        self.stats['queued'] += await self.mail_queue.enqueue_many(messages)
+        await self.bookings.bulk_write(updates, ordered=False)
+        self.stats['batches'] += 1
+        return len(bookings)
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'running': bool(self._task)}
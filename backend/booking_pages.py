@@ -0,0 +1,70 @@
+import base64
+import json
+from typing import Dict, Optional
+
+# Fields returned per booking by the listing; full details come from GET /bookings/{pnr}
+BOOKING_SUMMARY_PROJECTION = {
+    '_id': 0,
+    'id': 1,
+    'pnr': 1,
+    'status': 1,
+    'mock': 1,
+    'created_at': 1,
+    'total_price': 1,
+    'currency': 1,
+    'passenger_counts': 1,
+    'contact.email': 1,
+    'flight_data.from': 1,
+    'flight_data.to': 1,
+    'flight_data.departure_time': 1,
+    'flight_data.return_departure_time': 1,
+    'flight_data.airline': 1
+}
+BOOKINGS_PAGE_MAX = 100
+
+
+def encode_booking_cursor(booking: Dict) -> str:
+    """Opaque cursor pointing after a booking in (created_at, id) descending order"""
+    position = json.dumps([booking['created_at'], booking['id']])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_booking_cursor(cursor: str) -> Dict:
+    """Query for the bookings after a cursor (raises ValueError on a malformed one)"""
+    try:
+        created_at, booking_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    # Anything but strings could smuggle query operators into the filter
+    if not isinstance(created_at, str) or not isinstance(booking_id, str):
+        raise ValueError('Invalid cursor')
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, 'id': {'$lt': booking_id}}
+    ]}
+
+
+async def bookings_page(collection, limit: int = 20, cursor: Optional[str] = None) -> Dict:
+    """
+    One page of booking summaries, newest first
+
+    Keyset pagination on (created_at, id), served by the bookings index, so
+    a page costs the same however deep it is. Raises ValueError on a
+    malformed cursor.
+
+    Returns:
+        {'bookings', 'has_more', 'next_cursor'}
+    """
+    limit = max(1, min(limit, BOOKINGS_PAGE_MAX))
+    query = decode_booking_cursor(cursor) if cursor else {}
+    # One extra row tells whether there is another page
+    bookings = await collection.find(query, BOOKING_SUMMARY_PROJECTION).sort(
+        [('created_at', -1), ('id', -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    has_more = len(bookings) > limit
+    bookings = bookings[:limit]
+    return {
+        'bookings': bookings,
+        'has_more': has_more,
+        'next_cursor': encode_booking_cursor(bookings[-1]) if has_more else None
+    }
@@ -0,0 +1,92 @@
+"""
+Rebuild airports.json from the airportsdata package
+
+Every airport with an IATA code is included so that searches can be validated
+locally. The curated entries already in airports.json (names, traffic ranking),
+the metro cities and the search form groups are kept; metro areas from the
+IATA list are added as cities when missing.
+
+    pip install airportsdata pycountry
+    python backend/data/build_airports.py
+"""
+import csv
+import json
+from pathlib import Path
+
+import airportsdata
+import pycountry
+
+DATA_PATH = Path(__file__).parent / 'airports.json'
+MACS_PATH = Path(airportsdata.__file__).parent / 'iata_macs.csv'
+# Version 2 is the full IATA list; version 1 only had the busiest airports
+VERSION = 2
+
+
+def country_name(code: str, known: dict) -> str:
+    if code in known:
+        return known[code]
+    country = pycountry.countries.get(alpha_2=code)
+    if country is None:
+        return code
+    return getattr(country, 'common_name', None) or country.name
+
+
+def airport_name(name: str) -> str:
+    return name[:-len(' Airport')] if name.endswith(' Airport') else name
+
+
+def build(current: dict) -> dict:
+    airports = {a['iata']: a for a in current['airports']}
+    countries = {a['country_code']: a['country'] for a in current['airports']}
+    countries.update({c['country_code']: c['country'] for c in current['cities']})
+
+    for airport in airportsdata.load('IATA').values():
+        if airport['iata'] in airports:
+            continue
+        airports[airport['iata']] = {
+            'iata': airport['iata'],
+            'name': airport_name(airport['name']),
+            'city': airport['city'] or airport_name(airport['name']),
+            'country': country_name(airport['country'], countries),
+            'country_code': airport['country'],
+            'traffic': 0
+        }
+
+    cities = {c['iata']: c for c in current['cities']}
+    curated = set(cities)
+    with open(MACS_PATH, encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row['City Code'] in curated or row['Airport Code'] not in airports:
+                continue
+            city = cities.setdefault(row['City Code'], {
+                'iata': row['City Code'],
+                'name': row['City Name'],
+                'country': country_name(row['Country'], countries),
+                'country_code': row['Country'],
+                'airports': []
+            })
+            if row['Airport Code'] not in city['airports']:
+                city['airports'].append(row['Airport Code'])
+
+    return {
+        'version': VERSION,
+        'airports': list(airports.values()),
+        'cities': list(cities.values()),
+        'groups': current.get('groups', [])
+    }
+
+
+def write(data: dict):
+    """One record per line, as the file has always been laid out"""
+    lines = ['{', f'  "version": {data["version"]},']
+    for key in ('airports', 'cities', 'groups'):
+        records = [f'    {json.dumps(record, ensure_ascii=False)}' for record in data[key]]
+        closing = ']' if key == 'groups' else '],'
+        lines += [f'  "{key}": [', ',\n'.join(records), f'  {closing}']
+    lines.append('}')
+    DATA_PATH.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+if __name__ == '__main__':
+    with open(DATA_PATH, encoding='utf-8') as f:
+        write(build(json.load(f)))
@@ -0,0 +1,145 @@
+import logging
+from datetime import datetime
+from typing import Dict, List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Indexes every collection the API queries needs. TTL indexes expire documents
+# at their expire_at date (a BSON date; the *_at strings can't be used by TTL).
+INDEXES: Dict[str, List[IndexModel]] = {
+    'bookings': [
+        IndexModel([('pnr', ASCENDING)], unique=True, name='pnr_unique'),
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('created_at', DESCENDING), ('id', DESCENDING)], name='created_at_id_desc'),
+        IndexModel([('outbox.status', ASCENDING)], name='outbox_status')
+    ],
+    'emails': [
+        IndexModel([('pnr', ASCENDING)], name='pnr'),
+        IndexModel([('booking_id', ASCENDING)], name='booking_id')
+    ],
+    'mail_queue': [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('status', ASCENDING), ('next_attempt_at', ASCENDING)], name='status_next_attempt'),
+        IndexModel([('pnr', ASCENDING)], name='pnr'),
+        IndexModel([('booking_id', ASCENDING)], name='booking_id')
+    ],
+    'users': [
+        IndexModel([('email', ASCENDING)], unique=True, name='email_unique'),
+        IndexModel([('user_id', ASCENDING)], unique=True, name='user_id_unique')
+    ],
+    'user_sessions': [
+        IndexModel([('session_token', ASCENDING)], unique=True, name='session_token_unique'),
+        IndexModel([('user_id', ASCENDING)], name='user_id'),
+        IndexModel([('expire_at', ASCENDING)], expireAfterSeconds=0, name='expire_at_ttl')
+    ],
+    'session_invalidations': [
+        IndexModel([('created_at', ASCENDING)], name='created_at'),
+        IndexModel([('expire_at', ASCENDING)], expireAfterSeconds=0, name='expire_at_ttl')
+    ],
+    'password_resets': [
+        IndexModel([('token', ASCENDING)], unique=True, name='token_unique'),
+        IndexModel([('user_id', ASCENDING)], name='user_id'),
+        IndexModel([('expire_at', ASCENDING)], expireAfterSeconds=0, name='expire_at_ttl')
+    ],
+    'fare_cache': [
+        IndexModel([('cache_key', ASCENDING)], unique=True, name='cache_key_unique'),
+        IndexModel([('expire_at', ASCENDING)], expireAfterSeconds=0, name='expire_at_ttl')
+    ],
+    'route_index': [
+        IndexModel([('route_key', ASCENDING)], unique=True, name='route_key_unique')
+    ],
+    'contact_submissions': [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique')
+    ],
+    'flight_searches': [
+        IndexModel([('timestamp', ASCENDING)], name='timestamp')
+    ],
+    'flight_search_rollups_hourly': [
+        IndexModel([('hour', ASCENDING)], name='hour')
+    ],
+    'flight_search_rollups_daily': [
+        IndexModel([('day', ASCENDING)], name='day')
+    ]
+}
+
+# (collection, filter, sort) of the queries on request paths and in workers
+HOT_QUERIES = [
+    ('bookings', {'pnr': 'F380AB'}, None),
+    ('bookings', {}, [('created_at', -1), ('id', -1)]),
+    ('bookings', {'created_at': {'$gte': '2000-01-01', '$lt': '2000-02-01'}}, [('created_at', 1), ('id', 1)]),
+    ('bookings', {'outbox.status': 'PENDING'}, None),
+    ('emails', {'pnr': 'F380AB'}, None),
+    ('emails', {'booking_id': 'x'}, None),
+    ('mail_queue', {'pnr': 'F380AB', 'category': 'booking'}, None),
+    ('mail_queue', {'booking_id': 'x', 'category': 'booking'}, None),
+    ('mail_queue', {'status': 'PENDING', 'next_attempt_at': {'$lte': '9999'}}, [('next_attempt_at', 1)]),
+    ('users', {'email': 'x@example.com'}, None),
+    ('users', {'user_id': 'x'}, None),
+    ('user_sessions', {'session_token': 'x'}, None),
+    ('session_invalidations', {'created_at': {'$gte': '2000-01-01'}}, None),
+    ('password_resets', {'token': 'x', 'used': False}, None),
+    ('fare_cache', {'cache_key': 'LHR_DXB_RT7'}, None),
+    ('flight_searches', {'timestamp': {'$gte': datetime(2000, 1, 1)}}, None),
+    ('flight_search_rollups_daily', {'day': {'$gte': datetime(2000, 1, 1)}}, None)
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Create any missing indexes (existing ones are left alone)
+
+    A failure on one collection - e.g. duplicate emails blocking a unique
+    index - is logged and doesn't stop the others or the app.
+
+    Returns:
+        {collection: [index names]} for the collections that succeeded
+    """
+    created = {}
+    for name, indexes in INDEXES.items():
+        try:
+            created[name] = await db[name].create_indexes(indexes)
+        except OperationFailure as e:
+            logger.error(f"Could not create indexes on {name}: {e}")
+    logger.info(f"Indexes ensured on {len(created)}/{len(INDEXES)} collections")
+    return created
+
+
+def _stages(plan: Dict) -> List[str]:
+    """Every stage name in an explain plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_stages(value))
+    return stages
+
+
+async def check_hot_queries(db) -> List[Dict]:
+    """
+    Explain every hot query and report whether it is served by an index
+
+    Returns:
+        One {'collection', 'filter', 'indexed', 'stages'} per query
+    """
+    results = []
+    for collection, query, sort in HOT_QUERIES:
+        command = {'find': collection, 'filter': query, 'limit': 1}
+        if sort:
+            command['sort'] = dict(sort)
+        try:
+            explained = await db.command({'explain': command, 'verbosity': 'queryPlanner'})
+            stages = _stages(explained.get('queryPlanner', {}).get('winningPlan', {}))
+            indexed = 'COLLSCAN' not in stages
+        except OperationFailure as e:
+            stages, indexed = [str(e)], False
+        if not indexed:
+            logger.warning(f"Query on {collection} {query} is not using an index: {stages}")
+        results.append({'collection': collection, 'filter': query, 'indexed': indexed, 'stages': stages})
+    return results
+
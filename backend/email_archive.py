@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import uuid
+import zlib
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from mail_service import MailQueue
+
+logger = logging.getLogger(__name__)
+
+# Legacy emails compressed per bulk write
+COMPRESS_BATCH_SIZE = 500
+# The compression pass runs in one worker at a time; a lease older than this is assumed dead
+LEASE_ID = 'email_compression'
+LEASE = timedelta(minutes=10)
+# Fields of an email listed with a booking; bodies are only produced when viewed
+SUMMARY_FIELDS = ("id", "booking_id", "pnr", "type", "to", "subject", "status", "sent_at", "created_at", "template", "template_version")
+
+
+def compress_body(body: str) -> bytes:
+    return zlib.compress(body.encode('utf-8'), 9)
+
+
+def decompress_body(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
+
+
+class EmailArchive:
+    """
+    Booking emails without stored bodies
+
+    Emails queued since the mail queue store only their template ID,
+    template version and parameters, and are rendered when viewed. Legacy
+    db.emails records keep their text, compressed into body_z by a one-off
+    pass that a single worker runs under a lease in db.job_leases and marks
+    complete, so later startups skip it.
+    """
+
+    def __init__(self, db, mail_queue: MailQueue):
+        self.legacy = db.emails
+        self.queued = db.mail_queue
+        self.mail_queue = mail_queue
+        self.leases = db.job_leases
+        self._task = None
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self.compress_legacy())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _claim(self, owner: str) -> Optional[Dict]:
+        now = datetime.now(timezone.utc)
+        try:
+            return await self.leases.find_one_and_update(
+                {
+                    '_id': LEASE_ID,
+                    'completed_at': {'$exists': False},
+                    '$or': [{'lease_until': {'$exists': False}}, {'lease_until': {'$lt': now}}]
+                },
+                {'$set': {'lease_until': now + LEASE, 'lease_owner': owner}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker holds the lease, or the pass has already completed
+            return None
+
+    async def _renew(self, owner: str) -> bool:
+        renewed = await self.leases.update_one(
+            {'_id': LEASE_ID, 'lease_owner': owner},
+            {'$set': {'lease_until': datetime.now(timezone.utc) + LEASE}}
+        )
+        return renewed.modified_count == 1
+
+    async def compress_legacy(self) -> int:
+        """Replace legacy plain-text bodies with compressed ones; returns the number compressed"""
+        owner = uuid.uuid4().hex
+        compressed = 0
+        try:
+            if not await self._claim(owner):
+                return 0
+            while True:
+                emails = await self.legacy.find(
+                    {"body": {"$exists": True}},
+                    {"_id": 1, "body": 1}
+                ).to_list(COMPRESS_BATCH_SIZE)
+                if not emails:
+                    await self.leases.update_one(
+                        {'_id': LEASE_ID, 'lease_owner': owner},
+                        {'$set': {'completed_at': datetime.now(timezone.utc)}}
+                    )
+                    break
+                await self.legacy.bulk_write([
+                    UpdateOne(
+                        {"_id": email["_id"]},
+                        {"$set": {"body_z": compress_body(email["body"] or '')}, "$unset": {"body": ""}}
+                    )
+                    for email in emails
+                ], ordered=False)
+                compressed += len(emails)
+                if not await self._renew(owner):
+                    logger.warning("Legacy email compression lease lost; stopping")
+                    break
+        except Exception as e:
+            logger.error(f"Legacy email compression stopped: {e}")
+        finally:
+            try:
+                await self.leases.update_one(
+                    {'_id': LEASE_ID, 'lease_owner': owner},
+                    {'$unset': {'lease_until': '', 'lease_owner': ''}}
+                )
+            except Exception as e:
+                logger.error(f"Legacy email compression lease release error: {e}")
+        if compressed:
+            logger.info(f"Compressed {compressed} legacy email bodies")
+        return compressed
+
+    async def summaries(self, query: Dict) -> List[Dict]:
+        """Emails matching query without bodies or parameters (for booking lookups)"""
+        projection = {"_id": 0, **{field: 1 for field in SUMMARY_FIELDS}}
+        emails = await self.legacy.find(query, projection).to_list(10)
+        queued = await self.queued.find(
+            {**query, "category": "booking"},
+            projection
+        ).sort("created_at", 1).to_list(10)
+        return emails + queued
+
+    async def view(self, query: Dict) -> List[Dict]:
+        """
+        Emails matching query with their bodies rendered or decompressed
+
+        An email that fails to render (e.g. its parameters no longer fit the
+        template) is listed with its stored subject, no body and a
+        render_error, rather than failing the whole listing.
+        """
+        emails = await self.legacy.find(query, {"_id": 0}).to_list(10)
+        for email in emails:
+            if "body_z" in email:
+                email["body"] = decompress_body(email.pop("body_z"))
+
+        queued = await self.queued.find(
+            {**query, "category": "booking"},
+            {"_id": 0}
+        ).sort("created_at", 1).to_list(10)
+        for email in queued:
+            try:
+                content = self.mail_queue.content(email)
+            except Exception as e:
+                logger.error(f"Email {email.get('id')} could not be rendered: {e}")
+                content = {"subject": email.get("subject"), "html_body": None, "plain_body": None}
+                email["render_error"] = str(e)
+            for key in ("params", "html_body", "plain_body"):
+                email.pop(key, None)
+            email["subject"] = content["subject"]
+            email["body"] = content["plain_body"] or content["html_body"]
+            if email.get("template"):
+                # Differs from template_version if the template changed after the email was sent
+                email["rendered_version"] = self.mail_queue.templates.version(email["template"])
+        return emails + queued
+
@@ -0,0 +1,131 @@
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+from markupsafe import Markup, escape
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).parent / 'email_templates'
+
+# Template ID -> subject and body files. Bump the version when a template changes
+# in a way that matters for messages rendered from stored parameters.
+TEMPLATES = {
+    'booking_customer': {
+        'version': 1,
+        'subject': 'Flight380 - Booking Confirmation - PNR: {{ pnr }}',
+        'plain': 'booking_customer.txt'
+    },
+    'booking_agent': {
+        'version': 1,
+        'subject': "New Booking - PNR: {{ pnr }} - {{ flight['from'] }} to {{ flight['to'] }}",
+        'plain': 'booking_agent.txt'
+    },
+    'contact_company': {
+        'version': 1,
+        'subject': '[Flight380 Contact] {{ subject }} - {{ first_name }} {{ last_name }}',
+        'html': 'contact_company.html'
+    },
+    'contact_customer': {
+        'version': 1,
+        'subject': 'Thank you for contacting Flight380',
+        'html': 'contact_customer.html'
+    },
+    'password_reset': {
+        'version': 1,
+        'subject': 'Flight380 - Password Reset Request',
+        'html': 'password_reset.html',
+        'plain': 'password_reset.txt'
+    }
+}
+
+
+def _date(value: Optional[str]) -> str:
+    return value[:10] if value else 'N/A'
+
+
+def _clock(value: Optional[str]) -> str:
+    return value[11:16] if value else 'N/A'
+
+
+def _duration(value: Optional[str]) -> str:
+    return value.replace('PT', '').replace('H', 'h ').replace('M', 'm') if value else 'N/A'
+
+
+def _stops(is_direct: bool, stops: Optional[int]) -> str:
+    return 'Direct' if is_direct else f"{stops or 0} stop(s)"
+
+
+def _timestamp(value: Optional[str]) -> str:
+    try:
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S UTC')
+    except (TypeError, ValueError):
+        return 'N/A'
+
+
+def _nl2br(value: Optional[str]) -> Markup:
+    return Markup('<br>').join(escape(value or '').split('\n'))
+
+
+class EmailTemplates:
+    """
+    Email templates compiled once and rendered from stored parameters
+
+    HTML templates are autoescaped, so customer input (e.g. contact form
+    messages) can't inject markup into outgoing emails. Subjects and plain
+    text bodies are not.
+    """
+
+    def __init__(self, directory: Path = TEMPLATE_DIR):
+        self.env = Environment(
+            loader=FileSystemLoader(str(directory)),
+            # Subjects are compiled from strings and stay unescaped - they aren't HTML
+            autoescape=select_autoescape(['html'], default_for_string=False),
+            trim_blocks=True,
+            lstrip_blocks=True
+        )
+        self.env.filters.update({
+            'date': _date,
+            'clock': _clock,
+            'duration': _duration,
+            'stops': _stops,
+            'timestamp': _timestamp,
+            'nl2br': _nl2br
+        })
+        self._compiled: Dict[str, Dict[str, Template]] = {}
+
+    def load(self) -> int:
+        """Compile every template; returns the number of templates loaded"""
+        for template_id, spec in TEMPLATES.items():
+            compiled = {'subject': self.env.from_string(spec['subject'])}
+            for part in ('html', 'plain'):
+                if spec.get(part):
+                    compiled[part] = self.env.get_template(spec[part])
+            self._compiled[template_id] = compiled
+        logger.info(f"Loaded {len(self._compiled)} email templates")
+        return len(self._compiled)
+
+    def version(self, template_id: str) -> int:
+        return TEMPLATES[template_id]['version']
+
+    def subject(self, template_id: str, params: Dict) -> str:
+        if not self._compiled:
+            self.load()
+        return self._compiled[template_id]['subject'].render(params).strip()
+
+    def render(self, template_id: str, params: Dict) -> Dict:
+        """
+        Render a template
+
+        Returns:
+            {'subject', 'html_body', 'plain_body'} - a missing part is None
+        """
+        if not self._compiled:
+            self.load()
+        compiled = self._compiled[template_id]
+        return {
+            'subject': self.subject(template_id, params),
+            'html_body': compiled['html'].render(params) if 'html' in compiled else None,
+            'plain_body': compiled['plain'].render(params) if 'plain' in compiled else None
+        }
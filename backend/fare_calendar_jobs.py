@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are kept this long so identical requests and late subscribers reuse them
+JOB_RETENTION_SECONDS = 300
+
+# emit(date, price, (origin, destination)) - the route is only needed for group calendars
+Emit = Callable[[str, float, Optional[Tuple[str, str]]], None]
+
+
+class FareCalendarJobs:
+    """
+    Background fare calendar builds with progressive updates
+
+    A job is keyed by its route variant (routes, trip type, duration, start
+    date); starting a job that is already running or recently finished
+    returns the existing one. Subscribers get a snapshot of the prices found
+    so far followed by one event per date as lookups complete. Jobs are
+    in-process, so subscribers must reach the worker that started the job.
+    """
+
+    def __init__(self, retention_seconds: int = JOB_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, Dict] = {}
+        self._by_key: Dict[Hashable, str] = {}
+        # Running builds, held so they aren't garbage collected mid-run
+        self._tasks = set()
+        self.stats = {
+            'started': 0,
+            'deduplicated': 0,
+            'completed': 0,
+            'failed': 0
+        }
+
+    def start(self, key: Hashable, build: Callable[[Emit], Awaitable[Dict]]) -> Tuple[Dict, bool]:
+        """
+        Start a job, or join the identical one already running
+
+        Args:
+            key: Route variant identifying identical jobs
+            build: Coroutine function doing the work; it reports prices through
+                   the emit callback and returns extra fields for the final result
+
+        Returns:
+            (job, deduplicated)
+        """
+        self._prune()
+        job_id = self._by_key.get(key)
+        if job_id in self.jobs:
+            self.stats['deduplicated'] += 1
+            return self.jobs[job_id], True
+
+        job = {
+            'id': str(uuid.uuid4()),
+            'status': 'running',
+            'fares': {},
+            'airports': {},
+            'result': {},
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'finished_at': None,
+            '_finished': None,
+            '_subscribers': set()
+        }
+        self.jobs[job['id']] = job
+        self._by_key[key] = job['id']
+        self.stats['started'] += 1
+        task = asyncio.create_task(self._run(job, build))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    def snapshot(self, job: Dict) -> Dict:
+        """Public view of a job: everything found so far"""
+        return {
+            'job_id': job['id'],
+            'status': job['status'],
+            'data': dict(job['fares']),
+            'airports': dict(job['airports']),
+            'count': len(job['fares']),
+            'created_at': job['created_at'],
+            'finished_at': job['finished_at'],
+            **job['result']
+        }
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict]:
+        """
+        Snapshot, then one 'fare' event per improved date, then 'done'
+
+        Subscribers to a finished job get the snapshot and 'done' straight
+        away; the status on 'done' tells a complete job from a failed one.
+        """
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        # Subscribe before taking the snapshot so no update falls in between
+        queue: asyncio.Queue = asyncio.Queue()
+        job['_subscribers'].add(queue)
+        try:
+            yield {'type': 'snapshot', **self.snapshot(job)}
+            if job['status'] != 'running':
+                yield {'type': 'done', **self.snapshot(job)}
+                return
+            while True:
+                event = await queue.get()
+                yield event
+                if event['type'] == 'done':
+                    return
+        finally:
+            job['_subscribers'].discard(queue)
+
+    def _emit(self, job: Dict, date: str, price: float, route: Optional[Tuple[str, str]] = None):
+        # Group calendars keep the cheapest price per date across routes
+        if date in job['fares'] and job['fares'][date] <= price:
+            return
+        job['fares'][date] = price
+        event = {'type': 'fare', 'date': date, 'price': price}
+        if route:
+            job['airports'][date] = {'origin': route[0], 'destination': route[1]}
+            event.update(job['airports'][date])
+        for queue in job['_subscribers']:
+            queue.put_nowait(event)
+
+    async def _run(self, job: Dict, build: Callable[[Emit], Awaitable[Dict]]):
+        try:
+            job['result'] = await build(lambda date, price, route=None: self._emit(job, date, price, route)) or {}
+            job['status'] = 'complete'
+            self.stats['completed'] += 1
+        except Exception as e:
+            logger.error(f"Fare calendar job {job['id']} failed: {e}")
+            job['status'] = 'failed'
+            self.stats['failed'] += 1
+        finally:
+            job['finished_at'] = datetime.now(timezone.utc).isoformat()
+            job['_finished'] = time.monotonic()
+            done = {'type': 'done', **self.snapshot(job)}
+            for queue in job['_subscribers']:
+                queue.put_nowait(done)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.retention_seconds
+        expired = [job_id for job_id, job in self.jobs.items() if job['_finished'] and job['_finished'] < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+        for key in [k for k, job_id in self._by_key.items() if job_id not in self.jobs]:
+            del self._by_key[key]
+
+    def get_stats(self) -> Dict:
+        running = sum(1 for job in self.jobs.values() if job['status'] == 'running')
+        return {**self.stats, 'running': running, 'retained': len(self.jobs)}
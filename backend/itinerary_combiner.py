@@ -0,0 +1,163 @@
+import heapq
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Tuple
+
+# Minimum time between arriving on one leg and departing on the next
+MIN_LEG_GAP_MINUTES = 120
+# Cap on heap pops so heavily infeasible inputs can't run away
+MAX_EXPANSIONS = 20000
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _itinerary_arrival(flight: Dict) -> Optional[datetime]:
+    """Final arrival of a leg's flight (return arrival if it is a round trip offer)"""
+    return _parse_time(flight.get('return_arrival_time') or flight.get('arrival_time', ''))
+
+
+def prune_infeasible(legs: List[List[Dict]], min_gap: timedelta) -> List[List[Dict]]:
+    """
+    Drop flights that cannot connect to any flight on the neighbouring legs
+
+    A forward pass removes flights departing before the earliest possible
+    arrival of the previous leg plus the gap; a backward pass removes flights
+    arriving too late to catch the latest departure of the next leg.
+    """
+    legs = [[f for f in leg if _parse_time(f.get('departure_time', '')) and _itinerary_arrival(f)] for leg in legs]
+
+    for i in range(1, len(legs)):
+        if not legs[i - 1]:
+            break
+        earliest = min(_itinerary_arrival(f) for f in legs[i - 1]) + min_gap
+        legs[i] = [f for f in legs[i] if _parse_time(f['departure_time']) >= earliest]
+
+    for i in range(len(legs) - 2, -1, -1):
+        if not legs[i + 1]:
+            break
+        latest = max(_parse_time(f['departure_time']) for f in legs[i + 1]) - min_gap
+        legs[i] = [f for f in legs[i] if _itinerary_arrival(f) <= latest]
+
+    return legs
+
+
+def combine_itineraries(
+    legs: List[List[Dict]],
+    k: int = 20,
+    min_gap_minutes: int = MIN_LEG_GAP_MINUTES,
+    max_expansions: int = MAX_EXPANSIONS
+) -> List[Dict]:
+    """
+    Build the K cheapest feasible multi-city itineraries
+
+    Uses a lazy k-best merge over per-leg flight lists sorted by price: the
+    heap starts at the cheapest flight on every leg and each pop expands only
+    its successors, so the full cross product is never materialised.
+    Combinations where a leg departs before the previous one has arrived
+    (plus min_gap_minutes) are skipped.
+
+    Args:
+        legs: One list of formatted flights per leg
+        k: Number of itineraries to return
+        min_gap_minutes: Minimum time between consecutive legs
+        max_expansions: Upper bound on heap pops
+
+    Returns:
+        List of itineraries ranked by total price
+    """
+    if not legs or any(not leg for leg in legs):
+        return []
+
+    min_gap = timedelta(minutes=min_gap_minutes)
+    legs = [sorted(leg, key=lambda f: f.get('price', float('inf'))) for leg in prune_infeasible(legs, min_gap)]
+    if any(not leg for leg in legs):
+        return []
+
+    # Pre-parse times once; the heap loop only compares datetimes
+    departures = [[_parse_time(f['departure_time']) for f in leg] for leg in legs]
+    arrivals = [[_itinerary_arrival(f) for f in leg] for leg in legs]
+    prices = [[f.get('price', float('inf')) for f in leg] for leg in legs]
+
+    def feasible(indices: Tuple[int, ...]) -> bool:
+        for leg in range(len(indices) - 1):
+            if departures[leg + 1][indices[leg + 1]] < arrivals[leg][indices[leg]] + min_gap:
+                return False
+        return True
+
+    # Heap entries: (total price, indices, first position allowed to advance).
+    # Only advancing positions >= that one generates every combination exactly once.
+    start = tuple(0 for _ in legs)
+    heap = [(sum(p[0] for p in prices), start, 0)]
+    itineraries = []
+    expansions = 0
+
+    while heap and len(itineraries) < k and expansions < max_expansions:
+        total, indices, pivot = heapq.heappop(heap)
+        expansions += 1
+
+        if feasible(indices):
+            itineraries.append({
+                'id': '-'.join(str(legs[leg][i].get('id')) for leg, i in enumerate(indices)),
+                'total_price': round(total, 2),
+                'currency': legs[0][indices[0]].get('currency', 'GBP'),
+                'legs': [legs[leg][i] for leg, i in enumerate(indices)]
+            })
+
+        for position in range(pivot, len(indices)):
+            next_index = indices[position] + 1
+            if next_index < len(legs[position]):
+                successor = indices[:position] + (next_index,) + indices[position + 1:]
+                next_total = total - prices[position][indices[position]] + prices[position][next_index]
+                heapq.heappush(heap, (next_total, successor, position))
+
+    return itineraries
+
+
+# Fields of the return ticket copied onto the return_* keys of a split-ticket offer
+RETURN_FIELDS = (
+    'departure_time', 'arrival_time', 'duration', 'stops', 'layovers', 'total_layover_minutes',
+    'layover_display', 'segments', 'is_direct', 'airline', 'airline_code'
+)
+
+
+def combine_split_tickets(
+    outbound: List[Dict],
+    inbound: List[Dict],
+    k: int = 10,
+    min_gap_minutes: int = MIN_LEG_GAP_MINUTES
+) -> List[Dict]:
+    """
+    Pair one-way outbound and return flights into the K cheapest round trips
+
+    The result has the same shape as a formatted round-trip offer so it can be
+    ranked alongside them, labelled with split_ticket and the two offers that
+    have to be ticketed separately.
+    """
+    offers = []
+    for itinerary in combine_itineraries([outbound, inbound], k=k, min_gap_minutes=min_gap_minutes):
+        out_flight, return_flight = itinerary['legs']
+        offer = {key: value for key, value in out_flight.items() if not key.startswith('return_')}
+        for field in RETURN_FIELDS:
+            offer[f'return_{field}'] = return_flight.get(field)
+        offer.update({
+            'id': f"split-{out_flight.get('id')}-{return_flight.get('id')}",
+            'price': itinerary['total_price'],
+            'number_of_bookable_seats': min(
+                out_flight.get('number_of_bookable_seats', 0),
+                return_flight.get('number_of_bookable_seats', 0)
+            ),
+            'split_ticket': True,
+            'fare_type': 'SPLIT_TICKET',
+            'fare_label': 'Two one-way tickets',
+            'tickets': [
+                {'direction': 'outbound', 'price': out_flight.get('price'), 'raw_data': out_flight.get('raw_data')},
+                {'direction': 'return', 'price': return_flight.get('price'), 'raw_data': return_flight.get('raw_data')}
+            ]
+        })
+        offers.append(offer)
+    return offers
+
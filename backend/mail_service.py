@@ -0,0 +1,374 @@
+import asyncio
+import logging
+import random
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from typing import Optional, Dict, List, Tuple
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from email_templates import EmailTemplates
+
+logger = logging.getLogger(__name__)
+
+# Authenticated connections kept open; also the number of queue workers
+POOL_SIZE = 3
+# Connections idle longer than this are checked with NOOP before reuse...
+IDLE_CHECK_SECONDS = 30
+# ...and closed past this, before the server drops them
+MAX_IDLE_SECONDS = 240
+
+# Delivery attempts before a message is marked FAILED, and the retry backoff
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+# How often idle workers look for due retries
+POLL_SECONDS = 5
+# A message claimed (SENDING) for longer than this belonged to a worker that died
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# Such claims are released by one sweep per queue, this often
+RELEASE_STALE_SECONDS = CLAIM_TIMEOUT.total_seconds() / 2
+
+
+class SMTPConnectionPool:
+    """
+    Bounded pool of persistent, authenticated SMTP connections
+
+    STARTTLS and login happen once per connection instead of once per
+    message. Thread-safe: send() is called from worker threads.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str = '',
+        password: str = '',
+        starttls: bool = True,
+        size: int = POOL_SIZE,
+        timeout: float = 30
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'messages_sent': 0,
+            'send_errors': 0
+        }
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        with self._lock:
+            self.stats['connections_opened'] += 1
+        return connection
+
+    @staticmethod
+    def _close(connection: smtplib.SMTP):
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+            idle = time.monotonic() - last_used
+            if idle > MAX_IDLE_SECONDS:
+                self._close(connection)
+                continue
+            if idle > IDLE_CHECK_SECONDS:
+                try:
+                    if connection.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected()
+                except Exception:
+                    connection.close()
+                    continue
+            with self._lock:
+                self.stats['connections_reused'] += 1
+            return connection
+        return self._connect()
+
+    def send(self, message: MIMEMultipart):
+        """Send a message on a pooled connection (blocking - run in a thread)"""
+        with self._slots:
+            connection = self._checkout()
+            try:
+                try:
+                    connection.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    # The server dropped a pooled connection - retry once on a fresh one
+                    connection.close()
+                    connection = self._connect()
+                    connection.send_message(message)
+            except smtplib.SMTPResponseException:
+                # The server refused this message; the session itself is still usable
+                self._release(connection)
+                with self._lock:
+                    self.stats['send_errors'] += 1
+                raise
+            except Exception:
+                connection.close()
+                with self._lock:
+                    self.stats['send_errors'] += 1
+                raise
+            self._release(connection)
+            with self._lock:
+                self.stats['messages_sent'] += 1
+
+    def _release(self, connection: smtplib.SMTP):
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {**self.stats, 'idle_connections': len(self._idle)}
+
+
+def build_message(sender: str, to_email: str, subject: str, html_body: Optional[str], plain_body: Optional[str] = None) -> MIMEMultipart:
+    msg = MIMEMultipart('alternative')
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    if plain_body:
+        msg.attach(MIMEText(plain_body, 'plain'))
+    if html_body:
+        msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+
+class MailQueue:
+    """
+    Durable outbound mail queue backed by the mail_queue collection
+
+    Endpoints enqueue and return immediately; workers claim due messages,
+    deliver them through the connection pool and retry failures with
+    exponential backoff. Messages survive restarts, and claims left behind
+    by a dead worker are released after CLAIM_TIMEOUT. Messages store only
+    the template, its parameters and the subject; bodies are rendered by
+    the worker at delivery time.
+    """
+
+    def __init__(self, db, pool: SMTPConnectionPool, sender: str, templates: EmailTemplates, workers: int = POOL_SIZE):
+        self.collection = db.mail_queue
+        self.pool = pool
+        self.sender = sender
+        self.templates = templates
+        self.workers = workers
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._releaser: Optional[asyncio.Task] = None
+
+    def template_message(
+        self,
+        to_email: str,
+        template_id: str,
+        params: Dict,
+        category: str = 'general',
+        reference: Optional[str] = None,
+        message_id: Optional[str] = None,
+        **fields
+    ) -> Dict:
+        """
+        Queue document for a message rendered from a template by the worker
+
+        Only the subject is rendered now, so listings can show it without
+        rendering the bodies.
+        """
+        return self._document(
+            to_email,
+            {
+                "template": template_id,
+                "template_version": self.templates.version(template_id),
+                "params": params,
+                "subject": self.templates.subject(template_id, params)
+            },
+            category, reference, message_id, fields
+        )
+
+    @staticmethod
+    def _document(
+        to_email: str,
+        content: Dict,
+        category: str,
+        reference: Optional[str],
+        message_id: Optional[str],
+        fields: Dict
+    ) -> Dict:
+        now = datetime.now(timezone.utc).isoformat()
+        return {
+            **fields,
+            **content,
+            "id": message_id or str(uuid.uuid4()),
+            "to": to_email,
+            "category": category,
+            "reference": reference,
+            "status": "PENDING",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now
+        }
+
+    async def enqueue_template(
+        self,
+        to_email: str,
+        template_id: str,
+        params: Dict,
+        category: str = 'general',
+        reference: Optional[str] = None
+    ) -> str:
+        """Queue a template message; returns the queued message ID"""
+        message = self.template_message(to_email, template_id, params, category, reference)
+        await self.collection.insert_one(message)
+        self._wakeup.set()
+        return message['id']
+
+    async def enqueue_many(self, messages: List[Dict]) -> int:
+        """
+        Queue a batch of documents built with template_message()
+
+        Messages whose ID is already queued are skipped (unique index from
+        db_indexes), so relaying the same batch twice (e.g. after a crash)
+        doesn't send anything twice.
+
+        Returns:
+            Number of newly queued messages
+        """
+        if not messages:
+            return 0
+        try:
+            result = await self.collection.insert_many(messages, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+            inserted = e.details.get('nInserted', 0)
+        self._wakeup.set()
+        return inserted
+
+    async def start(self):
+        if self._tasks:
+            return
+        await self.release_stale_claims()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._releaser = asyncio.create_task(self._release_stale_claims_periodically())
+        logger.info(f"Mail queue started with {self.workers} workers")
+
+    async def stop(self):
+        tasks = self._tasks + ([self._releaser] if self._releaser else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._releaser = None
+
+    async def _claim(self) -> Optional[Dict]:
+        now = datetime.now(timezone.utc).isoformat()
+        return await self.collection.find_one_and_update(
+            {"status": "PENDING", "next_attempt_at": {"$lte": now}},
+            {"$set": {"status": "SENDING", "claimed_at": now}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def release_stale_claims(self):
+        cutoff = (datetime.now(timezone.utc) - CLAIM_TIMEOUT).isoformat()
+        result = await self.collection.update_many(
+            {"status": "SENDING", "claimed_at": {"$lt": cutoff}},
+            {"$set": {"status": "PENDING"}}
+        )
+        if result.modified_count:
+            logger.warning(f"Released {result.modified_count} stale mail claims")
+
+    async def _release_stale_claims_periodically(self):
+        while True:
+            await asyncio.sleep(RELEASE_STALE_SECONDS)
+            try:
+                await self.release_stale_claims()
+            except Exception as e:
+                logger.error(f"Mail claim release error: {e}")
+
+    async def _worker(self):
+        while True:
+            try:
+                # Cleared before claiming so an enqueue during the claim isn't missed
+                self._wakeup.clear()
+                message = await self._claim()
+                if message:
+                    await self._deliver(message)
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mail worker error: {e}")
+                await asyncio.sleep(POLL_SECONDS)
+
+    def content(self, message: Dict) -> Dict:
+        """Subject and bodies of a queued message (pre-rendered ones were queued before templates)"""
+        if message.get('template'):
+            return self.templates.render(message['template'], message['params'])
+        return {key: message.get(key) for key in ('subject', 'html_body', 'plain_body')}
+
+    def _send(self, message: Dict):
+        content = self.content(message)
+        self.pool.send(build_message(self.sender, message['to'], content['subject'],
+                                     content['html_body'], content['plain_body']))
+
+    async def _deliver(self, message: Dict):
+        try:
+            # Rendering and sending both happen off the event loop
+            await asyncio.to_thread(self._send, message)
+        except Exception as e:
+            attempts = message['attempts']
+            if attempts >= MAX_ATTEMPTS:
+                update = {"status": "FAILED"}
+                logger.error(f"Email {message['id']} to {message['to']} failed permanently: {e}")
+            else:
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+                retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                update = {"status": "PENDING", "next_attempt_at": retry_at.isoformat()}
+                logger.warning(f"Email {message['id']} to {message['to']} failed (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+            await self.collection.update_one({"id": message['id']}, {"$set": {**update, "last_error": str(e)}})
+            return
+
+        await self.collection.update_one(
+            {"id": message['id']},
+            {"$set": {"status": "SENT", "sent_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        logger.info(f"Email sent successfully to {message['to']}")
+
+    async def get_stats(self) -> Dict:
+        counts = {}
+        for status in ("PENDING", "SENDING", "SENT", "FAILED"):
+            counts[status.lower()] = await self.collection.count_documents({"status": status})
+        return {'queue': counts, 'workers': len(self._tasks), 'pool': self.pool.get_stats()}
+
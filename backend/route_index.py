@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A pair must come back empty for this many different departure dates, with no
+# offers in between, before it is pruned - one sold-out date says little
+EMPTY_DATES_THRESHOLD = 3
+# Larger parties can come back empty for lack of seats, so only their offers count
+EMPTY_MAX_PASSENGERS = 2
+# Pairs that once had offers are only pruned after this long without any
+OFFER_EXPIRY = timedelta(days=90)
+# Known-empty pairs are searched again after this long...
+REVISIT_INTERVAL = timedelta(days=7)
+# ...or at random with this probability, so new routes are discovered sooner
+REVISIT_PROBABILITY = 0.05
+# How often the in-memory view is reloaded from MongoDB (shared across workers)
+REFRESH_INTERVAL = timedelta(minutes=15)
+
+
+class RouteIndex:
+    """
+    Learned index of which origin/destination pairs produce flight offers
+
+    Every Amadeus search records whether the pair returned offers, per
+    cabin and non-stop flag. Group searches consult the index and skip pairs
+    that have come back empty on several departure dates, revisiting them
+    occasionally in case service has started. Outcomes are written as
+    atomic $max/$addToSet updates, so workers recording the same pair
+    don't overwrite each other.
+    """
+
+    def __init__(self, db):
+        self.collection = db.route_index
+        self.routes: Dict[str, Dict] = {}
+        self.loaded_at: Optional[datetime] = None
+        self._refresh_lock = asyncio.Lock()
+        self._saves: Set[asyncio.Task] = set()
+        self.stats = {
+            'pairs_checked': 0,
+            'pairs_searched': 0,
+            'pairs_pruned': 0,
+            'revisits': 0
+        }
+
+    @staticmethod
+    def route_key(origin: str, destination: str, non_stop: bool = False, cabin: str = 'ECONOMY') -> str:
+        key = f"{origin.upper()}-{destination.upper()}"
+        if cabin.upper() != 'ECONOMY':
+            key = f"{key}:{cabin.lower()}"
+        return f"{key}:direct" if non_stop else key
+
+    async def refresh(self, force: bool = False):
+        """Reload the index from MongoDB if it is older than REFRESH_INTERVAL"""
+        now = datetime.now(timezone.utc)
+        if not force and self.loaded_at and now - self.loaded_at < REFRESH_INTERVAL:
+            return
+        async with self._refresh_lock:
+            if not force and self.loaded_at and now - self.loaded_at < REFRESH_INTERVAL:
+                return
+            try:
+                docs = await self.collection.find({}, {"_id": 0}).to_list(None)
+                self.routes = {doc['route_key']: doc for doc in docs}
+                self.loaded_at = now
+                logger.info(f"Route index loaded: {len(self.routes)} routes")
+            except Exception as e:
+                logger.error(f"Route index refresh error: {e}")
+
+    def is_known_empty(self, route: Optional[Dict]) -> bool:
+        if not route or len(route.get('empty_dates', [])) < EMPTY_DATES_THRESHOLD:
+            return False
+        last_offer_at = route.get('last_offer_at')
+        if not last_offer_at:
+            return True
+        return datetime.now(timezone.utc) - datetime.fromisoformat(last_offer_at) > OFFER_EXPIRY
+
+    def should_search(self, origin: str, destination: str, non_stop: bool = False, cabin: str = 'ECONOMY') -> bool:
+        """Decide whether a pair in a group search is worth an Amadeus call"""
+        self.stats['pairs_checked'] += 1
+        route = self.routes.get(self.route_key(origin, destination, non_stop, cabin))
+        if not self.is_known_empty(route):
+            self.stats['pairs_searched'] += 1
+            return True
+
+        last_checked = datetime.fromisoformat(route['last_checked'])
+        if datetime.now(timezone.utc) - last_checked >= REVISIT_INTERVAL or random.random() < REVISIT_PROBABILITY:
+            self.stats['revisits'] += 1
+            self.stats['pairs_searched'] += 1
+            return True
+
+        self.stats['pairs_pruned'] += 1
+        return False
+
+    def filter_pairs(
+        self,
+        pairs: List[Tuple[str, str]],
+        non_stop: bool = False,
+        cabin: str = 'ECONOMY'
+    ) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        Split a group search's pairs into (to_search, pruned)
+
+        Single-pair searches are never pruned - the user asked for that route.
+        If every pair would be pruned, the whole set is searched instead.
+        """
+        if len(pairs) <= 1:
+            return pairs, []
+        to_search = [p for p in pairs if self.should_search(p[0], p[1], non_stop, cabin)]
+        if not to_search:
+            return pairs, []
+        pruned = [p for p in pairs if p not in to_search]
+        return to_search, pruned
+
+    def record(
+        self,
+        origin: str,
+        destination: str,
+        offer_count: int,
+        non_stop: bool = False,
+        cabin: str = 'ECONOMY',
+        departure_date: Optional[str] = None,
+        passengers: int = 1
+    ):
+        """Record the outcome of a successful search (call only when Amadeus answered)"""
+        if offer_count <= 0 and (not departure_date or passengers > EMPTY_MAX_PASSENGERS):
+            return
+        key = self.route_key(origin, destination, non_stop, cabin)
+        now = datetime.now(timezone.utc).isoformat()
+        route = self.routes.setdefault(key, {
+            'route_key': key,
+            'origin': origin.upper(),
+            'destination': destination.upper(),
+            'non_stop': non_stop,
+            'cabin': cabin.upper(),
+            'has_offers': False,
+            'empty_dates': []
+        })
+        route['last_checked'] = max(route.get('last_checked', ''), now)
+        update = {
+            '$max': {'last_checked': now},
+            '$setOnInsert': {k: route[k] for k in ('origin', 'destination', 'non_stop', 'cabin')}
+        }
+        if offer_count > 0:
+            route.update(has_offers=True, last_offer_at=now, empty_dates=[])
+            update['$max']['last_offer_at'] = now
+            update['$set'] = {'has_offers': True, 'empty_dates': []}
+        else:
+            if departure_date not in route.setdefault('empty_dates', []):
+                route['empty_dates'].append(departure_date)
+            update['$addToSet'] = {'empty_dates': departure_date}
+            update['$setOnInsert']['has_offers'] = False
+
+        # Keep a reference so the write isn't garbage-collected before it finishes
+        task = asyncio.create_task(self._save(key, update))
+        self._saves.add(task)
+        task.add_done_callback(self._saves.discard)
+
+    async def _save(self, key: str, update: Dict):
+        try:
+            await self.collection.update_one({"route_key": key}, update, upsert=True)
+        except Exception as e:
+            logger.error(f"Route index save error: {e}")
+
+    def get_stats(self) -> Dict:
+        """Pruning counters plus the size of the learned index"""
+        known_empty = sum(1 for r in self.routes.values() if self.is_known_empty(r))
+        checked = self.stats['pairs_checked']
+        return {
+            **self.stats,
+            'prune_rate': round(self.stats['pairs_pruned'] / checked, 4) if checked else 0.0,
+            'routes_known': len(self.routes),
+            'routes_with_offers': sum(1 for r in self.routes.values() if r.get('has_offers')),
+            'routes_known_empty': known_empty,
+            'loaded_at': self.loaded_at.isoformat() if self.loaded_at else None
+        }
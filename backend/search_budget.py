@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Time budget for a whole search request, and how many upstream searches it runs at once
+SEARCH_DEADLINE_SECONDS = float(os.environ.get('SEARCH_DEADLINE_SECONDS', '20'))
+SEARCH_CONCURRENCY = 4
+
+
+def search_deadline(requested_seconds: Optional[float]) -> float:
+    """Absolute time.monotonic() deadline; clients may only shorten the default budget"""
+    budget = SEARCH_DEADLINE_SECONDS
+    if requested_seconds and requested_seconds > 0:
+        budget = min(budget, requested_seconds)
+    return time.monotonic() + budget
+
+
+async def run_searches_with_deadline(searches: Dict[Any, Any], deadline: float) -> tuple:
+    """
+    Run upstream searches concurrently until the deadline
+
+    Searches still running at the deadline are not cancelled - they finish in
+    the background so their outcome reaches the search cache and route index -
+    but their results are left out of this response. Searches still queued
+    for a slot at the deadline are never started.
+
+    Args:
+        searches: {key: coroutine}, results are returned in the same order
+
+    Returns:
+        ({key: result} for finished searches, [keys that timed out])
+    """
+    semaphore = asyncio.Semaphore(SEARCH_CONCURRENCY)
+    not_started = object()
+
+    async def limited(coro):
+        async with semaphore:
+            if time.monotonic() >= deadline:
+                coro.close()
+                return not_started
+            return await coro
+
+    tasks = {key: asyncio.ensure_future(limited(coro)) for key, coro in searches.items()}
+    if tasks:
+        try:
+            await asyncio.wait(tasks.values(), timeout=max(0, deadline - time.monotonic()))
+        except asyncio.CancelledError:
+            # The request itself was cancelled (client went away) - stop everything it started
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+    results = {}
+    timed_out = []
+    for key, task in tasks.items():
+        if not task.done():
+            timed_out.append(key)
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        elif task.exception():
+            logger.warning(f"Search failed for {key}: {task.exception()}")
+        elif task.result() is not_started:
+            # Got a slot only after the deadline
+            timed_out.append(key)
+        else:
+            results[key] = task.result()
+    return results, timed_out
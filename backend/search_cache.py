@@ -0,0 +1,150 @@
+import copy
+import threading
+import time
+from typing import Optional, Dict, Any, Set, Tuple
+
+# Negative results (searches that told us nothing bookable) and how long to trust them, in seconds.
+# Keys are 'NO_OFFERS' or the HTTP status Amadeus answered with. Anything not listed is not cached.
+NEGATIVE_TTLS = {
+    'NO_OFFERS': 600,   # Route/date has no availability right now - may change as inventory opens
+    400: 3600,          # Invalid location/date/parameters - the same request will fail again
+    404: 3600,          # Unknown resource/location
+    422: 3600,          # Unprocessable search
+}
+
+# After its TTL a negative entry is still served, flagged stale, for this much longer
+# while one background search revalidates it
+NEGATIVE_STALE_GRACE = {
+    'NO_OFFERS': 1800,
+    400: 3600,
+    404: 3600,
+    422: 3600,
+}
+
+# Params that don't change whether a search is empty
+IGNORED_PARAMS = ('max',)
+
+MAX_ENTRIES = 10000
+
+
+class SearchCache:
+    """
+    Short-TTL in-process cache for Amadeus flight offer searches
+
+    Thread-safe, since some Amadeus calls run in executor threads. Holds
+    negative entries ("no offers", 4xx errors) so repeated searches and
+    flexible-date fan-out don't pay again for an answer we already have.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple, Tuple[float, float, Any]] = {}
+        self._refreshing: Set[Tuple] = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            'negative_hits': 0,      # upstream calls avoided
+            'stale_hits': 0,         # ...of which served past their TTL while revalidating
+            'negative_stores': 0,
+            'refreshes': 0,
+            'evictions': 0
+        }
+
+    @staticmethod
+    def make_key(search_params: Dict) -> Tuple:
+        return tuple(sorted(
+            (k, str(v).upper()) for k, v in search_params.items() if k not in IGNORED_PARAMS
+        ))
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Fresh value for key (stale entries are a miss here)"""
+        entry = self.get_entry(key)
+        if entry is None or entry[1]:
+            return None
+        return entry[0]
+
+    def get_entry(self, key: Tuple) -> Optional[Tuple[Any, bool]]:
+        """(value, stale) for key, or None once it is past its grace window"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            expires_at, stale_until, value = entry
+            now = time.monotonic()
+            if stale_until <= now:
+                del self._entries[key]
+                return None
+            return value, expires_at <= now
+
+    def set(self, key: Tuple, value: Any, ttl: float, grace: float = 0):
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._evict()
+            expires_at = time.monotonic() + ttl
+            self._entries[key] = (expires_at, expires_at + grace, value)
+
+    def delete(self, key: Tuple):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def begin_refresh(self, key: Tuple) -> bool:
+        """Claim the single background refresh of a stale entry"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.stats['refreshes'] += 1
+            return True
+
+    def end_refresh(self, key: Tuple):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _evict(self):
+        """Drop entries past their grace window, or the oldest one if there are none (lock held)"""
+        now = time.monotonic()
+        expired = [k for k, (_, stale_until, _) in self._entries.items() if stale_until <= now]
+        for k in expired:
+            del self._entries[k]
+        if not expired:
+            del self._entries[next(iter(self._entries))]
+        self.stats['evictions'] += len(expired) or 1
+
+    def get_negative(self, search_params: Dict) -> Optional[Dict]:
+        """
+        Return a cached negative result for these search params, if any
+
+        Entries past their TTL but within the grace window come back with
+        negative_cache['stale'] set; the caller should revalidate them.
+        """
+        entry = self.get_entry(self.make_key(search_params))
+        if entry is None:
+            return None
+        result, stale = entry
+        with self._lock:
+            self.stats['negative_hits'] += 1
+            if stale:
+                self.stats['stale_hits'] += 1
+        result = copy.deepcopy(result)
+        result['negative_cache']['stale'] = stale
+        return result
+
+    def store_negative(self, search_params: Dict, result: Dict) -> bool:
+        """Cache a result if it is a negative outcome with a configured TTL"""
+        if result.get('success'):
+            reason = 'NO_OFFERS' if not result.get('data') else None
+        else:
+            reason = result.get('error', {}).get('code')
+        ttl = NEGATIVE_TTLS.get(reason)
+        if not ttl:
+            return False
+
+        cached = dict(result)
+        cached['negative_cache'] = {'reason': reason, 'ttl': ttl}
+        self.set(self.make_key(search_params), cached, ttl, NEGATIVE_STALE_GRACE.get(reason, 0))
+        with self._lock:
+            self.stats['negative_stores'] += 1
+        return True
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {**self.stats, 'entries': len(self._entries), 'refreshing': len(self._refreshing)}
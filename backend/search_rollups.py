@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+HOURLY_COLLECTION = 'flight_search_rollups_hourly'
+DAILY_COLLECTION = 'flight_search_rollups_daily'
+STATE_ID = 'flight_searches'
+
+# How often the rollup job runs
+ROLLUP_INTERVAL_SECONDS = 300
+# An hour is rolled up once it ended this long ago (buffered analytics writes land late)
+SETTLE_TIME = timedelta(minutes=5)
+# Hours before the watermark rolled up again on each run, for events that reached
+# MongoDB late (the analytics buffer keeps failed batches for a later flush)
+REROLL_WINDOW = timedelta(hours=2)
+# Raw events and hourly rollups older than this are deleted once rolled up; daily rollups are kept
+RAW_RETENTION = timedelta(days=30)
+HOURLY_RETENTION = timedelta(days=90)
+# A run claimed by a worker longer ago than this is assumed dead
+LEASE = timedelta(minutes=10)
+
+
+def _utcnow() -> datetime:
+    # Search events store naive UTC timestamps, and motor returns dates naive
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _truncate(field: str, hour: bool) -> Dict:
+    parts = {
+        'year': {'$year': field},
+        'month': {'$month': field},
+        'day': {'$dayOfMonth': field}
+    }
+    if hour:
+        parts['hour'] = {'$hour': field}
+    return {'$dateFromParts': parts}
+
+
+# "LHR-DXB" for searches, "LHR-DXB-BKK-LHR" for multi-city legs
+ROUTE = {'$cond': [
+    {'$isArray': '$legs'},
+    {'$reduce': {
+        'input': '$legs',
+        'initialValue': {'$arrayElemAt': ['$legs.origin', 0]},
+        'in': {'$concat': ['$$value', '-', '$$this.destination']}
+    }},
+    {'$concat': [{'$ifNull': ['$origin', '?']}, '-', {'$ifNull': ['$destination', '?']}]}
+]}
+SEARCH_TYPE = {'$ifNull': ['$type', {'$cond': [{'$ifNull': ['$return_date', False]}, 'round-trip', 'one-way']}]}
+
+
+def _rollup_stages(period: str, key: Dict, searches, results, into: str) -> List[Dict]:
+    return [
+        {'$group': {'_id': key, 'searches': {'$sum': searches}, 'results': {'$sum': results}}},
+        {'$addFields': {
+            period: f'$_id.{period}',
+            'route': '$_id.route',
+            'type': '$_id.type',
+            'passengers': '$_id.passengers'
+        }},
+        {'$merge': {'into': into, 'whenMatched': 'replace', 'whenNotMatched': 'insert'}}
+    ]
+
+
+class SearchRollups:
+    """
+    Hourly and daily aggregates of flight_searches
+
+    Each run claims a lease, rolls up the settled hours after the stored
+    watermark - plus the REROLL_WINDOW before it, to count late events -
+    into the hourly collection, recomputes the days those hours touch from
+    the hourly rollups, advances the watermark and then deletes raw events
+    past retention - never ones that haven't been rolled up. Rollups are
+    keyed by period, route, search type and passenger count, and $merge
+    replaces them, so a run repeated after a crash is harmless. The lease
+    records its owner, so a run that overran it can't release (or move the
+    watermark under) another worker's run.
+    """
+
+    def __init__(self, db):
+        self.raw = db.flight_searches
+        self.hourly = db[HOURLY_COLLECTION]
+        self.daily = db[DAILY_COLLECTION]
+        self.state = db.rollup_state
+        self._task = None
+        self.stats = {
+            'runs': 0,
+            'hours_rolled': 0,
+            'raw_deleted': 0,
+            'last_run_ms': None
+        }
+
+    async def _claim(self, now: datetime, owner: str) -> Optional[Dict]:
+        try:
+            return await self.state.find_one_and_update(
+                {'_id': STATE_ID, '$or': [{'lease_until': {'$exists': False}}, {'lease_until': {'$lt': now}}]},
+                {'$set': {'lease_until': now + LEASE, 'lease_owner': owner}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker holds the lease
+            return None
+
+    async def run_once(self) -> int:
+        """
+        Roll up everything settled since the last run
+
+        Returns:
+            Number of hours rolled up
+        """
+        now = _utcnow()
+        owner = uuid.uuid4().hex
+        state = await self._claim(now, owner)
+        if state is None:
+            return 0
+
+        started = time.perf_counter()
+        hours = 0
+        try:
+            end = (now - SETTLE_TIME).replace(minute=0, second=0, microsecond=0)
+            rolled_through = state.get('rolled_through')
+            if rolled_through is None:
+                first = await self.raw.find({}, {'timestamp': 1}).sort('timestamp', 1).to_list(1)
+                rolled_through = start = first[0]['timestamp'].replace(minute=0, second=0, microsecond=0) if first else end
+            else:
+                start = rolled_through - REROLL_WINDOW
+
+            if rolled_through < end:
+                key = {'hour': _truncate('$timestamp', hour=True), 'route': ROUTE, 'type': SEARCH_TYPE, 'passengers': '$passengers'}
+                await self.raw.aggregate(
+                    [{'$match': {'timestamp': {'$gte': start, '$lt': end}}}]
+                    + _rollup_stages('hour', key, 1, '$results_count', HOURLY_COLLECTION)
+                ).to_list(None)
+
+                # Whole days are recomputed from their hours, so a day rolled up in parts adds up
+                day_start = start.replace(hour=0)
+                key = {'day': _truncate('$hour', hour=False), 'route': '$route', 'type': '$type', 'passengers': '$passengers'}
+                await self.hourly.aggregate(
+                    [{'$match': {'hour': {'$gte': day_start, '$lt': end}}}]
+                    + _rollup_stages('day', key, '$searches', '$results', DAILY_COLLECTION)
+                ).to_list(None)
+
+                moved = await self.state.update_one(
+                    {'_id': STATE_ID, 'lease_owner': owner},
+                    {'$set': {'rolled_through': end}}
+                )
+                if not moved.modified_count:
+                    logger.warning("Search rollup lease lost mid-run; leaving the watermark to its new owner")
+                    return 0
+                hours = int((end - rolled_through).total_seconds() // 3600)
+
+            # Retention - only behind the watermark and the window rolled up again
+            raw_cutoff = min(end - REROLL_WINDOW, now - RAW_RETENTION)
+            deleted = await self.raw.delete_many({'timestamp': {'$lt': raw_cutoff}})
+            await self.hourly.delete_many({'hour': {'$lt': now - HOURLY_RETENTION}})
+
+            self.stats['runs'] += 1
+            self.stats['hours_rolled'] += hours
+            self.stats['raw_deleted'] += deleted.deleted_count
+            self.stats['last_run_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            if hours:
+                logger.info(f"Rolled up {hours}h of flight searches, deleted {deleted.deleted_count} raw events")
+            return hours
+        finally:
+            await self.state.update_one(
+                {'_id': STATE_ID, 'lease_owner': owner},
+                {'$unset': {'lease_until': '', 'lease_owner': ''}}
+            )
+
+    async def summary(self, days: int = 30, top: int = 10) -> Dict:
+        """Search totals, daily series and top routes for the last `days` days, from daily rollups"""
+        since = _utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+
+        def by(field: str, sort: Dict, limit: Optional[int] = None) -> List[Dict]:
+            stages = [{'$group': {'_id': field, 'searches': {'$sum': '$searches'}, 'results': {'$sum': '$results'}}}, {'$sort': sort}]
+            return stages + ([{'$limit': limit}] if limit else [])
+
+        facets = await self.daily.aggregate([
+            {'$match': {'day': {'$gte': since}}},
+            {'$facet': {
+                'totals': by(None, {'_id': 1}),
+                'by_day': by('$day', {'_id': 1}),
+                'top_routes': by('$route', {'searches': -1}, top),
+                'by_type': by('$type', {'searches': -1}),
+                'by_passengers': by('$passengers', {'_id': 1})
+            }}
+        ]).to_list(1)
+        facets = facets[0] if facets else {}
+        state = await self.state.find_one({'_id': STATE_ID}, {'rolled_through': 1}) or {}
+
+        def rows(name: str, key: str) -> List[Dict]:
+            return [
+                {key: row['_id'].isoformat()[:10] if isinstance(row['_id'], datetime) else row['_id'],
+                 'searches': row['searches'], 'results': row['results']}
+                for row in facets.get(name, [])
+            ]
+
+        totals = facets.get('totals') or [{'searches': 0, 'results': 0}]
+        return {
+            'since': since.isoformat()[:10],
+            'rolled_through': state['rolled_through'].isoformat() if state.get('rolled_through') else None,
+            'searches': totals[0]['searches'],
+            'results': totals[0]['results'],
+            'by_day': rows('by_day', 'day'),
+            'top_routes': rows('top_routes', 'route'),
+            'by_type': rows('by_type', 'type'),
+            'by_passengers': rows('by_passengers', 'passengers')
+        }
+
+    async def _scheduler(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Search rollup error: {e}")
+            await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._scheduler())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
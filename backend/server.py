@@ -1,21 +1,39 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Cookie, Depends
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import json
 import logging
 import random
 import string
-import smtplib
 import asyncio
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Set
 import uuid
 from datetime import datetime, timezone, timedelta
 from amadeus_service import AmadeusService
+from airport_index import AirportIndex
+from route_index import RouteIndex
+from itinerary_combiner import combine_itineraries, combine_split_tickets, MIN_LEG_GAP_MINUTES
+from singleflight import SingleFlight, run_until_disconnected, disconnect_stats
+from search_budget import search_deadline, run_searches_with_deadline
+from airline_filter import parse_airline_filter, airline_search_kwargs, flight_matches_airlines, invalid_airline_response
+from fare_calendar_jobs import FareCalendarJobs
+from mail_service import SMTPConnectionPool, MailQueue
+from email_templates import EmailTemplates
+from booking_outbox import BookingOutbox, email_intents
+from email_archive import EmailArchive
+from db_indexes import ensure_indexes, check_hot_queries
+from session_cache import SessionCache
+from analytics_buffer import AnalyticsBuffer
+from search_rollups import SearchRollups
+from booking_pages import bookings_page
+from booking_export import FORMATS as EXPORT_FORMATS, export_query, export_bookings
+from pymongo.errors import DuplicateKeyError
 
 
 ROOT_DIR = Path(__file__).parent
@@ -29,6 +47,27 @@ db = client[os.environ['DB_NAME']]
 # Initialize Amadeus Service
 amadeus_service = AmadeusService()
 
+# Local airport/city index for autocomplete and code validation
+airport_index = AirportIndex()
+
+# Learned index of which airport pairs actually have offers
+route_index = RouteIndex(db)
+
+# Identical upstream searches in flight at the same time share one call
+upstream_calls = SingleFlight()
+
+# Background fare calendar builds streamed to clients as they progress
+fare_calendar_jobs = FareCalendarJobs()
+
+# Session -> user lookups for /auth/me, invalidated across workers
+session_cache = SessionCache(db)
+
+# Search analytics are written behind the response in batches
+search_analytics = AnalyticsBuffer(db.flight_searches)
+
+# Hourly/daily rollups of search analytics, and raw event retention
+search_rollups = SearchRollups(db)
+
 # SMTP Configuration
 SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.ionos.co.uk')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
@@ -36,6 +75,23 @@ SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'noreply@flight380.co.uk')
 COMPANY_EMAIL = os.environ.get('COMPANY_EMAIL', 'info@flight380.co.uk')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() != 'false'
+
+# Back-office endpoints (booking exports, analytics) - comma-separated emails of signed-in users allowed on them
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+async def require_admin(request: Request, session_token: Optional[str] = Cookie(None)) -> Dict:
+    """Dependency for back-office endpoints: 401 unless signed in, 403 unless listed in ADMIN_EMAILS"""
+    user = await get_current_user(request, session_token)
+    if (user.get("email") or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+# Outbound email goes through a durable queue delivered over pooled SMTP connections;
+# messages are rendered from templates compiled once at startup
+email_templates = EmailTemplates()
+smtp_pool = SMTPConnectionPool(SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, starttls=SMTP_STARTTLS)
+mail_queue = MailQueue(db, smtp_pool, SENDER_EMAIL, email_templates)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -73,7 +129,11 @@ class FlightSearchRequest(BaseModel):
     travel_class: str = 'ECONOMY'
     direct_flights: bool = False
     flexible_dates: bool = False
-    airline: Optional[str] = None
+    airline: Optional[str] = None  # IATA carrier code, or comma-separated codes
+    airlines: Optional[List[str]] = None  # Only these carriers
+    excluded_airlines: Optional[List[str]] = None  # Never these carriers
+    split_tickets: bool = False  # Also price the trip as two one-way tickets
+    deadline_seconds: Optional[float] = None  # Shorter time budget than the server default
 
 # Multi-City Search Models
 class MultiCityLeg(BaseModel):
@@ -92,6 +152,11 @@ class MultiCitySearchRequest(BaseModel):
     travel_class: str = 'ECONOMY'
     direct_flights: bool = False
     airline: Optional[str] = None
+    airlines: Optional[List[str]] = None
+    excluded_airlines: Optional[List[str]] = None
+    max_itineraries: int = 20  # Cheapest complete itineraries to build server-side
+    min_connection_minutes: int = MIN_LEG_GAP_MINUTES
+    deadline_seconds: Optional[float] = None
 
 class AirportSearchRequest(BaseModel):
     keyword: str
@@ -127,6 +192,9 @@ class BookingRequest(BaseModel):
     total_price: float
     currency: str = "GBP"
 
+class FlightPriceRequest(BaseModel):
+    flight_data: Dict[str, Any]
+
 class BookingResponse(BaseModel):
     success: bool
     booking_id: str
@@ -145,38 +213,6 @@ class ContactFormRequest(BaseModel):
     booking_reference: Optional[str] = None
     message: str
 
-# Email sending function using SMTP
-async def send_email_smtp(to_email: str, subject: str, html_body: str, plain_body: str = None):
-    """Send email using SMTP"""
-    try:
-        msg = MIMEMultipart('alternative')
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add plain text version
-        if plain_body:
-            part1 = MIMEText(plain_body, 'plain')
-            msg.attach(part1)
-        
-        # Add HTML version
-        part2 = MIMEText(html_body, 'html')
-        msg.attach(part2)
-        
-        # Send email in thread to avoid blocking
-        def send():
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-                server.starttls()
-                server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                server.send_message(msg)
-        
-        await asyncio.to_thread(send)
-        logger.info(f"Email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send email to {to_email}: {str(e)}")
-        return False
-
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -217,10 +253,103 @@ async def get_status_checks():
     
     return status_checks
 
+# Location validation - reject malformed location codes before spending Amadeus quota
+def invalid_location_response(checks: List[Dict]) -> Optional[Dict]:
+    """Build an error response if any resolved location list has invalid codes"""
+    invalid = []
+    suggestions = {}
+    for check in checks:
+        for code in check['invalid']:
+            if code not in invalid:
+                invalid.append(code)
+        suggestions.update(check['suggestions'])
+    
+    if not invalid:
+        return None
+    
+    return {
+        'success': False,
+        'error': {
+            'code': 'INVALID_LOCATION',
+            'message': f'Invalid airport or city code(s): {", ".join(invalid)}',
+            'invalid_codes': invalid,
+            'suggestions': suggestions
+        }
+    }
+
+def in_requested_airports(flight: Dict, origin_check: Dict, destination_check: Dict) -> bool:
+    """Whether a flight from the (origin, destination) search serves the requested airports"""
+    return flight.get('from') in origin_check['airports'] and flight.get('to') in destination_check['airports']
+
+def upstream_key(*parts, **params) -> tuple:
+    """Hashable key identifying an upstream search for SingleFlight"""
+    return parts + tuple(sorted(
+        (k, tuple(v) if isinstance(v, list) else v) for k, v in params.items()
+    ))
+
+# Split tickets - how many outbound/return pairings to merge into the results per route
+SPLIT_TICKET_TOP_K = 10
+
+async def search_round_trip_with_split_tickets(
+    origin: str,
+    destination: str,
+    departure_date: str,
+    return_date: str,
+    search_kwargs: Dict
+) -> tuple:
+    """
+    Run the round-trip search and both one-way searches concurrently
+
+    Returns:
+        (round_trip_result, split_ticket_offers) - takes as long as the slowest call
+    """
+    round_trip, outbound, inbound = await asyncio.gather(
+        asyncio.to_thread(amadeus_service._search_flights_sync, origin, destination, departure_date, return_date, **search_kwargs),
+        asyncio.to_thread(amadeus_service._search_flights_sync, origin, destination, departure_date, None, **search_kwargs),
+        asyncio.to_thread(amadeus_service._search_flights_sync, destination, origin, return_date, None, **search_kwargs)
+    )
+    split_offers = combine_split_tickets(
+        amadeus_service.format_flight_results(outbound),
+        amadeus_service.format_flight_results(inbound),
+        k=SPLIT_TICKET_TOP_K
+    )
+    return round_trip, split_offers
+
+def count_flights_by_airport(flights: List[Dict]) -> Dict[str, Dict[str, int]]:
+    """Split result counts back out per origin and destination airport"""
+    by_origin: Dict[str, int] = {}
+    by_destination: Dict[str, int] = {}
+    for flight in flights:
+        by_origin[flight.get('from')] = by_origin.get(flight.get('from'), 0) + 1
+        by_destination[flight.get('to')] = by_destination.get(flight.get('to'), 0) + 1
+    return {'origins': by_origin, 'destinations': by_destination}
+
+def record_route_results(
+    origin: str,
+    destination: str,
+    result: Dict,
+    flights: List[Dict],
+    non_stop: bool,
+    cabin: str,
+    departure_date: str,
+    passengers: int
+):
+    """Feed a search outcome into the route index (errors are not evidence either way)"""
+    if not result.get('success') or result.get('negative_cache'):
+        return
+    route_index.record(origin, destination, len(flights), non_stop, cabin, departure_date, passengers)
+    # City-code searches also reveal which individual airport pairs have service
+    for pair in {(f.get('from'), f.get('to')) for f in flights}:
+        if pair != (origin, destination) and all(pair):
+            route_index.record(pair[0], pair[1], 1, non_stop, cabin)
+
 # Flight Search Endpoints
 @api_router.post("/flights/search")
-async def search_flights(request: FlightSearchRequest):
+async def search_flights(request: FlightSearchRequest, http_request: Request):
     """Search for flights using Amadeus API"""
+    return await run_until_disconnected(http_request, _search_flights(request), 'search')
+
+async def _search_flights(request: FlightSearchRequest) -> Dict:
     try:
         # Map travel class to Amadeus format
         travel_class_map = {
@@ -235,59 +364,112 @@ async def search_flights(request: FlightSearchRequest):
         # Calculate total passengers
         total_adults = request.adults + request.youth  # Youth counted as adults in Amadeus
         
-        # Handle airport groups - search all airports in the group
-        origin_airports = request.origin_airports if request.origin_airports else [request.origin]
-        destination_airports = request.destination_airports if request.destination_airports else [request.destination]
+        # Handle airport groups - whole metro areas are searched with one city-code call
+        origin_check = airport_index.resolve_codes(
+            airport_index.group_airports(request.origin, request.origin_airports))
+        destination_check = airport_index.resolve_codes(
+            airport_index.group_airports(request.destination, request.destination_airports))
+        invalid_response = invalid_location_response([origin_check, destination_check])
+        if invalid_response:
+            return invalid_response
+        
+        airline_filter = parse_airline_filter(request.airline, request.airlines, request.excluded_airlines)
+        invalid_response = invalid_airline_response(airline_filter)
+        if invalid_response:
+            return invalid_response
+        airline_kwargs = airline_search_kwargs(airline_filter)
+        
+        origin_airports = origin_check['airports']
+        destination_airports = destination_check['airports']
         
         all_flights = []
         seen_flights = set()  # To avoid duplicates
         
+        # Skip pairs that have repeatedly returned nothing
+        await route_index.refresh()
+        pairs = [(o, d) for o in origin_check['codes'] for d in destination_check['codes']]
+        pairs, pruned_pairs = route_index.filter_pairs(pairs, request.direct_flights, amadeus_class)
+        
+        deadline = search_deadline(request.deadline_seconds)
+        search_kwargs = {
+            'adults': total_adults,
+            'children': request.children,
+            'infants': request.infants,
+            'travel_class': amadeus_class,
+            'non_stop': request.direct_flights,
+            **airline_kwargs
+        }
+        
+        async def search_pair(origin: str, destination: str) -> tuple:
+            key = upstream_key(
+                'search', origin, destination, request.departure_date, request.return_date,
+                request.flexible_dates, request.split_tickets, **search_kwargs
+            )
+            return await upstream_calls.run(key, lambda: search_pair_upstream(origin, destination))
+        
+        async def search_pair_upstream(origin: str, destination: str) -> tuple:
+            split_offers = []
+            if request.split_tickets and request.return_date and not request.flexible_dates:
+                result, split_offers = await search_round_trip_with_split_tickets(
+                    origin,
+                    destination,
+                    request.departure_date,
+                    request.return_date,
+                    search_kwargs
+                )
+            elif request.flexible_dates:
+                result = await amadeus_service.search_flights_flexible(
+                    origin=origin,
+                    destination=destination,
+                    departure_date=request.departure_date,
+                    return_date=request.return_date,
+                    deadline=deadline,
+                    **search_kwargs
+                )
+            else:
+                result = await asyncio.to_thread(
+                    amadeus_service._search_flights_sync,
+                    origin,
+                    destination,
+                    request.departure_date,
+                    request.return_date,
+                    **search_kwargs
+                )
+            formatted_flights = amadeus_service.format_flight_results(result)
+            # Recorded even when the pair finishes after the deadline
+            if not (airline_filter['included'] or airline_filter['excluded']):
+                record_route_results(origin, destination, result, formatted_flights, request.direct_flights,
+                                     amadeus_class, request.departure_date, total_adults + request.children)
+            return result, formatted_flights, split_offers
+        
         # Search for all origin-destination combinations
-        for origin in origin_airports:
-            for destination in destination_airports:
-                try:
-                    if request.flexible_dates:
-                        result = await amadeus_service.search_flights_flexible(
-                            origin=origin,
-                            destination=destination,
-                            departure_date=request.departure_date,
-                            return_date=request.return_date,
-                            adults=total_adults,
-                            children=request.children,
-                            infants=request.infants,
-                            travel_class=amadeus_class,
-                            non_stop=request.direct_flights
-                        )
-                    else:
-                        result = await amadeus_service.search_flights(
-                            origin=origin,
-                            destination=destination,
-                            departure_date=request.departure_date,
-                            return_date=request.return_date,
-                            adults=total_adults,
-                            children=request.children,
-                            infants=request.infants,
-                            travel_class=amadeus_class,
-                            non_stop=request.direct_flights
-                        )
-                    
-                    if result.get('success'):
-                        formatted_flights = amadeus_service.format_flight_results(result)
-                        for flight in formatted_flights:
-                            # Create a unique key to avoid duplicates
-                            flight_key = f"{flight.get('departure_time')}_{flight.get('arrival_time')}_{flight.get('from')}_{flight.get('to')}_{flight.get('price')}"
-                            if flight_key not in seen_flights:
-                                seen_flights.add(flight_key)
-                                all_flights.append(flight)
-                except Exception as search_error:
-                    logger.warning(f"Search failed for {origin}-{destination}: {str(search_error)}")
-                    continue
+        pair_results, timed_out_pairs = await run_searches_with_deadline(
+            {pair: search_pair(*pair) for pair in pairs}, deadline)
+        timed_out_dates = []
+        for (origin, destination), (result, formatted_flights, split_offers) in pair_results.items():
+            timed_out_dates.extend(
+                f"{origin}-{destination}:{date}" for date in result.get('meta', {}).get('timed_out_dates', []))
+            if result.get('success') or split_offers:
+                for flight in formatted_flights + split_offers:
+                    # City-code searches can return airports outside the requested group
+                    if not in_requested_airports(flight, origin_check, destination_check):
+                        continue
+                    if not airline_kwargs and not flight_matches_airlines(flight, airline_filter):
+                        continue
+                    # Create a unique key to avoid duplicates
+                    flight_key = f"{flight.get('departure_time')}_{flight.get('arrival_time')}_{flight.get('from')}_{flight.get('to')}_{flight.get('price')}"
+                    if flight_key not in seen_flights:
+                        seen_flights.add(flight_key)
+                        all_flights.append(flight)
+        partial = bool(timed_out_pairs or timed_out_dates)
+        if partial:
+            logger.warning(f"Search deadline reached: {len(timed_out_pairs)} pair(s), {len(timed_out_dates)} date(s) unfinished")
         
         if all_flights:
             # Sort all flights by price
             all_flights.sort(key=lambda x: x.get('price', float('inf')))
             
-            # Save search to database for analytics
+            # Buffer search for analytics - written in batches after the response
             search_record = {
                 'origin': request.origin,
                 'destination': request.destination,
@@ -299,18 +481,41 @@ async def search_flights(request: FlightSearchRequest):
                 'results_count': len(all_flights),
                 'timestamp': datetime.utcnow()
             }
-            await db.flight_searches.insert_one(search_record)
+            await search_analytics.add(search_record)
+            
+            # Keep fare calendars fresh from what this search already paid for
+            harvested = harvest_search_fares(request, all_flights)
+            if harvested:
+                task = asyncio.create_task(save_harvested_fares(harvested))
+                harvest_saves.add(task)
+                task.add_done_callback(harvest_saves.discard)
             
             return {
                 'success': True,
                 'flights': all_flights,
                 'count': len(all_flights),
-                'meta': {'searched_origins': origin_airports, 'searched_destinations': destination_airports}
+                'partial': partial,
+                'timed_out_pairs': [f"{o}-{d}" for o, d in timed_out_pairs],
+                'meta': {
+                    'timed_out_dates': timed_out_dates,
+                    'split_ticket_count': sum(1 for f in all_flights if f.get('split_ticket')),
+                    'searched_origins': origin_airports,
+                    'searched_destinations': destination_airports,
+                    'upstream_origins': origin_check['codes'],
+                    'upstream_destinations': destination_check['codes'],
+                    'results_by_airport': count_flights_by_airport(all_flights),
+                    'pruned_pairs': [f"{o}-{d}" for o, d in pruned_pairs]
+                }
             }
         else:
             return {
                 'success': False,
-                'error': {'message': 'No flights found for the selected airports'}
+                'partial': partial,
+                'timed_out_pairs': [f"{o}-{d}" for o, d in timed_out_pairs],
+                'error': {
+                    'message': 'Search timed out before any flights were found' if partial
+                    else 'No flights found for the selected airports'
+                }
             }
     
     except Exception as e:
@@ -323,8 +528,11 @@ async def search_flights(request: FlightSearchRequest):
         }
 
 @api_router.post("/flights/multi-city-search")
-async def search_multi_city_flights(request: MultiCitySearchRequest):
+async def search_multi_city_flights(request: MultiCitySearchRequest, http_request: Request):
     """Search for multi-city flights using Amadeus API"""
+    return await run_until_disconnected(http_request, _search_multi_city_flights(request), 'multi_city')
+
+async def _search_multi_city_flights(request: MultiCitySearchRequest) -> Dict:
     try:
         # Map travel class to Amadeus format
         travel_class_map = {
@@ -337,49 +545,96 @@ async def search_multi_city_flights(request: MultiCitySearchRequest):
         amadeus_class = travel_class_map.get(request.travel_class.lower(), 'ECONOMY')
         total_adults = request.adults + request.youth
         
+        # Validate every leg up front so one bad code doesn't waste the other legs' calls
+        leg_locations = []
+        for leg in request.legs:
+            origin_check = airport_index.resolve_codes(
+                airport_index.group_airports(leg.origin, leg.origin_airports))
+            destination_check = airport_index.resolve_codes(
+                airport_index.group_airports(leg.destination, leg.destination_airports))
+            leg_locations.append((origin_check, destination_check))
+        invalid_response = invalid_location_response([check for pair in leg_locations for check in pair])
+        if invalid_response:
+            return invalid_response
+        
+        airline_filter = parse_airline_filter(request.airline, request.airlines, request.excluded_airlines)
+        invalid_response = invalid_airline_response(airline_filter)
+        if invalid_response:
+            return invalid_response
+        airline_kwargs = airline_search_kwargs(airline_filter)
+        
         all_leg_flights = []
+        await route_index.refresh()
+        deadline = search_deadline(request.deadline_seconds)
+        
+        async def search_leg_pair(leg, origin: str, destination: str) -> tuple:
+            key = upstream_key(
+                'search', origin, destination, leg.departure_date, None, False, False,
+                adults=total_adults, children=request.children, infants=request.infants,
+                travel_class=amadeus_class, non_stop=request.direct_flights, **airline_kwargs
+            )
+            return await upstream_calls.run(key, lambda: search_leg_pair_upstream(leg, origin, destination))
+        
+        async def search_leg_pair_upstream(leg, origin: str, destination: str) -> tuple:
+            result = await asyncio.to_thread(
+                amadeus_service._search_flights_sync,
+                origin,
+                destination,
+                leg.departure_date,
+                None,  # One-way for each leg
+                adults=total_adults,
+                children=request.children,
+                infants=request.infants,
+                travel_class=amadeus_class,
+                non_stop=request.direct_flights,
+                **airline_kwargs
+            )
+            formatted_flights = amadeus_service.format_flight_results(result)
+            if not (airline_filter['included'] or airline_filter['excluded']):
+                record_route_results(origin, destination, result, formatted_flights, request.direct_flights,
+                                     amadeus_class, leg.departure_date, total_adults + request.children)
+            return result, formatted_flights
+        
+        # Search every leg's origin-destination combinations together under one deadline
+        searches = {}
+        for leg_index, leg in enumerate(request.legs):
+            origin_check, destination_check = leg_locations[leg_index]
+            pairs = [(o, d) for o in origin_check['codes'] for d in destination_check['codes']]
+            pairs, _ = route_index.filter_pairs(pairs, request.direct_flights, amadeus_class)
+            for origin, destination in pairs:
+                searches[(leg_index, origin, destination)] = search_leg_pair(leg, origin, destination)
+        pair_results, timed_out_pairs = await run_searches_with_deadline(searches, deadline)
         
-        # Search for each leg separately
         for leg_index, leg in enumerate(request.legs):
-            origin_airports = leg.origin_airports if leg.origin_airports else [leg.origin]
-            destination_airports = leg.destination_airports if leg.destination_airports else [leg.destination]
+            origin_check, destination_check = leg_locations[leg_index]
             
             leg_flights = []
             seen_flights = set()
             
-            # Search all origin-destination combinations for this leg
-            for origin in origin_airports:
-                for destination in destination_airports:
-                    try:
-                        result = await amadeus_service.search_flights(
-                            origin=origin,
-                            destination=destination,
-                            departure_date=leg.departure_date,
-                            return_date=None,  # One-way for each leg
-                            adults=total_adults,
-                            children=request.children,
-                            infants=request.infants,
-                            travel_class=amadeus_class,
-                            non_stop=request.direct_flights
-                        )
-                        
-                        if result.get('success'):
-                            formatted_flights = amadeus_service.format_flight_results(result)
-                            for flight in formatted_flights:
-                                flight_key = f"{flight.get('departure_time')}_{flight.get('arrival_time')}_{flight.get('from')}_{flight.get('to')}_{flight.get('price')}"
-                                if flight_key not in seen_flights:
-                                    seen_flights.add(flight_key)
-                                    flight['leg_index'] = leg_index
-                                    flight['leg_origin'] = leg.origin
-                                    flight['leg_destination'] = leg.destination
-                                    leg_flights.append(flight)
-                    except Exception as search_error:
-                        logger.warning(f"Multi-city search failed for leg {leg_index} ({origin}-{destination}): {str(search_error)}")
+            for (result_leg, origin, destination), (result, formatted_flights) in pair_results.items():
+                if result_leg != leg_index or not result.get('success'):
+                    continue
+                for flight in formatted_flights:
+                    if not in_requested_airports(flight, origin_check, destination_check):
+                        continue
+                    if not airline_kwargs and not flight_matches_airlines(flight, airline_filter):
                         continue
+                    flight_key = f"{flight.get('departure_time')}_{flight.get('arrival_time')}_{flight.get('from')}_{flight.get('to')}_{flight.get('price')}"
+                    if flight_key not in seen_flights:
+                        seen_flights.add(flight_key)
+                        # Results may be shared with other requests - annotate a copy
+                        leg_flights.append({
+                            **flight,
+                            'leg_index': leg_index,
+                            'leg_origin': leg.origin,
+                            'leg_destination': leg.destination
+                        })
             
             # Sort leg flights by price
             leg_flights.sort(key=lambda x: x.get('price', float('inf')))
             all_leg_flights.append(leg_flights)
+        partial = bool(timed_out_pairs)
+        timed_out_labels = [f"{i + 1}:{o}-{d}" for i, o, d in timed_out_pairs]
         
         # Check if we have flights for all legs
         if all(len(leg) > 0 for leg in all_leg_flights):
@@ -389,6 +644,13 @@ async def search_multi_city_flights(request: MultiCitySearchRequest):
                 for flight in leg_flights:
                     combined_flights.append(flight)
             
+            # Cheapest feasible complete itineraries (each leg departs after the previous arrives)
+            itineraries = combine_itineraries(
+                all_leg_flights,
+                k=max(1, min(request.max_itineraries, 100)),
+                min_gap_minutes=request.min_connection_minutes
+            )
+            
             # Save search record
             search_record = {
                 'type': 'multi-city',
@@ -397,13 +659,17 @@ async def search_multi_city_flights(request: MultiCitySearchRequest):
                 'results_count': len(combined_flights),
                 'timestamp': datetime.utcnow()
             }
-            await db.flight_searches.insert_one(search_record)
+            await search_analytics.add(search_record)
             
             return {
                 'success': True,
                 'flights': combined_flights,
                 'count': len(combined_flights),
+                'itineraries': itineraries,
+                'itineraries_count': len(itineraries),
                 'legs_count': len(request.legs),
+                'partial': partial,
+                'timed_out_pairs': timed_out_labels,
                 'meta': {
                     'type': 'multi-city',
                     'legs': [{'origin': leg.origin, 'destination': leg.destination} for leg in request.legs]
@@ -413,6 +679,8 @@ async def search_multi_city_flights(request: MultiCitySearchRequest):
             missing_legs = [i for i, leg in enumerate(all_leg_flights) if len(leg) == 0]
             return {
                 'success': False,
+                'partial': partial,
+                'timed_out_pairs': timed_out_labels,
                 'error': {'message': f'No flights found for leg(s): {", ".join([str(i+1) for i in missing_legs])}'}
             }
     
@@ -433,6 +701,15 @@ async def search_airports(keyword: str):
                 'error': 'Keyword must be at least 2 characters'
             }
         
+        # Serve from the local index; only unknown keywords cost an Amadeus call
+        local_results = airport_index.search(keyword)
+        if local_results:
+            return {
+                'success': True,
+                'data': local_results,
+                'meta': {'source': 'local'}
+            }
+        
         result = await amadeus_service.search_airports(keyword=keyword)
         return result
     
@@ -445,34 +722,131 @@ async def search_airports(keyword: str):
             }
         }
 
+@api_router.get("/flights/route-index/stats")
+async def get_route_index_stats():
+    """Pruning statistics for the learned route-existence index"""
+    await route_index.refresh()
+    return {
+        'success': True,
+        'stats': route_index.get_stats()
+    }
+
+@api_router.get("/flights/cancellations/stats")
+async def get_cancellation_stats():
+    """Requests abandoned by their clients and the upstream calls that were cancelled"""
+    return {
+        'success': True,
+        'stats': {
+            'disconnects': disconnect_stats,
+            'upstream': upstream_calls.get_stats()
+        }
+    }
+
+@api_router.get("/flights/analytics/buffer/stats")
+async def get_analytics_buffer_stats():
+    """Write-behind analytics buffer: events written, pending and dropped"""
+    return {
+        'success': True,
+        'stats': search_analytics.get_stats()
+    }
+
+@api_router.get("/admin/analytics/searches")
+async def get_search_analytics(days: int = 30, top: int = 10, admin: Dict = Depends(require_admin)):
+    """Search volume by day, route, search type and passenger count, served from the rollups"""
+    started = time.perf_counter()
+    summary = await search_rollups.summary(days=max(1, min(days, 366)), top=max(1, min(top, 100)))
+    return {
+        'success': True,
+        **summary,
+        'rollup_stats': search_rollups.get_stats(),
+        'query_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+@api_router.get("/flights/search-cache/stats")
+async def get_search_cache_stats():
+    """Search cache counters, including upstream calls avoided by negative entries"""
+    return {
+        'success': True,
+        'stats': amadeus_service.search_cache.get_stats()
+    }
+
+@api_router.get("/airports/groups")
+async def list_airport_groups():
+    """Server-side catalog of "Any <city> Airport" groups"""
+    return {
+        'success': True,
+        'groups': list(airport_index.groups.values())
+    }
+
 
 # Fare Calendar Endpoint with Caching
 class FareCalendarRequest(BaseModel):
     origin: str
     destination: str
+    origin_airports: Optional[List[str]] = None  # Airport groups - one calendar across the group
+    destination_airports: Optional[List[str]] = None
     departure_date: str
     one_way: bool = False
     duration: int = 7
 
 # Cache settings
 FARE_CACHE_TTL_HOURS = 6  # Cache fares for 6 hours
-
-async def get_cached_fares(origin: str, destination: str) -> Optional[Dict]:
-    """Check if we have valid cached fares for this route"""
+# A calendar whose sweep has expired is still served when live searches have
+# refreshed at least this many of its dates within the TTL...
+FARE_CACHE_MIN_FRESH_DATES = 30
+# ...but dates older than this are left out of it
+FARE_CACHE_MAX_AGE_HOURS = 24
+# Expired calendars younger than TTL + this are served flagged stale while one background sweep refreshes them
+FARE_CACHE_STALE_HOURS = 48
+# A refresh claimed by any worker longer ago than this is assumed dead and can be claimed again
+FARE_REFRESH_CLAIM_MINUTES = 5
+# Calendars nobody has searched or swept for this long are removed by the TTL index
+FARE_CACHE_RETENTION_DAYS = 7
+
+def fare_cache_key(origin: str, destination: str, one_way: bool = False, duration: int = 7) -> str:
+    # Round-trip prices depend on the stay, so each trip length has its own calendar
+    return f"{origin.upper()}_{destination.upper()}_{'OW' if one_way else f'RT{duration}'}"
+
+def fare_age_hours(timestamp) -> float:
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return (datetime.now(timezone.utc) - timestamp.replace(tzinfo=timezone.utc)).total_seconds() / 3600
+
+async def get_cached_fares(origin: str, destination: str, one_way: bool = False, duration: int = 7) -> Optional[Dict]:
+    """
+    Check if we have valid cached fares for this route
+    
+    Returns:
+        {'fares': {date: price}, 'stale': bool}, or None on a miss. Stale
+        calendars are past their TTL but within the grace window.
+    """
     try:
-        cache_key = f"{origin.upper()}_{destination.upper()}"
+        cache_key = fare_cache_key(origin, destination, one_way, duration)
         cached = await db.fare_cache.find_one({"cache_key": cache_key}, {"_id": 0})
         
         if cached:
+            today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
             cached_at = cached.get("cached_at")
-            if isinstance(cached_at, str):
-                cached_at = datetime.fromisoformat(cached_at.replace("Z", "+00:00"))
+            fare_times = cached.get("fare_times", {})
+            fares = {d: p for d, p in cached.get("fares", {}).items() if d >= today}
             
-            # Check if cache is still valid
-            cache_age = datetime.now(timezone.utc) - cached_at.replace(tzinfo=timezone.utc)
-            if cache_age.total_seconds() < FARE_CACHE_TTL_HOURS * 3600:
+            # Check if cache is still valid - a recent sweep, or dates kept fresh by live searches
+            if cached_at and fare_age_hours(cached_at) < FARE_CACHE_TTL_HOURS:
                 logger.info(f"Cache HIT for {cache_key}")
-                return cached.get("fares")
+                return {'fares': fares, 'stale': False}
+            fresh_dates = sum(1 for d in fares if d in fare_times and fare_age_hours(fare_times[d]) < FARE_CACHE_TTL_HOURS)
+            if fresh_dates >= FARE_CACHE_MIN_FRESH_DATES:
+                logger.info(f"Cache HIT for {cache_key} ({fresh_dates} dates refreshed by searches)")
+                return {
+                    'fares': {
+                        d: p for d, p in fares.items()
+                        if fare_age_hours(fare_times.get(d) or cached_at) < FARE_CACHE_MAX_AGE_HOURS
+                    },
+                    'stale': False
+                }
+            if cached_at and fares and fare_age_hours(cached_at) < FARE_CACHE_TTL_HOURS + FARE_CACHE_STALE_HOURS:
+                logger.info(f"Cache STALE for {cache_key}")
+                return {'fares': fares, 'stale': True}
         
         logger.info(f"Cache MISS for {cache_key}")
         return None
@@ -480,28 +854,370 @@ async def get_cached_fares(origin: str, destination: str) -> Optional[Dict]:
         logger.error(f"Cache lookup error: {e}")
         return None
 
-async def save_fares_to_cache(origin: str, destination: str, fares: Dict):
-    """Save fares to cache"""
+async def save_fares_to_cache(
+    origin: str,
+    destination: str,
+    fares: Dict,
+    one_way: bool = False,
+    duration: int = 7,
+    sweep: bool = True
+):
+    """
+    Save fares to cache
+    
+    Dates are written individually so a sweep doesn't erase fresher prices
+    harvested from live searches for the dates it didn't sample. Only a full
+    sweep (sweep=True) resets the calendar's cached_at.
+    """
     try:
-        cache_key = f"{origin.upper()}_{destination.upper()}"
+        cache_key = fare_cache_key(origin, destination, one_way, duration)
+        now = datetime.now(timezone.utc).isoformat()
+        
+        update = {
+            "cache_key": cache_key,
+            "origin": origin.upper(),
+            "destination": destination.upper(),
+            "one_way": one_way,
+            "duration": None if one_way else duration,
+            "updated_at": now
+        }
+        if sweep:
+            update["cached_at"] = now
+        update["expire_at"] = datetime.now(timezone.utc) + timedelta(days=FARE_CACHE_RETENTION_DAYS)
+        for date, price in fares.items():
+            update[f"fares.{date}"] = price
+            update[f"fare_times.{date}"] = now
         
         await db.fare_cache.update_one(
             {"cache_key": cache_key},
-            {
-                "$set": {
-                    "cache_key": cache_key,
-                    "origin": origin.upper(),
-                    "destination": destination.upper(),
-                    "fares": fares,
-                    "cached_at": datetime.now(timezone.utc).isoformat()
-                }
-            },
+            {"$set": update},
             upsert=True
         )
         logger.info(f"Fares cached for {cache_key}")
     except Exception as e:
         logger.error(f"Cache save error: {e}")
 
+def harvest_search_fares(request: FlightSearchRequest, flights: List[Dict]) -> Dict[tuple, Dict[str, float]]:
+    """
+    Cheapest per-adult price per route and departure date seen in a live search
+    
+    Only searches comparable with the calendar sweep (economy, adults only,
+    no carrier or direct-only restriction) are used. Prices are recorded per
+    airport pair and, for round trips, per stay length - a flight only
+    updates the calendar of its own trip length. Group calendars are
+    assembled from those.
+    
+    Returns:
+        {(origin, destination, one_way, stay_days): {date: price}}
+    """
+    if (request.children or request.infants or request.direct_flights
+            or request.airline or request.airlines or request.excluded_airlines
+            or request.travel_class.lower() != 'economy'):
+        return {}
+    adults = request.adults + request.youth
+    one_way = not request.return_date
+    
+    harvested: Dict[tuple, Dict[str, float]] = {}
+    for flight in flights:
+        if flight.get('split_ticket') or flight.get('currency', 'GBP') != 'GBP' or not flight.get('departure_time'):
+            continue
+        date = flight['departure_time'][:10]
+        price = round(flight.get('price', 0) / adults, 2)
+        if price <= 0:
+            continue
+        stay = None
+        if not one_way:
+            if not flight.get('return_departure_time'):
+                continue
+            stay = (datetime.fromisoformat(flight['return_departure_time'][:10]) - datetime.fromisoformat(date)).days
+        fares = harvested.setdefault((flight.get('from'), flight.get('to'), one_way, stay), {})
+        if date not in fares or price < fares[date]:
+            fares[date] = price
+    return harvested
+
+# Harvested fare writes still running, held so they aren't garbage collected mid-write
+harvest_saves: Set[asyncio.Task] = set()
+
+async def save_harvested_fares(harvested: Dict[tuple, Dict[str, float]]):
+    """Write-behind: runs after the search response, costs no Amadeus calls"""
+    for (origin, destination, one_way, stay), fares in harvested.items():
+        await save_fares_to_cache(origin, destination, fares, one_way=one_way, duration=stay, sweep=False)
+
+# Group calendars - most airport pairs built per request, and the time budget for all of them
+FARE_CALENDAR_MAX_ROUTES = 12
+FARE_CALENDAR_TIMEOUT_SECONDS = 30.0
+
+async def sweep_route_calendar(
+    origin: str,
+    destination: str,
+    request: FareCalendarRequest,
+    on_fare: Optional[Callable[[str, float], None]] = None
+) -> Optional[Dict]:
+    """
+    Build a route's calendar from Amadeus and cache it (None if Amadeus had nothing)
+
+    on_fare gets each date's price as it is found - only when this call starts
+    the sweep rather than joining one already in flight.
+    """
+    result = await upstream_calls.run(
+        upstream_key('fare-calendar', origin, destination, request.departure_date,
+                     request.one_way, request.duration),
+        lambda: amadeus_service.get_fare_calendar(
+            origin=origin,
+            destination=destination,
+            departure_date=request.departure_date,
+            one_way=request.one_way,
+            duration=request.duration,
+            currency='GBP',
+            on_fare=on_fare
+        )
+    )
+    if result.get('success') and result.get('data'):
+        await save_fares_to_cache(origin, destination, result['data'], request.one_way, request.duration)
+        return result['data']
+    return None
+
+# Stale calendar refreshes running in this worker, by fare cache key
+fare_refreshes: Dict[str, asyncio.Task] = {}
+
+def schedule_fare_refresh(origin: str, destination: str, request: FareCalendarRequest):
+    """Refresh a stale calendar in the background, at most once at a time per route"""
+    key = fare_cache_key(origin, destination, request.one_way, request.duration)
+    if key in fare_refreshes:
+        return
+    task = asyncio.create_task(refresh_stale_fares(origin, destination, request))
+    fare_refreshes[key] = task
+    task.add_done_callback(lambda _: fare_refreshes.pop(key, None))
+
+async def refresh_stale_fares(origin: str, destination: str, request: FareCalendarRequest):
+    """Background sweep for a stale calendar - only the worker that claims it runs it"""
+    now = datetime.now(timezone.utc)
+    claim = await db.fare_cache.update_one(
+        {
+            "cache_key": fare_cache_key(origin, destination, request.one_way, request.duration),
+            "$or": [
+                {"refresh_started_at": {"$exists": False}},
+                {"refresh_started_at": {"$lt": (now - timedelta(minutes=FARE_REFRESH_CLAIM_MINUTES)).isoformat()}}
+            ]
+        },
+        {"$set": {"refresh_started_at": now.isoformat()}}
+    )
+    if not claim.modified_count:
+        return
+    try:
+        await asyncio.wait_for(sweep_route_calendar(origin, destination, request), timeout=FARE_CALENDAR_TIMEOUT_SECONDS * 4)
+        logger.info(f"Stale fares refreshed for {origin}-{destination}")
+    except Exception as e:
+        logger.warning(f"Stale fare refresh failed for {origin}-{destination}: {e}")
+    finally:
+        await db.fare_cache.update_one(
+            {"cache_key": fare_cache_key(origin, destination, request.one_way, request.duration)},
+            {"$unset": {"refresh_started_at": ""}}
+        )
+
+async def build_route_calendar(origin: str, destination: str, request: FareCalendarRequest) -> tuple:
+    """
+    Calendar for one airport pair, from the cache or a fresh Amadeus sweep
+
+    Stale calendars are returned straight away and refreshed in the background.
+
+    Returns:
+        (fares or None, served_from_cache, stale)
+    """
+    cached = await get_cached_fares(origin, destination, request.one_way, request.duration)
+    if cached:
+        if cached['stale']:
+            schedule_fare_refresh(origin, destination, request)
+        return cached['fares'], True, cached['stale']
+    return await sweep_route_calendar(origin, destination, request), False, False
+
+def fare_calendar_routes(request: FareCalendarRequest) -> tuple:
+    """
+    Routes a calendar request covers
+    
+    Returns:
+        (routes, invalid_response) - several airport pairs for groups and
+        multi-airport cities, otherwise the single requested route
+    """
+    origin = request.origin.upper()
+    destination = request.destination.upper()
+    origin_check = airport_index.resolve_codes(
+        airport_index.group_airports(origin, request.origin_airports))
+    destination_check = airport_index.resolve_codes(
+        airport_index.group_airports(destination, request.destination_airports))
+    invalid_response = invalid_location_response([origin_check, destination_check])
+    if invalid_response:
+        return [], invalid_response
+    
+    routes = [(o, d) for o in origin_check['airports'] for d in destination_check['airports'] if o != d]
+    if len(routes) <= 1:
+        routes = [(origin, destination)]
+    return routes, None
+
+async def select_calendar_routes(routes: List[tuple]) -> tuple:
+    """Busiest FARE_CALENDAR_MAX_ROUTES pairs of a group, minus known-empty ones: (routes, pruned)"""
+    def traffic(code: str) -> float:
+        return airport_index.airports.get(code, {}).get('traffic', 0)
+    
+    routes = sorted(routes, key=lambda r: -(traffic(r[0]) + traffic(r[1])))[:FARE_CALENDAR_MAX_ROUTES]
+    await route_index.refresh()
+    return route_index.filter_pairs(routes)
+
+async def get_group_fare_calendar(request: FareCalendarRequest, routes: List[tuple]) -> Dict:
+    """
+    Cheapest fare per date across every airport pair of an airport-group calendar
+
+    Per-route calendars are built concurrently, reusing cached ones. Routes
+    still sweeping at the deadline finish in the background into the cache.
+    """
+    routes, pruned = await select_calendar_routes(routes)
+    
+    calendars, timed_out = await run_searches_with_deadline(
+        {route: build_route_calendar(route[0], route[1], request) for route in routes},
+        time.monotonic() + FARE_CALENDAR_TIMEOUT_SECONDS
+    )
+    
+    fares: Dict[str, float] = {}
+    airports: Dict[str, Dict[str, str]] = {}
+    for (origin, destination), (route_fares, _, _) in calendars.items():
+        for date, price in (route_fares or {}).items():
+            if date not in fares or price < fares[date]:
+                fares[date] = price
+                airports[date] = {'origin': origin, 'destination': destination}
+    
+    if not fares:
+        logger.warning(f"No fares for any route of {request.origin}-{request.destination}, using mock data")
+        return {
+            'success': True,
+            'data': generate_mock_fares(),
+            'currency': 'GBP',
+            'origin': request.origin.upper(),
+            'destination': request.destination.upper(),
+            'cached': False,
+            'mock': True
+        }
+    
+    return {
+        'success': True,
+        'data': fares,
+        'airports': airports,  # {date: {origin, destination}} - which pair has the cheapest fare
+        'currency': 'GBP',
+        'origin': request.origin.upper(),
+        'destination': request.destination.upper(),
+        'cached': all(from_cache for _, from_cache, _ in calendars.values()) and not timed_out,
+        'stale': any(stale for _, _, stale in calendars.values()),
+        'routes': [f"{o}-{d}" for o, d in calendars],
+        'partial': bool(timed_out),
+        'timed_out_routes': [f"{o}-{d}" for o, d in timed_out],
+        'pruned_routes': [f"{o}-{d}" for o, d in pruned]
+    }
+
+# Background jobs aren't tied to a client, but still shouldn't run forever
+FARE_CALENDAR_JOB_TIMEOUT_SECONDS = 180.0
+
+async def build_calendar_job(request: FareCalendarRequest, routes: List[tuple], emit: Callable) -> Dict:
+    """
+    Fare calendar job body: report every route's prices through emit as they arrive
+    
+    Cached routes report all their dates at once; the others report each date
+    as its Amadeus lookup completes and are saved to the cache when done.
+    """
+    group = len(routes) > 1
+    pruned = []
+    if group:
+        routes, pruned = await select_calendar_routes(routes)
+    
+    async def build_route(origin: str, destination: str) -> tuple:
+        route = (origin, destination) if group else None
+        cached = await get_cached_fares(origin, destination, request.one_way, request.duration)
+        if cached:
+            if cached['stale']:
+                schedule_fare_refresh(origin, destination, request)
+            for date, price in cached['fares'].items():
+                emit(date, price, route)
+            return True, cached['stale']
+        fares = await sweep_route_calendar(
+            origin, destination, request, on_fare=lambda date, price: emit(date, price, route))
+        # Joined sweeps don't report progress - catch up with the final calendar
+        for date, price in (fares or {}).items():
+            emit(date, price, route)
+        return False, False
+    
+    outcomes, timed_out = await run_searches_with_deadline(
+        {route: build_route(*route) for route in routes},
+        time.monotonic() + FARE_CALENDAR_JOB_TIMEOUT_SECONDS
+    )
+    return {
+        'currency': 'GBP',
+        'origin': request.origin.upper(),
+        'destination': request.destination.upper(),
+        'cached': all(cached for cached, _ in outcomes.values()) and not timed_out,
+        'stale': any(stale for _, stale in outcomes.values()),
+        'routes': [f"{o}-{d}" for o, d in outcomes],
+        'timed_out_routes': [f"{o}-{d}" for o, d in timed_out],
+        'pruned_routes': [f"{o}-{d}" for o, d in pruned]
+    }
+
+@api_router.post("/flights/fare-calendar/jobs")
+async def start_fare_calendar_job(request: FareCalendarRequest):
+    """
+    Start (or join) a background fare calendar build
+    
+    Returns the job with whatever is already known; follow progress at
+    /flights/fare-calendar/jobs/{job_id}/events (SSE) or poll the job.
+    """
+    try:
+        routes, invalid_response = fare_calendar_routes(request)
+        if invalid_response:
+            return invalid_response
+        
+        key = (tuple(routes), request.departure_date, request.one_way, request.duration)
+        job, deduplicated = fare_calendar_jobs.start(
+            key, lambda emit: build_calendar_job(request, routes, emit))
+        return {
+            'success': True,
+            'deduplicated': deduplicated,
+            **fare_calendar_jobs.snapshot(job)
+        }
+    except Exception as e:
+        logger.error(f"Fare calendar job error: {str(e)}")
+        return {
+            'success': False,
+            'error': {'message': str(e)}
+        }
+
+@api_router.get("/flights/fare-calendar/jobs/stats")
+async def get_fare_calendar_job_stats():
+    """Started, de-duplicated and running fare calendar jobs"""
+    return {'success': True, 'stats': fare_calendar_jobs.get_stats()}
+
+@api_router.get("/flights/fare-calendar/jobs/{job_id}")
+async def get_fare_calendar_job(job_id: str):
+    """Current state of a fare calendar job"""
+    job = fare_calendar_jobs.get(job_id)
+    if not job:
+        return {
+            'success': False,
+            'error': {'code': 'JOB_NOT_FOUND', 'message': 'Unknown or expired fare calendar job'}
+        }
+    return {'success': True, **fare_calendar_jobs.snapshot(job)}
+
+@api_router.get("/flights/fare-calendar/jobs/{job_id}/events")
+async def stream_fare_calendar_job(job_id: str):
+    """Server-sent events: snapshot, then a 'fare' event per date found, then 'done'"""
+    if not fare_calendar_jobs.get(job_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired fare calendar job")
+    
+    async def event_stream():
+        async for event in fare_calendar_jobs.events(job_id):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 def generate_mock_fares() -> Dict[str, int]:
     """Generate mock fare data for 6 months when API is unavailable"""
     mock_fares = {}
@@ -540,42 +1256,53 @@ def generate_mock_fares() -> Dict[str, int]:
     return mock_fares
 
 @api_router.post("/flights/fare-calendar")
-async def get_fare_calendar(request: FareCalendarRequest):
+async def get_fare_calendar(request: FareCalendarRequest, http_request: Request):
     """Get cheapest fares for a date range with caching"""
+    return await run_until_disconnected(http_request, _get_fare_calendar(request), 'fare_calendar')
+
+async def _get_fare_calendar(request: FareCalendarRequest) -> Dict:
     try:
         origin = request.origin.upper()
         destination = request.destination.upper()
         
-        # Check cache first
-        cached_fares = await get_cached_fares(origin, destination)
-        if cached_fares:
+        routes, invalid_response = fare_calendar_routes(request)
+        if invalid_response:
+            return invalid_response
+        
+        # Airport groups and multi-airport cities get one calendar across every pair
+        if len(routes) > 1:
+            return await get_group_fare_calendar(request, routes)
+        
+        # Check cache first - a stale calendar is served now and refreshed in the background
+        cached = await get_cached_fares(origin, destination, request.one_way, request.duration)
+        if cached:
+            if cached['stale']:
+                schedule_fare_refresh(origin, destination, request)
             return {
                 'success': True,
-                'data': cached_fares,
+                'data': cached['fares'],
                 'currency': 'GBP',
                 'origin': origin,
                 'destination': destination,
-                'cached': True
+                'cached': True,
+                'stale': cached['stale']
             }
         
-        # Try to get fares from Amadeus API with timeout
+        # Try to get fares from Amadeus API with timeout (saved to cache for future requests)
         try:
-            result = await asyncio.wait_for(
-                amadeus_service.get_fare_calendar(
-                    origin=origin,
-                    destination=destination,
-                    departure_date=request.departure_date,
-                    one_way=request.one_way,
-                    duration=request.duration,
-                    currency='GBP'
-                ),
-                timeout=30.0  # 30 second timeout
+            fares = await asyncio.wait_for(
+                sweep_route_calendar(origin, destination, request),
+                timeout=FARE_CALENDAR_TIMEOUT_SECONDS
             )
             
-            if result.get('success') and result.get('data'):
-                # Save to cache for future requests
-                await save_fares_to_cache(origin, destination, result['data'])
-                return result
+            if fares:
+                return {
+                    'success': True,
+                    'data': fares,
+                    'currency': 'GBP',
+                    'origin': origin,
+                    'destination': destination
+                }
         except asyncio.TimeoutError:
             logger.warning(f"Amadeus API timeout for {origin}-{destination}, using mock data")
         except Exception as api_error:
@@ -585,7 +1312,7 @@ async def get_fare_calendar(request: FareCalendarRequest):
         mock_fares = generate_mock_fares()
         
         # Cache the mock data too (but mark it as mock)
-        await save_fares_to_cache(origin, destination, mock_fares)
+        await save_fares_to_cache(origin, destination, mock_fares, request.one_way, request.duration)
         
         return {
             'success': True,
@@ -610,135 +1337,171 @@ async def get_fare_calendar(request: FareCalendarRequest):
 
 
 # Booking Endpoints
-def generate_pnr():
-    """Generate a 6-character PNR code"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-
-
-def create_email_content(booking_data: dict, recipient_type: str) -> dict:
-    """Create email content for booking confirmation"""
-    pnr = booking_data['pnr']
-    flight = booking_data['flight_data']
-    passengers = booking_data['passengers']
-    contact = booking_data['contact']
-    total_price = booking_data['total_price']
-    currency = booking_data.get('currency', 'GBP')
-    
-    # Build passenger list
-    passenger_list = "\n".join([
-        f"  - {p['title']} {p['first_name']} {p['last_name']} ({p['type']})"
-        for p in passengers
-    ])
-    
-    # Build flight details
-    outbound_info = f"""
-    From: {flight.get('from', 'N/A')} → To: {flight.get('to', 'N/A')}
-    Date: {flight.get('departure_time', 'N/A')[:10] if flight.get('departure_time') else 'N/A'}
-    Departure: {flight.get('departure_time', 'N/A')[11:16] if flight.get('departure_time') else 'N/A'}
-    Arrival: {flight.get('arrival_time', 'N/A')[11:16] if flight.get('arrival_time') else 'N/A'}
-    Duration: {flight.get('duration', 'N/A').replace('PT', '').replace('H', 'h ').replace('M', 'm')}
-    Airline: {flight.get('airline', 'N/A')} ({flight.get('airline_code', 'N/A')})
-    Stops: {'Direct' if flight.get('is_direct') else str(flight.get('stops', 0)) + ' stop(s)'}
-    """
-    
-    return_info = ""
-    if flight.get('return_departure_time'):
-        return_info = f"""
-    
-    RETURN FLIGHT:
-    From: {flight.get('to', 'N/A')} → To: {flight.get('from', 'N/A')}
-    Date: {flight.get('return_departure_time', 'N/A')[:10]}
-    Departure: {flight.get('return_departure_time', 'N/A')[11:16]}
-    Arrival: {flight.get('return_arrival_time', 'N/A')[11:16]}
-    Duration: {flight.get('return_duration', 'N/A').replace('PT', '').replace('H', 'h ').replace('M', 'm') if flight.get('return_duration') else 'N/A'}
-    Stops: {'Direct' if flight.get('return_is_direct') else str(flight.get('return_stops', 0)) + ' stop(s)'}
+# Price differences below this are rounding, not a fare change
+PRICE_CHANGE_TOLERANCE = 0.01
+# Development/offline setups may book flights marked mock: true without repricing
+ALLOW_MOCK_BOOKINGS = os.environ.get('ALLOW_MOCK_BOOKINGS', 'false').lower() == 'true'
+
+def is_mock_flight(flight_data: Dict) -> bool:
+    """Whether a flight is an explicitly mock one that may be booked unpriced"""
+    return ALLOW_MOCK_BOOKINGS and flight_data.get('mock') is True
+
+def offers_to_price(flight_data: Dict) -> List[Dict]:
+    """Raw Amadeus offers behind a selected flight (two for split tickets)"""
+    if flight_data.get('tickets'):
+        return [t['raw_data'] for t in flight_data['tickets'] if t.get('raw_data')]
+    if flight_data.get('raw_data'):
+        return [flight_data['raw_data']]
+    return []
+
+async def revalidate_flight_price(flight_data: Dict) -> Optional[Dict]:
     """
-    
-    if recipient_type == "customer":
-        subject = f"Flight380 - Booking Confirmation - PNR: {pnr}"
-        body = f"""
-Dear {passengers[0]['first_name']} {passengers[0]['last_name']},
-
-Thank you for booking with Flight380!
-
-Your booking has been confirmed. Please find your details below:
+    Reprice the selected flight with Amadeus before booking
 
-═══════════════════════════════════════════════════════════════
-BOOKING REFERENCE (PNR): {pnr}
-═══════════════════════════════════════════════════════════════
+    Returns:
+        None when the flight carries no Amadeus offer (nothing to reprice),
+        otherwise the pricing result
+    """
+    offers = offers_to_price(flight_data)
+    if not offers:
+        return None
+    return await amadeus_service.price_flight_offers(offers)
 
-FLIGHT DETAILS:
----------------
-OUTBOUND FLIGHT:{outbound_info}{return_info}
+def price_check_summary(pricing: Optional[Dict], quoted_price: Optional[float], mock: bool = False) -> Dict:
+    """
+    Compare a pricing result with the price the customer was shown
 
-PASSENGERS:
------------
-{passenger_list}
+    A flight without an Amadeus offer to reprice is only SKIPPED when it is a
+    mock flight; otherwise it is NOT_PRICEABLE and can't be booked, so
+    dropping raw_data from the request can't bypass the check.
+    """
+    if pricing is None:
+        return {'status': 'SKIPPED', 'reason': 'MOCK_FLIGHT'} if mock else {'status': 'NOT_PRICEABLE'}
+    if not pricing.get('success'):
+        code = pricing.get('error', {}).get('code')
+        # 4xx means the offer itself is gone; anything else is Amadeus being unavailable
+        status = 'UNAVAILABLE' if isinstance(code, int) and 400 <= code < 500 else 'UNVERIFIED'
+        return {'status': status, 'message': pricing.get('error', {}).get('message')}
+    price_changed = quoted_price is not None and abs(pricing['total_price'] - quoted_price) > PRICE_CHANGE_TOLERANCE
+    return {
+        'status': 'PRICE_CHANGED' if price_changed else 'CONFIRMED',
+        'price': pricing['total_price'],
+        'currency': pricing['currency'],
+        'quoted_price': quoted_price,
+        'priced_at': pricing.get('priced_at'),
+        'cached': pricing.get('cached', False)
+    }
 
-TOTAL PRICE: £{total_price:.2f} {currency}
 
-CONTACT DETAILS:
----------------
-Email: {contact['email']}
-Phone: {contact['phone']}
+@api_router.post("/flights/price")
+async def price_flight(request: FlightPriceRequest):
+    """Confirm the current price of a selected flight before booking"""
+    try:
+        pricing = await revalidate_flight_price(request.flight_data)
+        summary = price_check_summary(pricing, request.flight_data.get('price'), is_mock_flight(request.flight_data))
+        if summary['status'] == 'NOT_PRICEABLE':
+            return {
+                'success': False,
+                'error': {
+                    'code': 'OFFER_NOT_PRICEABLE',
+                    'message': 'This fare could not be confirmed. Please search again.'
+                }
+            }
+        if summary['status'] == 'UNAVAILABLE':
+            return {
+                'success': False,
+                'error': {
+                    'code': 'OFFER_UNAVAILABLE',
+                    'message': 'This fare is no longer available. Please search again.'
+                }
+            }
+        return {'success': True, 'price_check': summary}
+    except Exception as e:
+        logger.error(f"Flight pricing error: {str(e)}")
+        return {
+            'success': False,
+            'error': {
+                'code': 'SERVER_ERROR',
+                'message': str(e)
+            }
+        }
 
-═══════════════════════════════════════════════════════════════
 
-IMPORTANT INFORMATION:
-- Please arrive at the airport at least 2-3 hours before departure
-- Carry a valid passport/ID and this booking confirmation
-- Check airline website for baggage allowance
+# PNRs drawn before a booking fails on repeated collisions
+PNR_ATTEMPTS = 5
 
-For any queries, contact us at: info@flight380.co.uk
+def generate_pnr():
+    """Generate a 6-character PNR code"""
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
-Thank you for choosing Flight380!
 
-Best regards,
-Flight380 Team
-www.flight380.co.uk
-        """
-    else:  # agent
-        subject = f"New Booking - PNR: {pnr} - {flight.get('from')} to {flight.get('to')}"
-        body = f"""
-NEW BOOKING NOTIFICATION
+# Flight fields used by the booking email templates
+BOOKING_EMAIL_FLIGHT_FIELDS = (
+    'from', 'to', 'departure_time', 'arrival_time', 'duration', 'airline', 'airline_code', 'stops', 'is_direct',
+    'return_departure_time', 'return_arrival_time', 'return_duration', 'return_stops', 'return_is_direct'
+)
 
-═══════════════════════════════════════════════════════════════
-BOOKING REFERENCE (PNR): {pnr}
-BOOKING TIME: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}
-═══════════════════════════════════════════════════════════════
 
-CUSTOMER DETAILS:
------------------
-Name: {passengers[0]['first_name']} {passengers[0]['last_name']}
-Email: {contact['email']}
-Phone: {contact['phone']}
+def booking_email_params(booking_data: dict, recipient_type: str) -> tuple:
+    """Template ID and parameters for a booking confirmation ('customer') or notification ('agent')"""
+    flight = booking_data['flight_data']
+    return f"booking_{recipient_type}", {
+        "pnr": booking_data['pnr'],
+        "flight": {key: flight[key] for key in BOOKING_EMAIL_FLIGHT_FIELDS if key in flight},
+        "passengers": [
+            {key: p[key] for key in ('title', 'first_name', 'last_name', 'type')}
+            for p in booking_data['passengers']
+        ],
+        "contact": {"email": booking_data['contact']['email'], "phone": booking_data['contact']['phone']},
+        "total_price": booking_data['total_price'],
+        "currency": booking_data.get('currency', 'GBP'),
+        "booked_at": booking_data['created_at']
+    }
 
-FLIGHT DETAILS:
----------------
-OUTBOUND FLIGHT:{outbound_info}{return_info}
 
-ALL PASSENGERS:
----------------
-{passenger_list}
+# Relays booking email intents into the mail queue
+booking_outbox = BookingOutbox(db, mail_queue, booking_email_params)
 
-PRICING:
---------
-Total Amount: £{total_price:.2f} {currency}
-
-═══════════════════════════════════════════════════════════════
-This is an automated notification from Flight380 Booking System.
-        """
-    
-    return {
-        "subject": subject,
-        "body": body
-    }
+# Booking emails stored as template parameters (or compressed legacy bodies)
+email_archive = EmailArchive(db, mail_queue)
 
 
 @api_router.post("/bookings/create")
 async def create_booking(request: BookingRequest):
     """Create a new flight booking and generate PNR"""
     try:
+        # Confirm the fare with Amadeus before issuing a PNR
+        mock = is_mock_flight(request.flight_data)
+        price_check = price_check_summary(
+            await revalidate_flight_price(request.flight_data),
+            request.total_price,
+            mock
+        )
+        if price_check['status'] == 'NOT_PRICEABLE':
+            return {
+                "success": False,
+                "message": "This fare could not be confirmed. Please search again.",
+                "error": {"code": "OFFER_NOT_PRICEABLE"}
+            }
+        if price_check['status'] == 'UNAVAILABLE':
+            return {
+                "success": False,
+                "message": "This fare is no longer available. Please search again.",
+                "error": {"code": "OFFER_UNAVAILABLE"}
+            }
+        if price_check['status'] == 'PRICE_CHANGED':
+            return {
+                "success": False,
+                "message": f"The fare has changed from {request.total_price:.2f} to {price_check['price']:.2f} {price_check['currency']}. Please review the new price.",
+                "error": {"code": "PRICE_CHANGED"},
+                "price_check": price_check
+            }
+        if price_check['status'] == 'UNVERIFIED':
+            logger.warning(f"Booking proceeding without price revalidation: {price_check.get('message')}")
+        
+        # Raw offers are only needed for pricing - keep the stored flight slim
+        flight_data = {k: v for k, v in request.flight_data.items() if k not in ('raw_data', 'tickets')}
+        
         # Generate unique PNR
         pnr = generate_pnr()
         booking_id = str(uuid.uuid4())
@@ -748,7 +1511,9 @@ async def create_booking(request: BookingRequest):
             "id": booking_id,
             "pnr": pnr,
             "flight_id": request.flight_id,
-            "flight_data": request.flight_data,
+            "flight_data": flight_data,
+            "price_check": price_check,
+            "mock": mock,
             "passengers": [p.model_dump() for p in request.passengers],
             "contact": request.contact.model_dump(),
             "passenger_counts": request.passenger_counts,
@@ -759,40 +1524,24 @@ async def create_booking(request: BookingRequest):
             "updated_at": datetime.now(timezone.utc).isoformat()
         }
         
-        # Save booking to database
-        await db.bookings.insert_one(booking_record)
-        
-        # Create mock emails (stored in database)
-        customer_email_content = create_email_content(booking_record, "customer")
-        agent_email_content = create_email_content(booking_record, "agent")
-        
-        customer_email = {
-            "id": str(uuid.uuid4()),
-            "booking_id": booking_id,
-            "pnr": pnr,
-            "type": "customer_confirmation",
-            "to": request.contact.email,
-            "subject": customer_email_content["subject"],
-            "body": customer_email_content["body"],
-            "status": "SENT",  # Mock - marked as sent
-            "sent_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        agent_email = {
-            "id": str(uuid.uuid4()),
-            "booking_id": booking_id,
-            "pnr": pnr,
-            "type": "agent_notification",
-            "to": AGENT_EMAIL,
-            "subject": agent_email_content["subject"],
-            "body": agent_email_content["body"],
-            "status": "SENT",  # Mock - marked as sent
-            "sent_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        # Save emails to database
-        await db.emails.insert_one(customer_email)
-        await db.emails.insert_one(agent_email)
+        # The email intents are part of the booking document, so both are saved in one write
+        booking_record["outbox"] = email_intents([
+            ("customer_confirmation", "customer", request.contact.email),
+            ("agent_notification", "agent", AGENT_EMAIL)
+        ])
+        
+        # Save booking to database - the unique PNR index rejects a collision, so draw another
+        for attempt in range(PNR_ATTEMPTS):
+            try:
+                await db.bookings.insert_one(booking_record)
+                break
+            except DuplicateKeyError:
+                if attempt == PNR_ATTEMPTS - 1:
+                    raise
+                booking_record.pop("_id", None)
+                booking_record["pnr"] = generate_pnr()
+        pnr = booking_record["pnr"]
+        booking_outbox.notify()
         
         logger.info(f"Booking created: PNR={pnr}, BookingID={booking_id}")
         
@@ -804,28 +1553,16 @@ async def create_booking(request: BookingRequest):
             "booking_details": {
                 "pnr": pnr,
                 "status": "CONFIRMED",
-                "flight": request.flight_data,
+                "flight": flight_data,
                 "passengers": [p.model_dump() for p in request.passengers],
                 "contact": request.contact.model_dump(),
                 "total_price": request.total_price,
                 "currency": request.currency,
                 "created_at": booking_record["created_at"]
             },
-            "emails_sent": [
-                {
-                    "to": request.contact.email,
-                    "type": "Customer Confirmation",
-                    "subject": customer_email_content["subject"],
-                    "body": customer_email_content["body"],
-                    "status": "SENT"
-                },
-                {
-                    "to": AGENT_EMAIL,
-                    "type": "Agent Notification",
-                    "subject": agent_email_content["subject"],
-                    "body": agent_email_content["body"],
-                    "status": "SENT"
-                }
+            "emails_queued": [
+                {"id": intent["id"], "type": intent["type"], "to": intent["to"], "status": intent["status"]}
+                for intent in booking_record["outbox"]
             ]
         }
         
@@ -837,6 +1574,39 @@ async def create_booking(request: BookingRequest):
         }
 
 
+@api_router.get("/bookings/export")
+async def export_bookings_endpoint(
+    format: str = "csv",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    status: Optional[str] = None,
+    gzip: bool = False,
+    admin: Dict = Depends(require_admin)
+):
+    """
+    Stream bookings as CSV or NDJSON (back-office reconciliation, admins only)
+    
+    date_from/date_to are inclusive YYYY-MM-DD days of created_at (UTC);
+    status takes a comma-separated list. Declared before /bookings/{pnr},
+    which would otherwise match "export".
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    try:
+        start = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        end = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date_from and date_to must be YYYY-MM-DD")
+    statuses = [s.strip().upper() for s in status.split(",") if s.strip()] if status else None
+    
+    query = export_query(start, end, statuses)
+    filename = f"bookings-{date_from or 'start'}-{date_to or 'now'}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_bookings(db.bookings, query, format, gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @api_router.get("/bookings/{pnr}")
 async def get_booking(pnr: str):
     """Get booking details by PNR"""
@@ -849,8 +1619,8 @@ async def get_booking(pnr: str):
                 "message": "Booking not found"
             }
         
-        # Get associated emails
-        emails = await db.emails.find({"pnr": pnr.upper()}, {"_id": 0}).to_list(10)
+        # Email summaries only - bodies are rendered by GET /emails/{booking_id}
+        emails = await email_archive.summaries({"pnr": pnr.upper()})
         
         return {
             "success": True,
@@ -867,14 +1637,28 @@ async def get_booking(pnr: str):
 
 
 @api_router.get("/bookings")
-async def list_bookings(limit: int = 20):
-    """List all bookings"""
+async def list_bookings(limit: int = 20, cursor: Optional[str] = None):
+    """
+    List bookings, newest first
+    
+    Keyset pagination on (created_at, id): pass next_cursor from the previous
+    page as cursor. Rows are summaries; use GET /bookings/{pnr} for details.
+    """
     try:
-        bookings = await db.bookings.find({}, {"_id": 0}).sort("created_at", -1).to_list(limit)
+        try:
+            page = await bookings_page(db.bookings, limit, cursor)
+        except ValueError:
+            return {
+                "success": False,
+                "message": "Invalid cursor",
+                "error": {"code": "INVALID_CURSOR"}
+            }
         return {
             "success": True,
-            "bookings": bookings,
-            "count": len(bookings)
+            "bookings": page["bookings"],
+            "count": len(page["bookings"]),
+            "has_more": page["has_more"],
+            "next_cursor": page["next_cursor"]
         }
     except Exception as e:
         logger.error(f"List bookings error: {str(e)}")
@@ -884,11 +1668,33 @@ async def list_bookings(limit: int = 20):
         }
 
 
+@api_router.get("/db/indexes/check")
+async def get_index_check():
+    """Whether each hot query is served by an index (explain plans)"""
+    results = await check_hot_queries(db)
+    return {
+        'success': all(result['indexed'] for result in results),
+        'queries': results
+    }
+
+
+@api_router.get("/emails/queue/stats")
+async def get_mail_queue_stats():
+    """Outbound mail queue depth by status, SMTP connection reuse and booking outbox relaying"""
+    return {
+        'success': True,
+        'stats': {
+            **await mail_queue.get_stats(),
+            'outbox': booking_outbox.get_stats()
+        }
+    }
+
+
 @api_router.get("/emails/{booking_id}")
 async def get_booking_emails(booking_id: str):
     """Get all emails for a booking"""
     try:
-        emails = await db.emails.find({"booking_id": booking_id}, {"_id": 0}).to_list(10)
+        emails = await email_archive.view({"booking_id": booking_id})
         return {
             "success": True,
             "emails": emails
@@ -927,112 +1733,42 @@ async def submit_contact_form(request: ContactFormRequest):
         }
         await db.contact_submissions.insert_one(contact_record)
         
-        # Create email content for company (info@flight380.co.uk)
-        company_html = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="background: #E73121; padding: 20px; text-align: center;">
-                    <h1 style="color: white; margin: 0;">New Contact Form Submission</h1>
-                </div>
-                <div style="padding: 20px; background: #f9f9f9;">
-                    <h2 style="color: #E73121;">Customer Details</h2>
-                    <table style="width: 100%; border-collapse: collapse;">
-                        <tr>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;"><strong>Name:</strong></td>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;">{request.first_name} {request.last_name}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;"><strong>Email:</strong></td>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;"><a href="mailto:{request.email}">{request.email}</a></td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;"><strong>Phone:</strong></td>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;">{request.phone or 'Not provided'}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;"><strong>Subject:</strong></td>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;">{request.subject}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;"><strong>Booking Reference:</strong></td>
-                            <td style="padding: 10px; border-bottom: 1px solid #ddd;">{request.booking_reference or 'N/A'}</td>
-                        </tr>
-                    </table>
-                    
-                    <h2 style="color: #E73121; margin-top: 20px;">Message</h2>
-                    <div style="background: white; padding: 15px; border-radius: 5px; border: 1px solid #ddd;">
-                        {request.message.replace(chr(10), '<br>')}
-                    </div>
-                    
-                    <p style="margin-top: 20px; font-size: 12px; color: #666;">
-                        Reference ID: {contact_id}<br>
-                        Submitted: {timestamp}
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Create thank you email for customer
-        customer_html = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="background: #E73121; padding: 20px; text-align: center;">
-                    <h1 style="color: white; margin: 0;">Thank You for Contacting Us!</h1>
-                </div>
-                <div style="padding: 20px; background: #f9f9f9;">
-                    <p>Dear {request.first_name},</p>
-                    
-                    <p>Thank you for reaching out to Flight380. We have received your message and our team will get back to you as soon as possible.</p>
-                    
-                    <div style="background: white; padding: 15px; border-radius: 5px; border: 1px solid #ddd; margin: 20px 0;">
-                        <h3 style="color: #E73121; margin-top: 0;">Your Message Details</h3>
-                        <p><strong>Subject:</strong> {request.subject}</p>
-                        <p><strong>Reference ID:</strong> {contact_id}</p>
-                        <p><strong>Your Message:</strong></p>
-                        <p style="color: #666;">{request.message.replace(chr(10), '<br>')}</p>
-                    </div>
-                    
-                    <p>Our customer support team typically responds within 24-48 hours. For urgent enquiries, please call us at:</p>
-                    
-                    <p style="font-size: 18px; color: #E73121; font-weight: bold;">📞 01908 220000</p>
-                    <p><strong>Support Hours:</strong> 08:00 AM – 11:59 PM (GMT)</p>
-                    
-                    <hr style="border: none; border-top: 1px solid #ddd; margin: 20px 0;">
-                    
-                    <p style="font-size: 12px; color: #666;">
-                        Flight380<br>
-                        277 Dunstable Road, Luton, Bedfordshire, LU4 8BS<br>
-                        <a href="mailto:info@flight380.co.uk">info@flight380.co.uk</a>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Send emails
-        company_email_sent = await send_email_smtp(
+        # Parameters for the contact templates, rendered by the mail workers
+        email_params = {
+            "first_name": request.first_name,
+            "last_name": request.last_name,
+            "email": request.email,
+            "phone": request.phone,
+            "subject": request.subject,
+            "booking_reference": request.booking_reference,
+            "message": request.message,
+            "contact_id": contact_id,
+            "submitted_at": timestamp
+        }
+        
+        # Queue emails - delivery and retries happen in the mail workers
+        company_email_id = await mail_queue.enqueue_template(
             COMPANY_EMAIL,
-            f"[Flight380 Contact] {request.subject} - {request.first_name} {request.last_name}",
-            company_html
+            "contact_company",
+            email_params,
+            category="contact",
+            reference=contact_id
         )
         
-        customer_email_sent = await send_email_smtp(
+        customer_email_id = await mail_queue.enqueue_template(
             request.email,
-            "Thank you for contacting Flight380",
-            customer_html
+            "contact_customer",
+            email_params,
+            category="contact",
+            reference=contact_id
         )
         
-        # Update record with email status
+        # Link the record to its queued emails
         await db.contact_submissions.update_one(
             {"id": contact_id},
             {"$set": {
-                "company_email_sent": company_email_sent,
-                "customer_email_sent": customer_email_sent
+                "company_email_id": company_email_id,
+                "customer_email_id": customer_email_id
             }}
         )
         
@@ -1040,9 +1776,9 @@ async def submit_contact_form(request: ContactFormRequest):
             "success": True,
             "message": "Thank you for your message! We have received your enquiry and will get back to you shortly.",
             "reference_id": contact_id,
-            "emails_sent": {
-                "company": company_email_sent,
-                "customer": customer_email_sent
+            "emails_queued": {
+                "company": company_email_id,
+                "customer": customer_email_id
             }
         }
         
@@ -1115,6 +1851,7 @@ async def store_session(request: SessionRequest, response: Response):
                     "updated_at": datetime.now(timezone.utc).isoformat()
                 }}
             )
+            await session_cache.invalidate_user(user_id)
         else:
             # Create new user
             user_id = f"user_{uuid.uuid4().hex[:12]}"
@@ -1128,11 +1865,12 @@ async def store_session(request: SessionRequest, response: Response):
             })
         
         # Store session
-        expires_at = datetime.now(timezone.utc).replace(day=datetime.now(timezone.utc).day + 7)
+        expires_at = datetime.now(timezone.utc) + timedelta(days=7)
         await db.user_sessions.insert_one({
             "user_id": user_id,
             "session_token": request.session_token,
             "expires_at": expires_at.isoformat(),
+            "expire_at": expires_at,
             "created_at": datetime.now(timezone.utc).isoformat()
         })
         
@@ -1177,12 +1915,13 @@ async def register_user(user: UserRegister, response: Response):
         
         # Create session
         session_token = generate_session_token()
-        expires_at = datetime.now(timezone.utc).replace(day=datetime.now(timezone.utc).day + 7)
+        expires_at = datetime.now(timezone.utc) + timedelta(days=7)
         
         await db.user_sessions.insert_one({
             "user_id": user_id,
             "session_token": session_token,
             "expires_at": expires_at.isoformat(),
+            "expire_at": expires_at,
             "created_at": datetime.now(timezone.utc).isoformat()
         })
         
@@ -1231,12 +1970,13 @@ async def login_user(user: UserLogin, response: Response):
         
         # Create session
         session_token = generate_session_token()
-        expires_at = datetime.now(timezone.utc).replace(day=datetime.now(timezone.utc).day + 7)
+        expires_at = datetime.now(timezone.utc) + timedelta(days=7)
         
         await db.user_sessions.insert_one({
             "user_id": db_user["user_id"],
             "session_token": session_token,
             "expires_at": expires_at.isoformat(),
+            "expire_at": expires_at,
             "created_at": datetime.now(timezone.utc).isoformat()
         })
         
@@ -1281,10 +2021,16 @@ async def get_current_user(request: Request, session_token: Optional[str] = Cook
         if not token:
             raise HTTPException(status_code=401, detail="Not authenticated")
         
-        # Find session
-        session = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
-        if not session:
-            raise HTTPException(status_code=401, detail="Invalid session")
+        # Find session - cached with its user, or from MongoDB
+        cached = session_cache.get(token)
+        generation = session_cache.generation
+        if cached:
+            session, user = cached
+        else:
+            session = await db.user_sessions.find_one({"session_token": token}, {"_id": 0, "user_id": 1, "expires_at": 1})
+            if not session:
+                raise HTTPException(status_code=401, detail="Invalid session")
+            user = None
         
         # Check expiry
         expires_at = session["expires_at"]
@@ -1296,9 +2042,11 @@ async def get_current_user(request: Request, session_token: Optional[str] = Cook
             raise HTTPException(status_code=401, detail="Session expired")
         
         # Get user
-        user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0, "password_hash": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
+        if user is None:
+            user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0, "password_hash": 0})
+            if not user:
+                raise HTTPException(status_code=401, detail="User not found")
+            session_cache.set(token, session, user, generation)
         
         return user
         
@@ -1308,6 +2056,14 @@ async def get_current_user(request: Request, session_token: Optional[str] = Cook
         logger.error(f"Auth check error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/auth/session-cache/stats")
+async def get_session_cache_stats():
+    """Hit rate of the /auth/me session cache"""
+    return {
+        'success': True,
+        'stats': session_cache.get_stats()
+    }
+
 @api_router.post("/auth/logout")
 async def logout_user(request: Request, response: Response, session_token: Optional[str] = Cookie(None)):
     """Logout user"""
@@ -1320,6 +2076,7 @@ async def logout_user(request: Request, response: Response, session_token: Optio
         
         if token:
             await db.user_sessions.delete_one({"session_token": token})
+            await session_cache.invalidate_token(token)
         
         response.delete_cookie(key="session_token", path="/")
         
@@ -1355,6 +2112,8 @@ async def forgot_password(data: ForgotPassword):
                 "email": data.email,
                 "token": reset_token,
                 "expires_at": expires_at.isoformat(),
+                # Kept a day past expiry so the link still reports "expired" rather than "invalid"
+                "expire_at": expires_at + timedelta(days=1),
                 "created_at": datetime.now(timezone.utc).isoformat(),
                 "used": False
             })
@@ -1362,80 +2121,15 @@ async def forgot_password(data: ForgotPassword):
             # Build reset URL - use the request origin or fallback to production URL
             reset_url = f"https://flight380.co.uk/reset-password?token={reset_token}"
             
-            # Send password reset email
-            html_body = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #dc2626, #ef4444); padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }}
-                    .header img {{ height: 40px; }}
-                    .header h1 {{ color: white; margin: 15px 0 0 0; font-size: 24px; }}
-                    .content {{ background: #f9fafb; padding: 30px; border: 1px solid #e5e7eb; }}
-                    .button {{ display: inline-block; background: #dc2626; color: white; padding: 14px 30px; text-decoration: none; border-radius: 6px; font-weight: bold; margin: 20px 0; }}
-                    .button:hover {{ background: #b91c1c; }}
-                    .footer {{ text-align: center; padding: 20px; color: #6b7280; font-size: 12px; }}
-                    .warning {{ background: #fef3c7; border: 1px solid #f59e0b; padding: 12px; border-radius: 6px; margin-top: 20px; font-size: 13px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>Password Reset Request</h1>
-                    </div>
-                    <div class="content">
-                        <p>Hello {user.get('name', 'Valued Customer')},</p>
-                        <p>We received a request to reset your password for your Flight380 account. Click the button below to create a new password:</p>
-                        <p style="text-align: center;">
-                            <a href="{reset_url}" class="button">Reset My Password</a>
-                        </p>
-                        <p>Or copy and paste this link into your browser:</p>
-                        <p style="word-break: break-all; background: #e5e7eb; padding: 10px; border-radius: 4px; font-size: 13px;">{reset_url}</p>
-                        <div class="warning">
-                            <strong>⚠️ Important:</strong> This link will expire in 1 hour. If you didn't request this password reset, please ignore this email or contact our support team.
-                        </div>
-                    </div>
-                    <div class="footer">
-                        <p>Flight380 - Your Trusted Travel Partner</p>
-                        <p>📞 01908 220000 | ✉️ info@flight380.co.uk</p>
-                        <p>© 2025 Flight380. All rights reserved.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            plain_body = f"""
-            Password Reset Request - Flight380
-            
-            Hello {user.get('name', 'Valued Customer')},
-            
-            We received a request to reset your password. Click the link below to create a new password:
-            
-            {reset_url}
-            
-            This link will expire in 1 hour.
-            
-            If you didn't request this password reset, please ignore this email.
-            
-            Flight380 - Your Trusted Travel Partner
-            Phone: 01908 220000
-            Email: info@flight380.co.uk
-            """
-            
-            email_sent = await send_email_smtp(
+            # Queue password reset email
+            await mail_queue.enqueue_template(
                 data.email,
-                "Flight380 - Password Reset Request",
-                html_body,
-                plain_body
+                "password_reset",
+                {"name": user.get('name', 'Valued Customer'), "reset_url": reset_url},
+                category="password_reset",
+                reference=user.get('user_id')
             )
-            
-            if email_sent:
-                logger.info(f"Password reset email sent to {data.email}")
-            else:
-                logger.warning(f"Failed to send password reset email to {data.email}")
+            logger.info(f"Password reset email queued for {data.email}")
         
         return {"success": True, "message": "If an account exists with this email, you will receive a password reset link."}
         
@@ -1487,7 +2181,8 @@ async def reset_password(data: ResetPassword):
         )
         
         # Delete all sessions for this user (force re-login)
-        await db.sessions.delete_many({"user_id": reset_record["user_id"]})
+        await db.user_sessions.delete_many({"user_id": reset_record["user_id"]})
+        await session_cache.invalidate_user(reset_record["user_id"])
         
         logger.info(f"Password reset successful for user {reset_record['user_id']}")
         
@@ -1556,6 +2251,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_background_services():
+    await ensure_indexes(db)
+    await check_hot_queries(db)
+    email_templates.load()
+    await mail_queue.start()
+    await booking_outbox.start()
+    email_archive.start()
+    await session_cache.start()
+    search_analytics.start()
+    search_rollups.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await session_cache.stop()
+    await search_analytics.stop()
+    await search_rollups.stop()
+    await booking_outbox.stop()
+    await email_archive.stop()
+    await mail_queue.stop()
+    smtp_pool.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sessions kept per worker (least recently used are evicted)
+CACHE_SIZE = 10000
+# Upper bound on how long a cached session/user is trusted without re-reading MongoDB
+CACHE_TTL_SECONDS = 300
+# How often each worker applies invalidations published by the others
+INVALIDATION_POLL_SECONDS = 2
+# Published invalidations are removed by a TTL index after this long
+INVALIDATION_RETENTION = timedelta(hours=1)
+# Overlap between polls, so invalidations from workers with a slightly slow clock aren't missed
+CLOCK_SKEW = timedelta(seconds=5)
+
+
+def token_hash(token: str) -> str:
+    """Cache key for a session token - raw tokens are never kept in memory or published"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionCache:
+    """
+    Bounded in-process cache of session -> user lookups for /auth/me
+
+    Entries hold the session and the user projection, keyed by a hash of the
+    session token, and expire after CACHE_TTL_SECONDS. Logout, password reset
+    and profile changes evict them locally and publish the invalidation to
+    the session_invalidations collection, which every worker polls, so other
+    workers drop their copies within INVALIDATION_POLL_SECONDS.
+
+    Every invalidation bumps a generation counter. Callers take it before
+    reading MongoDB and pass it to set(), which refuses to cache what was read
+    if an invalidation landed in between - otherwise a logout during the
+    lookup would put the deleted session back for a whole TTL.
+    """
+
+    def __init__(self, db, size: int = CACHE_SIZE, ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.invalidations = db.session_invalidations
+        self.size = size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        self.generation = 0
+        self._polled_at = datetime.now(timezone.utc)
+        self._task = None
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'stale_sets': 0
+        }
+
+    def get(self, token: str) -> Optional[Tuple[Dict, Dict]]:
+        """(session, user) if cached and within the TTL"""
+        key = token_hash(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.stats['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry[1], entry[2]
+
+    def set(self, token: str, session: Dict, user: Dict, generation: int):
+        """Cache a lookup that started at `generation` - skipped if anything was invalidated since"""
+        if generation != self.generation:
+            self.stats['stale_sets'] += 1
+            return
+        key = token_hash(token)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, session, user)
+        self._entries.move_to_end(key)
+        self._by_user.setdefault(user['user_id'], set()).add(key)
+        while len(self._entries) > self.size:
+            self._remove(next(iter(self._entries)))
+            self.stats['evictions'] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_user.get(entry[2]['user_id'])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry[2]['user_id']]
+
+    def _evict(self, key: Optional[str] = None, user_id: Optional[str] = None):
+        # Bumped even when nothing is cached here - a lookup may be in flight
+        self.generation += 1
+        keys = {key} if key else set(self._by_user.get(user_id, ()))
+        for k in keys:
+            if k in self._entries:
+                self._remove(k)
+                self.stats['invalidations'] += 1
+
+    async def _publish(self, invalidation: Dict):
+        now = datetime.now(timezone.utc)
+        try:
+            await self.invalidations.insert_one({
+                **invalidation,
+                "created_at": now,
+                "expire_at": now + INVALIDATION_RETENTION
+            })
+        except Exception as e:
+            # Other workers still drop the entry when its TTL runs out
+            logger.error(f"Session invalidation publish error: {e}")
+
+    async def invalidate_token(self, token: str):
+        """Forget one session on every worker (logout)"""
+        key = token_hash(token)
+        self._evict(key=key)
+        await self._publish({"token_hash": key})
+
+    async def invalidate_user(self, user_id: str):
+        """Forget all of a user's sessions on every worker (password reset, profile change)"""
+        self._evict(user_id=user_id)
+        await self._publish({"user_id": user_id})
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(INVALIDATION_POLL_SECONDS)
+            try:
+                now = datetime.now(timezone.utc)
+                events = await self.invalidations.find(
+                    {"created_at": {"$gte": self._polled_at - CLOCK_SKEW}},
+                    {"_id": 0, "token_hash": 1, "user_id": 1}
+                ).to_list(None)
+                self._polled_at = now
+                # Evicting is idempotent, so events seen in the overlap are simply applied again
+                for event in events:
+                    self._evict(key=event.get("token_hash"), user_id=event.get("user_id"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Session invalidation poll error: {e}")
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'entries': len(self._entries),
+            'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0
+        }
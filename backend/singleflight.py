@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+# How often a long-running search checks whether its client is still there, in seconds
+DISCONNECT_POLL_SECONDS = 0.5
+# Requests abandoned by the client, per endpoint
+disconnect_stats = {'search': 0, 'multi_city': 0, 'fare_calendar': 0}
+
+
+class SingleFlight:
+    """
+    Share one in-flight upstream call between concurrent identical requests
+
+    Every caller of run() with the same key awaits the same task. A caller
+    that goes away (its request was cancelled, e.g. the client disconnected)
+    only detaches; the shared task is cancelled once its last waiter has gone.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Dict[str, Any]] = {}
+        self.stats = {
+            'started': 0,
+            'shared': 0,        # callers that joined a call already in flight
+            'detached': 0,      # waiters that left while others were still waiting
+            'cancelled': 0      # upstream calls cancelled because nobody was waiting
+        }
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = {'task': asyncio.ensure_future(factory()), 'waiters': 0}
+            self._calls[key] = call
+            call['task'].add_done_callback(lambda task: self._forget(key, task))
+            self.stats['started'] += 1
+        else:
+            self.stats['shared'] += 1
+
+        call['waiters'] += 1
+        try:
+            return await asyncio.shield(call['task'])
+        except asyncio.CancelledError:
+            if call['waiters'] == 1 and not call['task'].done():
+                call['task'].cancel()
+                self.stats['cancelled'] += 1
+            elif call['waiters'] > 1:
+                self.stats['detached'] += 1
+            raise
+        finally:
+            call['waiters'] -= 1
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        call = self._calls.get(key)
+        if call and call['task'] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here so abandoned failures aren't logged as unhandled
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'in_flight': len(self._calls)}
+
+
+async def run_until_disconnected(http_request, coro: Awaitable, endpoint: str) -> Dict:
+    """
+    Run an endpoint's work, cancelling it if the client disconnects first
+
+    Upstream calls shared with another request (see SingleFlight) keep
+    running for the remaining waiters; everything else is cancelled.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                disconnect_stats[endpoint] += 1
+                logger.info(f"Client disconnected, cancelled {endpoint} request")
+                return {
+                    'success': False,
+                    'error': {'code': 'CLIENT_DISCONNECTED', 'message': 'Request cancelled'}
+                }
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
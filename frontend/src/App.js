@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import './App.css';
 import axios from 'axios';
@@ -59,6 +59,8 @@ function App() {
   const [searchParams, setSearchParams] = useState(null);
   const [isFlexibleSearch, setIsFlexibleSearch] = useState(false);
   const [savedSearchData, setSavedSearchData] = useState(null);
+  // In-flight search, aborted when a new one starts so the server can stop working on it
+  const searchAbortRef = useRef(null);
   const [showBooking, setShowBooking] = useState(false);
   const [selectedFlight, setSelectedFlight] = useState(null);
   
@@ -150,6 +152,9 @@ function App() {
 
   const handleSearch = async (searchData) => {
     console.log('Search data:', searchData);
+    searchAbortRef.current?.abort();
+    const controller = new AbortController();
+    searchAbortRef.current = controller;
     setIsLoading(true);
     setSearchError(null);
     setSearchParams(searchData);
@@ -175,7 +180,7 @@ function App() {
           travel_class: searchData.travel_class,
           direct_flights: searchData.direct_flights,
           airline: searchData.airline?.code || null
-        });
+        }, { signal: controller.signal });
       } else {
         // Regular one-way or round-trip search
         response = await axios.post(`${API}/flights/search`, {
@@ -193,7 +198,7 @@ function App() {
           direct_flights: searchData.direct_flights,
           flexible_dates: searchData.flexiDates || false,
           airline: searchData.airline?.code || null
-        });
+        }, { signal: controller.signal });
       }
       
       if (response.data.success) {
@@ -212,12 +217,16 @@ function App() {
         setSearchResults([]);
       }
     } catch (error) {
+      if (axios.isCancel(error)) return;  // Superseded by a newer search
       console.error('Flight search error:', error);
       toast.error('Failed to search flights. Please try again.');
       setSearchError(error.message);
       setSearchResults([]);
     } finally {
-      setIsLoading(false);
+      if (searchAbortRef.current === controller) {
+        searchAbortRef.current = null;
+        setIsLoading(false);
+      }
     }
   };
 
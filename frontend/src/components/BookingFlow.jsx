@@ -85,7 +85,34 @@ export const BookingFlow = ({
         return_stops: returnFlight.return_stops,
         // Price
         price: rawFlight.combinedPrice,
-        combinedPrice: rawFlight.combinedPrice
+        combinedPrice: rawFlight.combinedPrice,
+        // The two offers behind the pairing, priced and booked like split tickets
+        split_ticket: true,
+        tickets: [
+          { direction: 'outbound', price: outbound.price, raw_data: outbound.raw_data },
+          { direction: 'return', price: returnFlight.price, raw_data: returnFlight.raw_data }
+        ]
+      };
+    }
+    // Multi-city structure: { type: 'multi-city', flights: [one per leg], totalPrice: number }
+    if (rawFlight.type === 'multi-city') {
+      const legs = rawFlight.flights;
+      const first = legs[0];
+      const last = legs[legs.length - 1];
+      return {
+        id: legs.map(leg => leg.id).join('-'),
+        airline: first.airline,
+        airline_code: first.airline_code,
+        from: first.from,
+        to: last.to,
+        departure_time: first.departure_time,
+        arrival_time: last.arrival_time,
+        duration: first.duration,
+        is_direct: legs.every(leg => leg.is_direct),
+        stops: legs.reduce((sum, leg) => sum + (leg.stops || 0), 0),
+        price: rawFlight.totalPrice,
+        // One ticket per leg
+        tickets: legs.map((leg, index) => ({ direction: `leg-${index + 1}`, price: leg.price, raw_data: leg.raw_data }))
       };
     }
     // Combined view structure - already in correct format
@@ -179,6 +206,21 @@ export const BookingFlow = ({
 
   const priceBreakdown = calculatePriceBreakdown();
 
+  // Confirm the fare with the airline as soon as the customer moves on to details.
+  // The backend caches the priced offer, so going back and forth doesn't reprice it.
+  React.useEffect(() => {
+    if (step !== 2 || (!flight.raw_data && !flight.tickets)) return;
+    axios.post(`${API_URL}/api/flights/price`, {
+      flight_data: { price: flight.price, raw_data: flight.raw_data, tickets: flight.tickets }
+    }).then(response => {
+      if (!response.data.success) {
+        setError(response.data.error?.message || 'This fare is no longer available.');
+      } else if (response.data.price_check?.status === 'PRICE_CHANGED') {
+        setError(`The fare has changed to £${response.data.price_check.price.toFixed(2)}. Please search again to book at the new price.`);
+      }
+    }).catch(err => console.error('Price check error:', err));
+  }, [step, flight]);
+
   const formatTime = (dateTime) => {
     if (!dateTime) return '';
     return new Date(dateTime).toLocaleTimeString('en-GB', { hour: '2-digit', minute: '2-digit' });
@@ -257,7 +299,10 @@ export const BookingFlow = ({
           return_arrival_time: flight.return_arrival_time,
           return_duration: flight.return_duration,
           return_is_direct: flight.return_is_direct,
-          return_stops: flight.return_stops
+          return_stops: flight.return_stops,
+          split_ticket: flight.split_ticket,
+          raw_data: flight.raw_data,
+          tickets: flight.tickets
         },
         passengers: formattedPassengers,
         contact: {
@@ -273,6 +318,10 @@ export const BookingFlow = ({
         currency: 'GBP'
       });
       
+      if (!response.data.success) {
+        setError(response.data.message || 'Failed to create booking. Please try again.');
+        return;
+      }
       setBookingResult(response.data);
       setStep(3);
     } catch (err) {
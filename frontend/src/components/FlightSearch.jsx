@@ -90,13 +90,14 @@ export const FlightSearch = ({ onSearch, initialData }) => {
     }
   }, [initialData]);
 
-  // Fetch fares from backend with caching
-  const fetchFaresFromBackend = React.useCallback(async (origin, destination) => {
+  // Fetch fares from backend with caching. The calendar is built as a background job;
+  // onProgress gets the fares found so far while it streams in.
+  const fetchFaresFromBackend = React.useCallback(async (origin, destination, originAirports, destinationAirports, onProgress) => {
     try {
       const API_URL = process.env.REACT_APP_BACKEND_URL;
       const today = format(new Date(), 'yyyy-MM-dd');
       
-      const response = await fetch(`${API_URL}/api/flights/fare-calendar`, {
+      const response = await fetch(`${API_URL}/api/flights/fare-calendar/jobs`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -104,6 +105,8 @@ export const FlightSearch = ({ onSearch, initialData }) => {
         body: JSON.stringify({
           origin: origin,
           destination: destination,
+          origin_airports: originAirports || null,
+          destination_airports: destinationAirports || null,
           departure_date: today,
           one_way: tripType === 'one-way',
           duration: 7
@@ -112,10 +115,34 @@ export const FlightSearch = ({ onSearch, initialData }) => {
       
       const data = await response.json();
       
-      if (data.success && data.data) {
-        return data.data;
+      if (!data.success) return null;
+      const hasFares = (fares) => (fares && Object.keys(fares).length > 0 ? fares : null);
+      if (data.status !== 'running') {
+        return hasFares(data.data);
       }
-      return null;
+      
+      let fares = { ...data.data };
+      if (hasFares(fares) && onProgress) onProgress(fares);
+      
+      return await new Promise((resolve) => {
+        const source = new EventSource(`${API_URL}/api/flights/fare-calendar/jobs/${data.job_id}/events`);
+        source.addEventListener('snapshot', (event) => {
+          fares = { ...fares, ...JSON.parse(event.data).data };
+        });
+        source.addEventListener('fare', (event) => {
+          const { date, price } = JSON.parse(event.data);
+          fares = { ...fares, [date]: price };
+          if (onProgress) onProgress(fares);
+        });
+        source.addEventListener('done', (event) => {
+          source.close();
+          resolve(hasFares(JSON.parse(event.data).data));
+        });
+        source.onerror = () => {
+          source.close();
+          resolve(hasFares(fares));
+        };
+      });
     } catch (error) {
       console.error('Error fetching fare calendar:', error);
       return null;
@@ -127,12 +154,13 @@ export const FlightSearch = ({ onSearch, initialData }) => {
     if (!fromAirport || !toAirport || !openDatePicker) return;
     if (tripType === 'multi-city') return;
     
-    const originCode = fromAirport.isGroup ? fromAirport.airports[0] : fromAirport.code;
-    const destCode = toAirport.isGroup ? toAirport.airports[0] : toAirport.code;
+    // Groups get one calendar with the cheapest fare across all their airports
+    const originAirports = fromAirport.isGroup ? fromAirport.airports : null;
+    const destAirports = toAirport.isGroup ? toAirport.airports : null;
     
     setFaresLoading(true);
     
-    fetchFaresFromBackend(originCode, destCode)
+    fetchFaresFromBackend(fromAirport.code, toAirport.code, originAirports, destAirports, setFares)
       .then((fareData) => {
         if (fareData) {
           setFares(fareData);
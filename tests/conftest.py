@@ -0,0 +1,396 @@
+import asyncio
+import copy
+import itertools
+import sys
+from pathlib import Path
+
+import pytest
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# The backend modules import each other by flat name, as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+
+class Result:
+    """Stands in for pymongo's InsertManyResult, UpdateResult, DeleteResult..."""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def _values(doc, path):
+    """Values at a dotted path, looking inside arrays as MongoDB does"""
+    values = [doc]
+    for key in path.split('.'):
+        found = []
+        for value in values:
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, dict) and key in item:
+                    found.append(item[key])
+        values = found
+    return values + [item for value in values if isinstance(value, list) for item in value]
+
+
+def _sort_key(doc, field):
+    value = (_values(doc, field)[:1] or [None])[0]
+    return (value is not None, value)
+
+
+def _compare(values, op, operand):
+    tests = {
+        '$eq': lambda v: v == operand,
+        '$lt': lambda v: v < operand,
+        '$lte': lambda v: v <= operand,
+        '$gt': lambda v: v > operand,
+        '$gte': lambda v: v >= operand,
+        '$in': lambda v: v in operand
+    }
+    if op == '$exists':
+        return bool(values) == bool(operand)
+    if op == '$ne':
+        return operand not in values
+    if op == '$nin':
+        return not any(v in operand for v in values)
+    for value in values:
+        try:
+            if value is not None and tests[op](value):
+                return True
+        except TypeError:
+            pass
+    return op == '$in' and None in operand and not values
+
+
+def matches(doc, query):
+    """Whether doc matches a find filter (equality, comparisons, $in, $exists, $or, $and)"""
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+        elif field == '$and':
+            if not all(matches(doc, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+            values = _values(doc, field)
+            if not all(_compare(values, op, operand) for op, operand in condition.items()):
+                return False
+        elif condition not in _values(doc, field) and not (condition is None and not _values(doc, field)):
+            return False
+    return True
+
+
+def _include(value, paths):
+    if isinstance(value, list):
+        return [_include(item, paths) for item in value if isinstance(item, dict)]
+    out = {}
+    for head in dict.fromkeys(path[0] for path in paths):
+        if head not in value:
+            continue
+        rest = [path[1:] for path in paths if path[0] == head]
+        if [] not in rest:
+            out[head] = _include(value[head], rest)
+        elif isinstance(value[head], (dict, list)):
+            out[head] = copy.deepcopy(value[head])
+        else:
+            out[head] = value[head]
+    return out
+
+
+def project(doc, projection=None):
+    """Copy of doc limited by an inclusion or exclusion projection"""
+    if not projection:
+        return copy.deepcopy(doc)
+    fields = {field: flag for field, flag in projection.items() if field != '_id'}
+    if fields and all(fields.values()):
+        paths = [field.split('.') for field in fields]
+        if projection.get('_id', 1):
+            paths.append(['_id'])
+        return _include(doc, paths)
+    out = copy.deepcopy(doc)
+    for field, flag in projection.items():
+        if not flag:
+            *parents, last = field.split('.')
+            for target in _containers(out, parents):
+                target.pop(last, None)
+    return out
+
+
+def _containers(doc, parents):
+    targets = [doc]
+    for key in parents:
+        targets = [item for target in targets for value in [target.get(key)]
+                   for item in (value if isinstance(value, list) else [value]) if isinstance(item, dict)]
+    return targets
+
+
+def _targets(doc, path, array_filters):
+    """(container, key) pairs a dotted update path refers to, creating subdocuments as needed"""
+    *parents, last = path.split('.')
+    containers = [doc]
+    for key in parents:
+        following = []
+        for container in containers:
+            if key.startswith('$['):
+                name = key[2:-1]
+                following += [item for item in container if all(
+                    matches({name: item}, {field: condition})
+                    for f in array_filters for field, condition in f.items()
+                    if field.split('.')[0] == name
+                )]
+            else:
+                following.append(container.setdefault(key, {}))
+        containers = following
+    return [(container, last) for container in containers]
+
+
+def apply_update(doc, update, array_filters=(), inserting=False):
+    """Apply update operators to doc in place"""
+    for op, fields in update.items():
+        if op == '$setOnInsert' and not inserting:
+            continue
+        for path, value in fields.items():
+            for container, key in _targets(doc, path, array_filters):
+                if op in ('$set', '$setOnInsert'):
+                    container[key] = copy.deepcopy(value)
+                elif op == '$unset':
+                    container.pop(key, None)
+                elif op == '$inc':
+                    container[key] = container.get(key, 0) + value
+                elif op == '$max':
+                    if key not in container or value > container[key]:
+                        container[key] = value
+                elif op == '$min':
+                    if key not in container or value < container[key]:
+                        container[key] = value
+                elif op == '$addToSet':
+                    items = container.setdefault(key, [])
+                    for item in (value['$each'] if isinstance(value, dict) and '$each' in value else [value]):
+                        if item not in items:
+                            items.append(item)
+                elif op == '$push':
+                    container.setdefault(key, []).append(copy.deepcopy(value))
+                else:
+                    raise NotImplementedError(op)
+
+
+class FakeCursor:
+    """Cursor over a FakeCollection query; sort/limit/batch_size chain like motor's"""
+
+    def __init__(self, collection, query, projection):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.sort_keys = None
+        self.limit_count = 0
+        self.closed = False
+
+    def sort(self, keys, direction=None):
+        self.sort_keys = [(keys, direction or 1)] if isinstance(keys, str) else list(keys)
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _documents(self):
+        docs = (doc for doc in self.collection.docs if matches(doc, self.query))
+        if self.sort_keys and self.sort_keys != self.collection.sorted_by:
+            docs = list(docs)
+            for field, direction in reversed(self.sort_keys):
+                docs.sort(key=lambda doc: _sort_key(doc, field), reverse=direction < 0)
+        if self.limit_count:
+            docs = itertools.islice(docs, self.limit_count)
+        return (project(doc, self.projection) for doc in docs)
+
+    async def to_list(self, length):
+        await self.collection.io()
+        return list(itertools.islice(self._documents(), length))
+
+    def __aiter__(self):
+        async def documents():
+            for doc in self._documents():
+                yield doc
+        return documents()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    """
+    In-memory stand-in for a motor collection
+
+    Supports the queries, projections and update operators the backend uses.
+    Every call that goes through is logged in calls; set fail_writes to make
+    the next writes raise, or gate to an unset asyncio.Event to hold
+    operations until it is set. sorted_by names a sort the stored order already satisfies (as an
+    index would), so it is served without materialising the documents -
+    docs may then be any re-iterable, e.g. a generator of millions.
+    """
+
+    def __init__(self, docs=None, unique=('_id',), sorted_by=None):
+        self.docs = docs if docs is not None else []
+        self.unique = list(unique)
+        self.sorted_by = sorted_by
+        self.calls = []
+        self.cursors = []
+        self.fail_writes = 0
+        self.gate = None
+        self._ids = itertools.count(1)
+
+    def calls_to(self, name):
+        return [args for called, args in self.calls if called == name]
+
+    async def io(self, write=False):
+        await asyncio.sleep(0)
+        if self.gate:
+            await self.gate.wait()
+        if write and self.fail_writes:
+            self.fail_writes -= 1
+            raise ConnectionError('mongo down')
+
+    def with_options(self, **kwargs):
+        return self
+
+    def _duplicate(self, doc):
+        return any(key in doc and any(other.get(key) == doc[key] for other in self.docs) for key in self.unique)
+
+    def _store(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault('_id', next(self._ids))
+        if self._duplicate(doc):
+            raise DuplicateKeyError('E11000 duplicate key error')
+        self.docs.append(doc)
+        return doc
+
+    def find(self, query=None, projection=None):
+        self.calls.append(('find', (query, projection)))
+        cursor = FakeCursor(self, query or {}, projection)
+        self.cursors.append(cursor)
+        return cursor
+
+    async def find_one(self, query=None, projection=None):
+        await self.io()
+        self.calls.append(('find_one', (query, projection)))
+        return next(FakeCursor(self, query or {}, projection)._documents(), None)
+
+    async def count_documents(self, query):
+        await self.io()
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def insert_one(self, doc):
+        await self.io(write=True)
+        self.calls.append(('insert_one', (doc,)))
+        return Result(inserted_id=self._store(doc)['_id'])
+
+    async def insert_many(self, docs, ordered=True):
+        docs = list(docs)
+        await self.io(write=True)
+        self.calls.append(('insert_many', (docs,)))
+        inserted, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                inserted.append(self._store(doc)['_id'])
+            except DuplicateKeyError:
+                errors.append({'index': index, 'code': 11000})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({'nInserted': len(inserted), 'writeErrors': errors})
+        return Result(inserted_ids=inserted)
+
+    def _upsert(self, query, update):
+        doc = {field: value for field, value in query.items() if not field.startswith('$') and not isinstance(value, dict)}
+        apply_update(doc, update, inserting=True)
+        return self._store(doc)
+
+    async def update_one(self, query, update, upsert=False, array_filters=()):
+        await self.io(write=True)
+        self.calls.append(('update_one', (query, update)))
+        return self._update_one(query, update, upsert, array_filters)
+
+    def _update_one(self, query, update, upsert=False, array_filters=()):
+        for doc in self.docs:
+            if matches(doc, query):
+                before = copy.deepcopy(doc)
+                apply_update(doc, update, array_filters or ())
+                return Result(matched_count=1, modified_count=int(doc != before), upserted_id=None)
+        if upsert:
+            return Result(matched_count=0, modified_count=0, upserted_id=self._upsert(query, update)['_id'])
+        return Result(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query, update):
+        await self.io(write=True)
+        self.calls.append(('update_many', (query, update)))
+        modified = 0
+        for doc in self.docs:
+            if matches(doc, query):
+                before = copy.deepcopy(doc)
+                apply_update(doc, update)
+                modified += doc != before
+        return Result(matched_count=modified, modified_count=modified)
+
+    async def find_one_and_update(self, query, update, projection=None, sort=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE):
+        await self.io(write=True)
+        self.calls.append(('find_one_and_update', (query, update)))
+        candidates = [doc for doc in self.docs if matches(doc, query)]
+        for field, direction in reversed(sort or []):
+            candidates.sort(key=lambda doc: _sort_key(doc, field), reverse=direction < 0)
+        if not candidates:
+            if not upsert:
+                return None
+            doc = self._upsert(query, update)
+            return project(doc, projection) if return_document == ReturnDocument.AFTER else None
+        doc = candidates[0]
+        before = project(doc, projection)
+        apply_update(doc, update)
+        return project(doc, projection) if return_document == ReturnDocument.AFTER else before
+
+    async def delete_many(self, query):
+        await self.io(write=True)
+        self.calls.append(('delete_many', (query,)))
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted, self.docs = len(self.docs) - len(kept), kept
+        return Result(deleted_count=deleted)
+
+    async def bulk_write(self, requests, ordered=True):
+        """UpdateOne requests only - the bulk writes in the backend are all updates"""
+        requests = list(requests)
+        await self.io(write=True)
+        self.calls.append(('bulk_write', (requests,)))
+        modified = 0
+        for request in requests:
+            modified += self._update_one(
+                request._filter, request._doc, request._upsert, request._array_filters
+            ).modified_count
+        return Result(modified_count=modified)
+
+
+class FakeDB:
+    """Collections are created on first access, like db.<name> on a motor database"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self.collections.setdefault(name, FakeCollection())
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+@pytest.fixture
+def fake_db():
+    return FakeDB()
+
+
+@pytest.fixture
+def fake_collection():
+    """FakeCollection factory: fake_collection(docs, unique=..., sorted_by=...)"""
+    return FakeCollection
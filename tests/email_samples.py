@@ -0,0 +1,28 @@
+# Representative parameters for every email template
+SAMPLE_PARAMS = {
+    'booking_customer': {
+        'pnr': 'F380AB',
+        'flight': {
+            'from': 'LHR', 'to': 'DXB', 'airline': 'Emirates', 'airline_code': 'EK', 'stops': 0, 'is_direct': True,
+            'departure_time': '2026-06-01T09:40:00', 'arrival_time': '2026-06-01T19:45:00', 'duration': 'PT7H5M',
+            'return_departure_time': '2026-06-15T03:10:00', 'return_arrival_time': '2026-06-15T07:20:00',
+            'return_duration': 'PT7H10M', 'return_stops': 0, 'return_is_direct': True
+        },
+        'passengers': [
+            {'title': 'Mr', 'first_name': 'Adam', 'last_name': 'Khan', 'type': 'adult'},
+            {'title': 'Mrs', 'first_name': 'Sara', 'last_name': 'Khan', 'type': 'adult'}
+        ],
+        'contact': {'email': 'adam@example.com', 'phone': '07700 900000'},
+        'total_price': 1234.5,
+        'currency': 'GBP',
+        'booked_at': '2026-05-01T12:00:00+00:00'
+    },
+    'contact_company': {
+        'first_name': 'Adam', 'last_name': 'Khan', 'email': 'adam@example.com', 'phone': None,
+        'subject': 'Baggage', 'booking_reference': 'F380AB', 'message': 'Hello\nCan I add a bag?',
+        'contact_id': '5b0c', 'submitted_at': '2026-05-01T12:00:00+00:00'
+    },
+    'password_reset': {'name': 'Adam', 'reset_url': 'https://flight380.co.uk/reset-password?token=abc'}
+}
+SAMPLE_PARAMS['booking_agent'] = SAMPLE_PARAMS['booking_customer']
+SAMPLE_PARAMS['contact_customer'] = SAMPLE_PARAMS['contact_company']
@@ -0,0 +1,72 @@
+import pytest
+
+from airline_filter import (
+    AMADEUS_MAX_AIRLINE_CODES, airline_search_kwargs, amadeus_airline_params, flight_matches_airlines,
+    invalid_airline_response, parse_airline_filter
+)
+
+
+def amadeus_params(airline=None, airlines=None, excluded=None):
+    """What the search endpoints send Amadeus for these preferences"""
+    kwargs = airline_search_kwargs(parse_airline_filter(airline, airlines, excluded))
+    return amadeus_airline_params(kwargs.get('included_airlines'), kwargs.get('excluded_airlines'))
+
+
+def flight(*carriers, returning=()):
+    return {
+        'segments': [{'carrier': carrier} for carrier in carriers],
+        'return_segments': [{'carrier': carrier} for carrier in returning]
+    }
+
+
+def test_comma_separated_codes_are_normalised():
+    airline_filter = parse_airline_filter('BA, ek', None, None)
+    assert airline_filter['included'] == ['BA', 'EK']
+    assert invalid_airline_response(airline_filter) is None
+
+
+def test_single_code_and_list_combine():
+    assert parse_airline_filter('qr', ['EK', ' ba '], None)['included'] == ['BA', 'EK', 'QR']
+
+
+@pytest.mark.parametrize('airline, excluded, invalid', [
+    ('BAW', None, ['BAW']),
+    ('B', None, ['B']),
+    ('E-', None, ['E-']),
+    (None, ['EK', 'emirates'], ['EMIRATES'])
+])
+def test_invalid_codes_are_rejected(airline, excluded, invalid):
+    response = invalid_airline_response(parse_airline_filter(airline, None, excluded))
+    assert response['success'] is False
+    assert response['error']['code'] == 'INVALID_AIRLINE'
+    assert response['error']['invalid_codes'] == invalid
+
+
+def test_excluding_every_included_airline_is_rejected():
+    response = invalid_airline_response(parse_airline_filter('BA', None, ['ba']))
+    assert response['error']['message'] == 'Every selected airline is also excluded'
+
+
+def test_filter_reaches_the_amadeus_query():
+    assert amadeus_params('BA, ek') == {'includedAirlineCodes': 'BA,EK'}
+    assert amadeus_params(excluded=['FR', 'U2']) == {'excludedAirlineCodes': 'FR,U2'}
+    # Amadeus takes one list, so exclusions are folded into the inclusions
+    assert amadeus_params('BA,EK,QR', excluded=['EK']) == {'includedAirlineCodes': 'BA,QR'}
+    assert amadeus_params() == {}
+
+
+def test_long_lists_are_filtered_after_the_search():
+    codes = [f'{a}{b}' for a in 'ABCDEFGHIJ' for b in 'ABCDEFGHIJK'][:AMADEUS_MAX_AIRLINE_CODES + 1]
+    airline_filter = parse_airline_filter(None, codes, None)
+    assert airline_search_kwargs(airline_filter) == {}
+    assert flight_matches_airlines(flight('AA'), airline_filter)
+    assert not flight_matches_airlines(flight('ZZ'), airline_filter)
+
+
+def test_every_segment_must_match():
+    included = parse_airline_filter('BA', None, None)
+    assert flight_matches_airlines(flight('BA', returning=['BA']), included)
+    assert not flight_matches_airlines(flight('BA', returning=['IB']), included)
+    excluded = parse_airline_filter(None, None, ['FR'])
+    assert flight_matches_airlines(flight('BA'), excluded)
+    assert not flight_matches_airlines(flight('BA', 'FR'), excluded)
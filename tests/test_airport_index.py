@@ -0,0 +1,61 @@
+import pytest
+
+from airport_index import AirportIndex
+
+
+@pytest.fixture(scope='module')
+def index():
+    return AirportIndex()
+
+
+def test_resolve_known_airports(index):
+    resolved = index.resolve_codes(['lhr', 'LGW'])
+    assert resolved['codes'] == ['LHR', 'LGW']
+    assert resolved['invalid'] == []
+
+
+def test_resolve_city_code_searches_every_airport(index):
+    resolved = index.resolve_codes(['LON'])
+    assert resolved['codes'] == ['LON']
+    assert {'LHR', 'LGW', 'STN'} <= set(resolved['airports'])
+
+
+def test_resolve_accepts_regional_airports(index):
+    # The bundled data covers every IATA airport, not just the busiest
+    for code in ('JER', 'GCI', 'NQY'):
+        resolved = index.resolve_codes([code])
+        assert resolved['codes'] == [code]
+        assert resolved['airports'] == [code]
+        assert resolved['invalid'] == []
+
+
+def test_resolve_metro_areas_outside_the_curated_cities(index):
+    resolved = index.resolve_codes(['CHI'])
+    assert resolved['codes'] == ['CHI']
+    assert set(resolved['airports']) == {'ORD', 'MDW'}
+
+
+def test_resolve_rejects_unknown_codes_with_suggestions(index):
+    resolved = index.resolve_codes(['LHX', 'LGW'])
+    assert resolved['codes'] == ['LGW']
+    assert resolved['airports'] == ['LGW']
+    assert resolved['invalid'] == ['LHX']
+    assert 'LHR' in resolved['suggestions']['LHX']
+
+
+def test_resolve_rejects_malformed_codes(index):
+    resolved = index.resolve_codes(['J3R', 'LHRX', ''])
+    assert resolved['codes'] == []
+    assert resolved['invalid'] == ['J3R', 'LHRX', '']
+
+
+def test_search_lists_each_code_once(index):
+    for keyword in ('dxb', 'bkk', 'dubai', 'london'):
+        codes = [location['iataCode'] for location in index.search(keyword)]
+        assert len(codes) == len(set(codes)), keyword
+    assert [location['subType'] for location in index.search('dxb')] == ['AIRPORT']
+
+
+def test_search_keeps_metro_city_entries(index):
+    first = index.search('london')[0]
+    assert (first['subType'], first['iataCode']) == ('CITY', 'LON')
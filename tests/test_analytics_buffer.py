@@ -0,0 +1,103 @@
+import asyncio
+
+from analytics_buffer import AnalyticsBuffer
+
+
+def batches(collection):
+    return [len(docs) for docs, in collection.calls_to('insert_many')]
+
+
+def test_flushes_in_batches_of_flush_size(fake_collection):
+    async def main():
+        collection = fake_collection()
+        buffer = AnalyticsBuffer(collection, flush_size=10)
+        for n in range(25):
+            assert await buffer.add({'n': n})
+        await buffer.flush()
+        return collection, buffer
+    collection, buffer = asyncio.run(main())
+    assert batches(collection) == [10, 10, 5]
+    assert buffer.get_stats()['written'] == 25 and buffer.get_stats()['pending'] == 0
+
+
+def test_background_flush_starts_at_flush_size(fake_collection):
+    async def main():
+        collection = fake_collection()
+        buffer = AnalyticsBuffer(collection, flush_size=5, flush_seconds=60)
+        buffer.start()
+        for n in range(7):
+            await buffer.add({'n': n})
+        await asyncio.sleep(0.01)
+        flushed_early = sum(batches(collection))
+        await buffer.stop()
+        return collection, flushed_early
+    collection, flushed_early = asyncio.run(main())
+    # Reaching flush_size wakes the flusher, which writes everything buffered by then
+    assert flushed_early == 7
+    assert batches(collection) == [5, 2]
+
+
+def test_stop_writes_what_is_left(fake_collection):
+    async def main():
+        collection = fake_collection()
+        buffer = AnalyticsBuffer(collection, flush_size=50, flush_seconds=60)
+        buffer.start()
+        for n in range(3):
+            await buffer.add({'n': n})
+        await buffer.stop()
+        return collection
+    assert batches(asyncio.run(main())) == [3]
+
+
+def test_failed_batches_are_kept_for_the_next_flush(fake_collection):
+    async def main():
+        collection = fake_collection()
+        collection.fail_writes = 1
+        buffer = AnalyticsBuffer(collection, flush_size=10)
+        for n in range(4):
+            await buffer.add({'n': n})
+        await buffer.flush()
+        assert buffer.get_stats()['pending'] == 4
+        await buffer.flush()
+        return collection, buffer
+    collection, buffer = asyncio.run(main())
+    assert batches(collection) == [4]
+    assert buffer.get_stats()['write_errors'] == 1 and buffer.get_stats()['dropped'] == 0
+
+
+def test_rejected_documents_are_not_retried(fake_collection):
+    # One event collides with a document already stored
+    collection = fake_collection([{'n': 1}], unique=('n',))
+
+    async def main():
+        buffer = AnalyticsBuffer(collection, flush_size=10)
+        for n in range(3):
+            await buffer.add({'n': n})
+        await buffer.flush()
+        return buffer.get_stats()
+    stats = asyncio.run(main())
+    assert stats['written'] == 2 and stats['dropped'] == 1 and stats['pending'] == 0
+
+
+def test_backpressure_waits_for_room_then_drops(monkeypatch, fake_collection):
+    monkeypatch.setattr('analytics_buffer.BACKPRESSURE_TIMEOUT', 0.05)
+
+    async def main():
+        block = asyncio.Event()
+        collection = fake_collection()
+        collection.gate = block
+        buffer = AnalyticsBuffer(collection, flush_size=2, flush_seconds=60, max_buffered=4)
+        buffer.start()
+        for n in range(4):
+            assert await buffer.add({'n': n})
+        # The flush is stuck on a slow write, so the buffer stays full
+        dropped = not await buffer.add({'n': 4})
+        block.set()
+        await asyncio.sleep(0.01)
+        accepted = await buffer.add({'n': 5})
+        await buffer.stop()
+        return buffer.get_stats(), dropped, accepted
+    stats, dropped, accepted = asyncio.run(main())
+    assert dropped and accepted
+    assert stats['backpressure_waits'] == 1 and stats['dropped'] == 1
+    assert stats['written'] == 5
@@ -0,0 +1,120 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+from datetime import date
+
+from booking_export import CSV_COLUMNS, CSV_PROJECTION, NDJSON_PROJECTION, csv_row, export_bookings, export_query
+
+
+def booking(n):
+    return {
+        'id': f'id{n}', 'pnr': f'P{n:05d}', 'status': 'CONFIRMED', 'created_at': f'2026-01-01T{n // 3600:02d}:{n // 60 % 60:02d}:{n % 60:02d}+00:00',
+        'total_price': 123.4, 'currency': 'GBP', 'contact': {'email': 'a@example.com', 'phone': '07700 900000'},
+        'passengers': [{'first_name': 'Adam', 'last_name': 'Lee, "Jr"'}, {'first_name': 'Sara', 'last_name': 'Lee'}],
+        'flight_data': {'from': 'LHR', 'to': 'DXB', 'airline': 'EK', 'departure_time': '2026-06-01T09:40:00'},
+        'flight_id': 'f1', 'outbox': [{'id': 'x'}]
+    }
+
+
+class Bookings:
+    """count bookings in (created_at, id) order, generated as they are read"""
+
+    def __init__(self, count):
+        self.count = count
+
+    def __iter__(self):
+        return (booking(n) for n in range(self.count))
+
+
+def bookings(fake_collection, count):
+    # Stored in export order, as the bookings index serves them
+    return fake_collection(Bookings(count), sorted_by=[('created_at', 1), ('id', 1)])
+
+
+def export(collection, fmt='csv', use_gzip=False):
+    async def main():
+        chunks = [chunk async for chunk in export_bookings(collection, {}, fmt, use_gzip)]
+        return collection, b''.join(chunks)
+    return asyncio.run(main())
+
+
+def test_csv_export(fake_collection):
+    collection, data = export(bookings(fake_collection, 3))
+    rows = list(csv.reader(io.StringIO(data.decode())))
+    assert rows[0] == [header for header, _ in CSV_COLUMNS]
+    assert len(rows) == 4
+    row = dict(zip(rows[0], rows[1]))
+    assert row['pnr'] == 'P00000' and row['contact_email'] == 'a@example.com'
+    assert row['lead_passenger'] == 'Adam Lee, "Jr"' and row['passengers'] == '2'
+    assert row['from'] == 'LHR' and row['return_departure_time'] == ''
+    cursor, = collection.cursors
+    assert cursor.projection is CSV_PROJECTION
+    assert cursor.sort_keys == [('created_at', 1), ('id', 1)]
+    assert cursor.closed
+
+
+def test_gzipped_ndjson_export(fake_collection):
+    collection, data = export(bookings(fake_collection, 5), 'ndjson', use_gzip=True)
+    assert collection.cursors[0].projection is NDJSON_PROJECTION
+    lines = gzip.decompress(data).decode().splitlines()
+    assert [json.loads(line)['pnr'] for line in lines] == [f'P{n:05d}' for n in range(5)]
+    assert 'outbox' not in json.loads(lines[0])
+
+
+def test_gzip_stream_matches_plain_export(fake_collection):
+    _, plain = export(bookings(fake_collection, 2000))
+    _, compressed = export(bookings(fake_collection, 2000), use_gzip=True)
+    assert gzip.decompress(compressed) == plain
+    assert len(compressed) < len(plain) / 5
+
+
+def test_memory_does_not_grow_with_export_size(fake_collection):
+    def peak(count):
+        async def main():
+            tracemalloc.start()
+            async for _ in export_bookings(bookings(fake_collection, count), {}, 'csv', True):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+        return asyncio.run(main())
+
+    small, large = peak(500), peak(10000)
+    assert large < small * 1.5
+
+
+def test_cursor_closed_when_client_disconnects(fake_collection):
+    async def main():
+        collection = bookings(fake_collection, 50000)
+        stream = export_bookings(collection, {}, 'csv')
+        await stream.__anext__()
+        await stream.aclose()
+        return collection.cursors[0].closed
+    assert asyncio.run(main())
+
+
+def test_formula_cells_are_neutralised():
+    doc = booking(1)
+    doc['passengers'][0] = {'first_name': '=HYPERLINK("http://evil")', 'last_name': ''}
+    doc['contact'] = {'email': '@SUM(A1)', 'phone': '+44 7700 900000'}
+    doc['flight_data']['airline'] = '-2+3'
+    doc['flight_id'] = '\tcmd'
+    doc['total_price'] = -12.5
+    row = dict(zip([header for header, _ in CSV_COLUMNS], csv_row(doc)))
+    assert row['lead_passenger'] == '\'=HYPERLINK("http://evil")'
+    assert row['contact_email'] == "'@SUM(A1)"
+    assert row['contact_phone'] == "'+44 7700 900000"
+    assert row['airline'] == "'-2+3"
+    assert row['flight_id'] == "'\tcmd"
+    assert row['total_price'] == -12.5 and row['pnr'] == 'P00001'
+
+
+def test_export_query():
+    assert export_query() == {}
+    assert export_query(date(2026, 1, 1), date(2026, 1, 31), ['CONFIRMED', 'CANCELLED']) == {
+        'created_at': {'$gte': '2026-01-01', '$lt': '2026-02-01'},
+        'status': {'$in': ['CONFIRMED', 'CANCELLED']}
+    }
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from booking_outbox import BookingOutbox, email_intents
+from email_templates import EmailTemplates
+from mail_service import MailQueue
+from tests.email_samples import SAMPLE_PARAMS
+
+
+def email_params(booking, recipient):
+    if booking.get('broken'):
+        raise KeyError('flight_data')
+    template_id = 'booking_customer' if recipient == 'customer' else 'booking_agent'
+    return template_id, {**SAMPLE_PARAMS[template_id], 'pnr': booking['pnr']}
+
+
+def booking(n, **fields):
+    return {
+        'id': f'b{n}',
+        'pnr': f'P{n:05d}',
+        'created_at': f'2026-01-01T00:00:{n:02d}+00:00',
+        'outbox': email_intents([
+            ('customer_confirmation', 'customer', 'adam@example.com'),
+            ('agent_notification', 'agent', 'info@flight380.co.uk')
+        ]),
+        **fields
+    }
+
+
+@pytest.fixture
+def outbox(fake_db):
+    # As created by db_indexes: queue documents are unique by ID
+    fake_db.mail_queue.unique.append('id')
+    templates = EmailTemplates()
+    templates.load()
+    mail_queue = MailQueue(fake_db, None, 'noreply@flight380.co.uk', templates)
+    return BookingOutbox(fake_db, mail_queue, email_params, batch_size=10)
+
+
+def statuses(db):
+    return [[intent['status'] for intent in booking['outbox']] for booking in db.bookings.docs]
+
+
+def test_pending_intents_are_queued_once_and_marked(fake_db, outbox):
+    asyncio.run(fake_db.bookings.insert_many([booking(n) for n in range(3)]))
+    assert asyncio.run(outbox.dispatch_batch()) == 3
+    assert asyncio.run(outbox.dispatch_batch()) == 0
+
+    queued = fake_db.mail_queue.docs
+    intents = [intent for booking in fake_db.bookings.docs for intent in booking['outbox']]
+    assert sorted(message['id'] for message in queued) == sorted(intent['id'] for intent in intents)
+    assert statuses(fake_db) == [['QUEUED', 'QUEUED']] * 3
+    assert all(intent['queued_at'] for intent in intents)
+
+    message = next(m for m in queued if m['type'] == 'customer_confirmation' and m['pnr'] == 'P00001')
+    assert message['template'] == 'booking_customer' and message['to'] == 'adam@example.com'
+    assert message['subject'] == 'Flight380 - Booking Confirmation - PNR: P00001'
+    assert outbox.get_stats()['queued'] == 6 and outbox.get_stats()['batches'] == 1
+
+
+def test_relaying_again_after_a_crash_does_not_send_twice(fake_db, outbox):
+    asyncio.run(fake_db.bookings.insert_many([booking(n) for n in range(2)]))
+    # Messages are queued, then the worker dies before the intents are marked
+    fake_db.bookings.fail_writes = 1
+    with pytest.raises(ConnectionError):
+        asyncio.run(outbox.dispatch_batch())
+    assert len(fake_db.mail_queue.docs) == 4
+    assert statuses(fake_db) == [['PENDING', 'PENDING']] * 2
+
+    assert asyncio.run(outbox.dispatch_batch()) == 2
+    assert len(fake_db.mail_queue.docs) == 4
+    assert statuses(fake_db) == [['QUEUED', 'QUEUED']] * 2
+
+
+def test_only_pending_intents_are_relayed(fake_db, outbox):
+    partly_sent = booking(1)
+    partly_sent['outbox'][0]['status'] = 'QUEUED'
+    asyncio.run(fake_db.bookings.insert_one(partly_sent))
+    asyncio.run(outbox.dispatch_batch())
+    message, = fake_db.mail_queue.docs
+    assert message['id'] == partly_sent['outbox'][1]['id']
+
+
+def test_malformed_booking_does_not_block_the_batch(fake_db, outbox):
+    asyncio.run(fake_db.bookings.insert_many([booking(1), booking(2, broken=True), booking(3)]))
+    assert asyncio.run(outbox.dispatch_batch()) == 3
+    assert statuses(fake_db) == [['QUEUED', 'QUEUED'], ['FAILED', 'FAILED'], ['QUEUED', 'QUEUED']]
+    assert {message['pnr'] for message in fake_db.mail_queue.docs} == {'P00001', 'P00003'}
+    assert outbox.get_stats()['failures'] == 1
+
+
+def test_batches_are_oldest_first_and_bounded(fake_db, outbox):
+    asyncio.run(fake_db.bookings.insert_many([booking(n) for n in reversed(range(15))]))
+    assert asyncio.run(outbox.dispatch_batch()) == 10
+    assert {message['pnr'] for message in fake_db.mail_queue.docs} == {f'P{n:05d}' for n in range(10)}
+    assert asyncio.run(outbox.dispatch_batch()) == 5
@@ -0,0 +1,60 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from booking_pages import BOOKINGS_PAGE_MAX, bookings_page, decode_booking_cursor, encode_booking_cursor
+
+
+def bookings(count):
+    # Several bookings share each created_at, so the id tiebreaker matters
+    return [
+        {'id': f'{n:05d}', 'pnr': f'P{n:05d}', 'created_at': f'2026-01-01T00:00:{n // 4:02d}+00:00',
+         'status': 'CONFIRMED', 'passengers': [{'first_name': 'A'}], 'outbox': []}
+        for n in range(count)
+    ]
+
+
+def test_pages_cover_every_booking_once_newest_first(fake_collection):
+    collection = fake_collection(bookings(57))
+    seen, cursor = [], None
+    while True:
+        page = asyncio.run(bookings_page(collection, 10, cursor))
+        seen.extend(booking['id'] for booking in page['bookings'])
+        if not page['has_more']:
+            assert page['next_cursor'] is None
+            break
+        cursor = page['next_cursor']
+    assert seen == [f'{n:05d}' for n in reversed(range(57))]
+
+
+def test_pages_are_summaries(fake_collection):
+    page = asyncio.run(bookings_page(fake_collection(bookings(3)), 5))
+    assert not page['has_more']
+    assert all('passengers' not in b and 'outbox' not in b and '_id' not in b for b in page['bookings'])
+
+
+def test_limit_is_clamped(fake_collection):
+    collection = fake_collection(bookings(150))
+    assert len(asyncio.run(bookings_page(collection, 1000))['bookings']) == BOOKINGS_PAGE_MAX
+    assert len(asyncio.run(bookings_page(collection, 0))['bookings']) == 1
+
+
+def test_cursor_round_trip():
+    cursor = encode_booking_cursor({'created_at': '2026-01-01T00:00:00+00:00', 'id': 'abc'})
+    assert decode_booking_cursor(cursor) == {'$or': [
+        {'created_at': {'$lt': '2026-01-01T00:00:00+00:00'}},
+        {'created_at': '2026-01-01T00:00:00+00:00', 'id': {'$lt': 'abc'}}
+    ]}
+
+
+@pytest.mark.parametrize('position', [
+    'not base64 !',
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+    base64.urlsafe_b64encode(json.dumps([{'$gt': ''}, 'abc']).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(['2026-01-01', 'abc', 'extra']).encode()).decode()
+])
+def test_malformed_cursors_are_rejected(position):
+    with pytest.raises(ValueError):
+        decode_booking_cursor(position)
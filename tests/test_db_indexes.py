@@ -0,0 +1,53 @@
+import asyncio
+
+from db_indexes import HOT_QUERIES, INDEXES, _stages, check_hot_queries
+
+
+def index_keys():
+    return {
+        collection: [[field for field, _ in index.document['key'].items()] for index in indexes]
+        for collection, indexes in INDEXES.items()
+    }
+
+
+def test_every_hot_query_leads_with_an_indexed_field():
+    keys = index_keys()
+    for collection, query, sort in HOT_QUERIES:
+        fields = [f for f in query if not f.startswith('$')] + [field for field, _ in sort or []]
+        assert any(index[0] in fields for index in keys[collection]), (collection, query, sort)
+
+
+def test_sorted_hot_queries_match_an_index_order():
+    # The sort has to follow the index after its equality-matched prefix, or MongoDB sorts in memory
+    def sort_order(index, query):
+        equality = {field for field, value in query.items() if not isinstance(value, dict)}
+        while index and index[0] in equality:
+            index = index[1:]
+        return index
+
+    keys = index_keys()
+    for collection, query, sort in HOT_QUERIES:
+        if sort:
+            sort_fields = [field for field, _ in sort]
+            assert any(
+                sort_order(index, query)[:len(sort_fields)] == sort_fields for index in keys[collection]
+            ), (collection, sort)
+
+
+def test_stages_walks_the_whole_plan():
+    plan = {'stage': 'FETCH', 'inputStage': {'stage': 'SORT_MERGE', 'inputStages': [
+        {'stage': 'IXSCAN'}, {'stage': 'COLLSCAN'}
+    ]}}
+    assert _stages(plan) == ['FETCH', 'SORT_MERGE', 'IXSCAN', 'COLLSCAN']
+
+
+def test_check_hot_queries_flags_collection_scans():
+    class FakeDB:
+        async def command(self, command):
+            collection = command['explain']['find']
+            stage = 'COLLSCAN' if collection == 'emails' else 'IXSCAN'
+            return {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': stage}}}}
+
+    results = asyncio.run(check_hot_queries(FakeDB()))
+    assert len(results) == len(HOT_QUERIES)
+    assert {r['collection'] for r in results if not r['indexed']} == {'emails'}
@@ -0,0 +1,62 @@
+import asyncio
+
+from email_archive import EmailArchive, compress_body, decompress_body
+from email_templates import EmailTemplates
+from mail_service import MailQueue
+from tests.email_samples import SAMPLE_PARAMS
+
+
+def archive(db, params=SAMPLE_PARAMS['booking_customer']):
+    templates = EmailTemplates()
+    templates.load()
+    mail_queue = MailQueue(db, None, 'noreply@flight380.co.uk', templates)
+    queued = mail_queue.template_message(
+        'adam@example.com', 'booking_customer', SAMPLE_PARAMS['booking_customer'], category='booking', pnr='F380AB'
+    )
+    queued['params'] = params
+    db.mail_queue.docs.append(queued)
+    db.emails.docs.append({'id': 'e1', 'pnr': 'F380AB', 'subject': 'Old confirmation', 'body_z': compress_body('Legacy body')})
+    return EmailArchive(db, mail_queue)
+
+
+def test_compression_round_trip():
+    body = 'Booking confirmation\n' * 200
+    data = compress_body(body)
+    assert len(data) < len(body) / 10
+    assert decompress_body(data) == body
+
+
+def test_summaries_leave_out_bodies_and_params(fake_db):
+    emails = asyncio.run(archive(fake_db).summaries({'pnr': 'F380AB'}))
+    assert [email.get('template') for email in emails] == [None, 'booking_customer']
+    assert emails[1]['subject'] == 'Flight380 - Booking Confirmation - PNR: F380AB'
+    for email in emails:
+        assert not {'_id', 'body', 'body_z', 'params', 'html_body', 'plain_body'} & set(email)
+
+
+def test_view_decompresses_legacy_and_renders_queued_emails(fake_db):
+    legacy, queued = asyncio.run(archive(fake_db).view({'pnr': 'F380AB'}))
+    assert legacy['body'] == 'Legacy body' and 'body_z' not in legacy
+    assert queued['subject'] == 'Flight380 - Booking Confirmation - PNR: F380AB'
+    assert 'F380AB' in queued['body']
+    assert queued['rendered_version'] == queued['template_version']
+    assert 'params' not in queued
+
+
+def test_view_lists_emails_that_fail_to_render(fake_db):
+    legacy, queued = asyncio.run(archive(fake_db, params={}).view({'pnr': 'F380AB'}))
+    assert legacy['body'] == 'Legacy body'
+    assert queued['subject'] == 'Flight380 - Booking Confirmation - PNR: F380AB'
+    assert queued['body'] is None and queued['render_error']
+
+
+def test_legacy_bodies_are_compressed_once(fake_db, monkeypatch):
+    monkeypatch.setattr('email_archive.COMPRESS_BATCH_SIZE', 2)
+    asyncio.run(fake_db.emails.insert_many([{'id': f'e{n}', 'pnr': 'F380AB', 'body': f'Body {n}'} for n in range(5)]))
+    archive = EmailArchive(fake_db, None)
+    assert asyncio.run(archive.compress_legacy()) == 5
+    assert all('body' not in email and decompress_body(email['body_z']).startswith('Body') for email in fake_db.emails.docs)
+    lease, = fake_db.job_leases.docs
+    assert lease['completed_at'] and 'lease_owner' not in lease
+    # Later startups find the pass complete and skip it
+    assert asyncio.run(archive.compress_legacy()) == 0
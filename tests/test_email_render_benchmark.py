@@ -0,0 +1,102 @@
+"""
+Render cost per email: precompiled templates vs the f-string builders they replaced
+
+Opt-in, as timings depend on the machine:
+
+    RUN_BENCHMARKS=1 python -m pytest -q tests/test_email_render_benchmark.py
+"""
+import os
+import timeit
+
+import pytest
+
+from email_templates import EmailTemplates, TEMPLATES
+from tests.email_samples import SAMPLE_PARAMS
+
+pytestmark = pytest.mark.skipif(not os.environ.get('RUN_BENCHMARKS'), reason='set RUN_BENCHMARKS=1 to run benchmarks')
+
+RENDERS = 2000
+
+
+def legacy_booking_email(params: dict) -> dict:
+    """The customer confirmation as server.py built it before templates, for comparison"""
+    pnr = params['pnr']
+    flight = params['flight']
+    passengers = params['passengers']
+    contact = params['contact']
+    passenger_list = "\n".join([
+        f"  - {p['title']} {p['first_name']} {p['last_name']} ({p['type']})"
+        for p in passengers
+    ])
+    outbound_info = f"""
+    From: {flight.get('from', 'N/A')} → To: {flight.get('to', 'N/A')}
+    Date: {flight.get('departure_time', 'N/A')[:10] if flight.get('departure_time') else 'N/A'}
+    Departure: {flight.get('departure_time', 'N/A')[11:16] if flight.get('departure_time') else 'N/A'}
+    Arrival: {flight.get('arrival_time', 'N/A')[11:16] if flight.get('arrival_time') else 'N/A'}
+    Duration: {flight.get('duration', 'N/A').replace('PT', '').replace('H', 'h ').replace('M', 'm')}
+    Airline: {flight.get('airline', 'N/A')} ({flight.get('airline_code', 'N/A')})
+    Stops: {'Direct' if flight.get('is_direct') else str(flight.get('stops', 0)) + ' stop(s)'}
+    """
+    return_info = ""
+    if flight.get('return_departure_time'):
+        return_info = f"""
+
+    RETURN FLIGHT:
+    From: {flight.get('to', 'N/A')} → To: {flight.get('from', 'N/A')}
+    Date: {flight.get('return_departure_time', 'N/A')[:10]}
+    Departure: {flight.get('return_departure_time', 'N/A')[11:16]}
+    Arrival: {flight.get('return_arrival_time', 'N/A')[11:16]}
+    Duration: {flight.get('return_duration', 'N/A').replace('PT', '').replace('H', 'h ').replace('M', 'm') if flight.get('return_duration') else 'N/A'}
+    Stops: {'Direct' if flight.get('return_is_direct') else str(flight.get('return_stops', 0)) + ' stop(s)'}
+    """
+    body = f"""
+Dear {passengers[0]['first_name']} {passengers[0]['last_name']},
+
+Thank you for booking with Flight380!
+
+BOOKING REFERENCE (PNR): {pnr}
+
+FLIGHT DETAILS:
+OUTBOUND FLIGHT:{outbound_info}{return_info}
+
+PASSENGERS:
+{passenger_list}
+
+TOTAL PRICE: £{params['total_price']:.2f} {params.get('currency', 'GBP')}
+
+CONTACT DETAILS:
+Email: {contact['email']}
+Phone: {contact['phone']}
+        """
+    return {"subject": f"Flight380 - Booking Confirmation - PNR: {pnr}", "body": body}
+
+
+def per_message_us(render) -> float:
+    return min(timeit.repeat(render, number=RENDERS, repeat=3)) / RENDERS * 1e6
+
+
+def test_render_cost_per_message(capsys):
+    templates = EmailTemplates()
+    templates.load()
+    params = SAMPLE_PARAMS['booking_customer']
+
+    def compiled_each_time():
+        fresh = EmailTemplates()
+        fresh.load()
+        return fresh.render('booking_customer', params)
+
+    costs = {
+        'f-string builder (before)': per_message_us(lambda: legacy_booking_email(params)),
+        'precompiled template': per_message_us(lambda: templates.render('booking_customer', params)),
+        'template compiled per message': min(timeit.repeat(compiled_each_time, number=20, repeat=3)) / 20 * 1e6
+    }
+    with capsys.disabled():
+        print(f"\nbooking_customer, per message ({RENDERS} renders, best of 3):")
+        for name, cost in costs.items():
+            print(f"  {name:32} {cost:9.1f} us")
+        for template_id in TEMPLATES:
+            cost = per_message_us(lambda: templates.render(template_id, SAMPLE_PARAMS[template_id]))
+            print(f"  {template_id:32} {cost:9.1f} us")
+
+    # Compiling once at startup is what keeps templates affordable in the mail worker
+    assert costs['precompiled template'] * 10 < costs['template compiled per message']
@@ -0,0 +1,41 @@
+import pytest
+
+from email_templates import EmailTemplates, TEMPLATES
+from tests.email_samples import SAMPLE_PARAMS
+
+
+@pytest.fixture(scope='module')
+def templates():
+    templates = EmailTemplates()
+    templates.load()
+    return templates
+
+
+def test_every_template_renders(templates):
+    for template_id in TEMPLATES:
+        rendered = templates.render(template_id, SAMPLE_PARAMS[template_id])
+        assert rendered['subject']
+        assert rendered['html_body'] or rendered['plain_body']
+
+
+def test_subjects_are_not_html_escaped(templates):
+    params = {**SAMPLE_PARAMS['contact_company'], 'subject': 'Refund & change', 'last_name': "O'Brien"}
+    rendered = templates.render('contact_company', params)
+    assert rendered['subject'] == "[Flight380 Contact] Refund & change - Adam O'Brien"
+
+    params = {**SAMPLE_PARAMS['booking_agent'], 'flight': {**SAMPLE_PARAMS['booking_agent']['flight'], 'from': 'A&B'}}
+    assert templates.render('booking_agent', params)['subject'] == 'New Booking - PNR: F380AB - A&B to DXB'
+
+
+def test_html_bodies_escape_customer_input(templates):
+    params = {**SAMPLE_PARAMS['contact_company'], 'message': '<script>x</script>\nO\'Brien & co'}
+    html = templates.render('contact_company', params)['html_body']
+    assert '<script>' not in html
+    assert '&lt;script&gt;x&lt;/script&gt;<br>O&#39;Brien &amp; co' in html
+
+
+def test_plain_bodies_are_not_escaped(templates):
+    params = {**SAMPLE_PARAMS['booking_customer'], 'passengers': [
+        {'title': 'Mr', 'first_name': 'Adam', 'last_name': "O'Brien", 'type': 'adult'}
+    ]}
+    assert "O'Brien" in templates.render('booking_customer', params)['plain_body']
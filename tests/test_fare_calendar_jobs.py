@@ -0,0 +1,76 @@
+import asyncio
+
+from fare_calendar_jobs import FareCalendarJobs
+
+
+async def collect(jobs, job_id):
+    return [event async for event in jobs.events(job_id)]
+
+
+def test_identical_jobs_are_deduplicated():
+    async def run():
+        jobs = FareCalendarJobs()
+        release = asyncio.Event()
+
+        async def build(emit):
+            await release.wait()
+            return {}
+
+        first, deduplicated = jobs.start(('LHR', 'DXB'), build)
+        assert not deduplicated
+        second, deduplicated = jobs.start(('LHR', 'DXB'), build)
+        assert deduplicated and second is first
+        release.set()
+        await asyncio.gather(*jobs._tasks)
+        assert jobs.get_stats()['completed'] == 1
+
+    asyncio.run(run())
+
+
+def test_subscribers_get_fares_then_done():
+    async def run():
+        jobs = FareCalendarJobs()
+        release = asyncio.Event()
+
+        async def build(emit):
+            await release.wait()
+            emit('2026-11-01', 120.0)
+            emit('2026-11-02', 95.0)
+            return {'currency': 'EUR'}
+
+        job, _ = jobs.start(('LHR', 'DXB'), build)
+        listener = asyncio.create_task(collect(jobs, job['id']))
+        await asyncio.sleep(0)
+        release.set()
+        events = await listener
+        assert [event['type'] for event in events] == ['snapshot', 'fare', 'fare', 'done']
+        assert events[-1]['status'] == 'complete'
+        assert events[-1]['data'] == {'2026-11-01': 120.0, '2026-11-02': 95.0}
+        assert not jobs._tasks
+
+    asyncio.run(run())
+
+
+def test_finished_jobs_still_end_with_done():
+    async def run():
+        jobs = FareCalendarJobs()
+
+        async def build(emit):
+            emit('2026-11-01', 120.0)
+            return {}
+
+        async def broken(emit):
+            raise RuntimeError('amadeus down')
+
+        done, _ = jobs.start(('LHR', 'DXB'), build)
+        failed, _ = jobs.start(('LHR', 'JFK'), broken)
+        await asyncio.gather(*jobs._tasks)
+
+        events = await collect(jobs, done['id'])
+        assert [event['type'] for event in events] == ['snapshot', 'done']
+        assert events[-1]['status'] == 'complete'
+        events = await collect(jobs, failed['id'])
+        assert [event['type'] for event in events] == ['snapshot', 'done']
+        assert events[-1]['status'] == 'failed'
+
+    asyncio.run(run())
@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from itinerary_combiner import combine_itineraries, combine_split_tickets, MAX_EXPANSIONS, MIN_LEG_GAP_MINUTES
+
+
+def synthetic_legs(leg_count, flights_per_leg, rng):
+    base = datetime(2026, 6, 1, 6, 0)
+    legs = []
+    for leg in range(leg_count):
+        flights = []
+        for n in range(flights_per_leg):
+            departure = base + timedelta(days=2 * leg, minutes=rng.randint(-36 * 60, 36 * 60))
+            arrival = departure + timedelta(minutes=rng.randint(60, 14 * 60))
+            flights.append({
+                'id': f'{leg}-{n}',
+                'departure_time': departure.isoformat(),
+                'arrival_time': arrival.isoformat(),
+                'price': round(rng.uniform(40, 900), 2),
+                'currency': 'GBP'
+            })
+        legs.append(flights)
+    return legs
+
+
+def brute_force(legs, k, min_gap_minutes=MIN_LEG_GAP_MINUTES):
+    gap = timedelta(minutes=min_gap_minutes)
+    totals = []
+    for combination in itertools.product(*legs):
+        if all(
+            datetime.fromisoformat(combination[i + 1]['departure_time'])
+            >= datetime.fromisoformat(combination[i]['arrival_time']) + gap
+            for i in range(len(combination) - 1)
+        ):
+            totals.append(round(sum(f['price'] for f in combination), 2))
+    return sorted(totals)[:k]
+
+
+def chained_best(legs, k, min_gap_minutes=MIN_LEG_GAP_MINUTES):
+    """
+    Exact K cheapest totals without the cross product: legs only constrain their
+    neighbours, so keep the K cheapest partial totals ending at each flight
+    """
+    gap = timedelta(minutes=min_gap_minutes)
+    times = [[(datetime.fromisoformat(f['departure_time']), datetime.fromisoformat(f['arrival_time'])) for f in leg]
+             for leg in legs]
+    best = [[f['price']] for f in legs[0]]
+    for leg in range(1, len(legs)):
+        best = [
+            heapq.nsmallest(k, (total + flight['price']
+                                for previous, totals in enumerate(best)
+                                if times[leg][n][0] >= times[leg - 1][previous][1] + gap
+                                for total in totals))
+            for n, flight in enumerate(legs[leg])
+        ]
+    return [round(total, 2) for total in heapq.nsmallest(k, itertools.chain.from_iterable(best))]
+
+
+def counting_pops(monkeypatch):
+    pops = []
+    heappop = heapq.heappop
+
+    def counted(heap):
+        pops.append(1)
+        return heappop(heap)
+    monkeypatch.setattr('itinerary_combiner.heapq.heappop', counted)
+    return pops
+
+
+def test_matches_brute_force():
+    rng = random.Random(380)
+    for leg_count in (2, 3, 4):
+        for _ in range(20):
+            legs = synthetic_legs(leg_count, 8, rng)
+            itineraries = combine_itineraries(legs, k=15)
+            assert [i['total_price'] for i in itineraries] == brute_force(legs, 15)
+
+
+@pytest.mark.parametrize('leg_count, flights_per_leg', [(3, 50), (5, 50)])
+def test_large_searches_finish_well_within_the_expansion_cap(monkeypatch, leg_count, flights_per_leg):
+    rng = random.Random(leg_count)
+    legs = synthetic_legs(leg_count, flights_per_leg, rng)
+    pops = counting_pops(monkeypatch)
+    itineraries = combine_itineraries(legs, k=20)
+    assert [i['total_price'] for i in itineraries] == chained_best(legs, 20)
+    assert len(itineraries) == 20
+    assert len(pops) < MAX_EXPANSIONS / 10
+
+
+def test_chained_reference_agrees_with_brute_force():
+    legs = synthetic_legs(3, 50, random.Random(3))
+    assert chained_best(legs, 20) == brute_force(legs, 20)
+
+
+@pytest.mark.skipif(not os.environ.get('RUN_BENCHMARKS'), reason='set RUN_BENCHMARKS=1 to run benchmarks')
+@pytest.mark.parametrize('leg_count, flights_per_leg', [(3, 50), (5, 20), (5, 50)])
+def test_heap_merge_runtime_against_the_cross_product(capsys, leg_count, flights_per_leg):
+    legs = synthetic_legs(leg_count, flights_per_leg, random.Random(leg_count))
+    started = time.perf_counter()
+    itineraries = combine_itineraries(legs, k=20)
+    merged = time.perf_counter() - started
+    combinations = flights_per_leg ** leg_count
+    with capsys.disabled():
+        print(f"\n{leg_count} legs x {flights_per_leg} flights: heap merge {merged * 1000:.1f} ms", end='')
+        # 50^5 combinations would take minutes in pure Python; report the size instead
+        if combinations <= 5_000_000:
+            started = time.perf_counter()
+            assert [i['total_price'] for i in itineraries] == brute_force(legs, 20)
+            print(f", cross product of {combinations:,} {time.perf_counter() - started:.2f} s")
+        else:
+            print(f", cross product of {combinations:,} not run")
+
+
+def test_itineraries_respect_the_connection_gap():
+    rng = random.Random(1)
+    legs = synthetic_legs(3, 12, rng)
+    for itinerary in combine_itineraries(legs, k=20, min_gap_minutes=180):
+        for earlier, later in zip(itinerary['legs'], itinerary['legs'][1:]):
+            gap = datetime.fromisoformat(later['departure_time']) - datetime.fromisoformat(earlier['arrival_time'])
+            assert gap >= timedelta(minutes=180)
+
+
+def test_empty_or_infeasible_legs_give_nothing():
+    flight = {'id': 'a', 'departure_time': '2026-06-01T10:00:00', 'arrival_time': '2026-06-01T12:00:00', 'price': 50}
+    early = {'id': 'b', 'departure_time': '2026-06-01T11:00:00', 'arrival_time': '2026-06-01T13:00:00', 'price': 50}
+    assert combine_itineraries([[flight], []]) == []
+    assert combine_itineraries([[flight], [early]]) == []
+
+
+def test_split_tickets_have_round_trip_shape():
+    outbound = {'id': 'o1', 'departure_time': '2026-06-01T10:00:00', 'arrival_time': '2026-06-01T18:00:00',
+                'price': 120.0, 'airline': 'EK', 'number_of_bookable_seats': 4, 'raw_data': {'id': 'o1'}}
+    inbound = {'id': 'r1', 'departure_time': '2026-06-08T10:00:00', 'arrival_time': '2026-06-08T16:00:00',
+               'price': 99.5, 'airline': 'BA', 'number_of_bookable_seats': 2, 'raw_data': {'id': 'r1'}}
+    offer, = combine_split_tickets([outbound], [inbound])
+    assert offer['price'] == 219.5
+    assert offer['return_departure_time'] == inbound['departure_time']
+    assert offer['return_airline'] == 'BA'
+    assert offer['number_of_bookable_seats'] == 2
+    assert [t['raw_data']['id'] for t in offer['tickets']] == ['o1', 'r1']
@@ -0,0 +1,157 @@
+import asyncio
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import mail_service
+from email_templates import EmailTemplates
+from mail_service import MailQueue, SMTPConnectionPool, build_message, POOL_SIZE
+from tests.email_samples import SAMPLE_PARAMS
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP server that accepts and discards everything"""
+
+    def handle(self):
+        self.server.connections += 1
+        self.wfile.write(b'220 sink ready\r\n')
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line in (b'.\r\n', b'.\n'):
+                    in_data = False
+                    self.server.messages += 1
+                    self.wfile.write(b'250 queued\r\n')
+                continue
+            command = line[:4].upper()
+            if command in (b'EHLO', b'HELO'):
+                self.wfile.write(b'250 sink\r\n')
+            elif command == b'DATA':
+                in_data = True
+                self.wfile.write(b'354 go ahead\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 ok\r\n')
+
+
+class Sink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    connections = 0
+    messages = 0
+
+
+@pytest.fixture
+def sink():
+    server = Sink(('127.0.0.1', 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_pool_reuses_connections(sink):
+    pool = SMTPConnectionPool(*sink.server_address, starttls=False)
+    message = build_message('bench@flight380.co.uk', 'to@example.com', 'Test', '<p>Hi</p>')
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: pool.send(message), range(60)))
+    pool.close()
+
+    stats = pool.get_stats()
+    assert sink.messages == 60
+    assert stats['messages_sent'] == 60
+    assert stats['connections_opened'] <= POOL_SIZE
+    assert sink.connections == stats['connections_opened']
+
+
+def test_build_message_parts():
+    message = build_message('a@example.com', 'b@example.com', 'Subject', '<p>html</p>', 'plain')
+    assert [part.get_content_type() for part in message.get_payload()] == ['text/plain', 'text/html']
+    assert build_message('a@example.com', 'b@example.com', 'Subject', None, 'plain').get_payload()[0].get_payload() == 'plain'
+
+
+class FailingPool:
+    def send(self, message):
+        raise ConnectionRefusedError('smtp down')
+
+
+def queue(db, pool=None):
+    templates = EmailTemplates()
+    templates.load()
+    return MailQueue(db, pool or FailingPool(), 'noreply@flight380.co.uk', templates)
+
+
+def test_template_messages_render_when_sent(fake_db):
+    mail = queue(fake_db)
+    message = mail.template_message('adam@example.com', 'booking_customer', SAMPLE_PARAMS['booking_customer'])
+    assert message['template_version'] == 1
+    assert message['subject'] == 'Flight380 - Booking Confirmation - PNR: F380AB'
+    assert not {'html_body', 'plain_body'} & set(message)
+    content = mail.content(message)
+    assert content['subject'] == 'Flight380 - Booking Confirmation - PNR: F380AB'
+    assert 'Khan' in content['plain_body']
+
+
+def test_failed_delivery_backs_off_then_fails(fake_db):
+    mail = queue(fake_db)
+    message = {**mail.template_message('adam@example.com', 'password_reset', SAMPLE_PARAMS['password_reset']), 'attempts': 1}
+    asyncio.run(mail._deliver(message))
+    (_, update), = mail.collection.calls_to('update_one')
+    assert update['$set']['status'] == 'PENDING'
+    assert 'smtp down' in update['$set']['last_error']
+
+    message['attempts'] = mail_service.MAX_ATTEMPTS
+    asyncio.run(mail._deliver(message))
+    assert mail.collection.calls_to('update_one')[-1][1]['$set']['status'] == 'FAILED'
+
+
+def test_stale_claims_are_released_once_per_queue(monkeypatch, fake_db):
+    monkeypatch.setattr(mail_service, 'POLL_SECONDS', 0.01)
+    monkeypatch.setattr(mail_service, 'RELEASE_STALE_SECONDS', 0.05)
+
+    async def run():
+        mail = queue(fake_db)
+        await mail.start()
+        await asyncio.sleep(0.12)
+        await mail.stop()
+        return mail
+
+    mail = asyncio.run(run())
+    # Once at start, then every RELEASE_STALE_SECONDS - not on each idle poll of each worker
+    assert 2 <= len(mail.collection.calls_to('update_many')) <= 4
+    assert mail._releaser is None and not mail._tasks
+
+
+def test_queued_messages_are_delivered_and_marked_sent(sink, fake_db):
+    async def run():
+        mail = queue(fake_db, SMTPConnectionPool(*sink.server_address, starttls=False))
+        await mail.start()
+        message_id = await mail.enqueue_template('adam@example.com', 'password_reset', SAMPLE_PARAMS['password_reset'])
+        for _ in range(100):
+            if fake_db.mail_queue.docs[0]['status'] == 'SENT':
+                break
+            await asyncio.sleep(0.01)
+        await mail.stop()
+        mail.pool.close()
+        return message_id
+
+    message_id = asyncio.run(run())
+    message, = fake_db.mail_queue.docs
+    assert message['id'] == message_id and message['status'] == 'SENT' and message['attempts'] == 1
+    assert sink.messages == 1
+
+
+def test_enqueue_many_skips_messages_already_queued(fake_db):
+    fake_db.mail_queue.unique.append('id')
+    mail = queue(fake_db)
+    messages = [
+        mail.template_message('adam@example.com', 'password_reset', SAMPLE_PARAMS['password_reset'], message_id=f'm{n}')
+        for n in range(3)
+    ]
+    assert asyncio.run(mail.enqueue_many(messages[:2])) == 2
+    assert asyncio.run(mail.enqueue_many(messages)) == 1
+    assert [message['id'] for message in fake_db.mail_queue.docs] == ['m0', 'm1', 'm2']
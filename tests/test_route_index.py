@@ -0,0 +1,66 @@
+import asyncio
+
+from route_index import RouteIndex, EMPTY_DATES_THRESHOLD
+
+
+def run(db, record_calls):
+    async def main():
+        index = RouteIndex(db)
+        record_calls(index)
+        await asyncio.gather(*index._saves)
+        return index
+    return asyncio.run(main())
+
+
+def dates(count):
+    return [f"2026-07-{day:02d}" for day in range(1, count + 1)]
+
+
+def test_repeated_empties_on_one_date_do_not_prune(fake_db):
+    index = run(fake_db, lambda index: [index.record('LHR', 'JER', 0, departure_date='2026-07-01') for _ in range(5)])
+    assert not index.is_known_empty(index.routes[index.route_key('LHR', 'JER')])
+
+
+def test_empties_across_several_dates_prune(monkeypatch, fake_db):
+    monkeypatch.setattr('route_index.random.random', lambda: 1.0)
+    index = run(fake_db, lambda index: [index.record('LHR', 'JER', 0, departure_date=d) for d in dates(EMPTY_DATES_THRESHOLD)])
+    assert index.is_known_empty(index.routes[index.route_key('LHR', 'JER')])
+    assert index.filter_pairs([('LHR', 'JER'), ('LGW', 'JER')]) == ([('LGW', 'JER')], [('LHR', 'JER')])
+
+
+def test_empties_are_kept_per_cabin(fake_db):
+    def record(index):
+        for d in dates(EMPTY_DATES_THRESHOLD):
+            index.record('LHR', 'JER', 0, cabin='FIRST', departure_date=d)
+    index = run(fake_db, record)
+    assert index.is_known_empty(index.routes[index.route_key('LHR', 'JER', cabin='FIRST')])
+    assert index.route_key('LHR', 'JER') not in index.routes
+
+
+def test_offers_reset_empties(fake_db):
+    def record(index):
+        for d in dates(EMPTY_DATES_THRESHOLD):
+            index.record('LHR', 'JER', 0, departure_date=d)
+        index.record('LHR', 'JER', 4, departure_date='2026-08-01')
+    index = run(fake_db, record)
+    route = index.routes[index.route_key('LHR', 'JER')]
+    assert route['empty_dates'] == [] and route['has_offers']
+    assert not index.is_known_empty(route)
+
+
+def test_large_party_empties_are_not_evidence(fake_db):
+    index = run(fake_db, lambda index: [index.record('LHR', 'JER', 0, departure_date=d, passengers=6) for d in dates(5)])
+    assert index.routes == {}
+
+
+def test_saves_are_atomic_updates(fake_db):
+    def record(index):
+        index.record('LHR', 'JER', 0, departure_date='2026-07-01')
+        index.record('LHR', 'JER', 3, departure_date='2026-07-02')
+    index = run(fake_db, record)
+    (_, empty), (_, offers) = index.collection.calls_to('update_one')
+    assert empty['$addToSet'] == {'empty_dates': '2026-07-01'}
+    assert '$set' not in empty
+    assert offers['$set'] == {'has_offers': True, 'empty_dates': []}
+    assert set(offers['$max']) == {'last_checked', 'last_offer_at'}
+    assert not index._saves
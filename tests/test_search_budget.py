@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import search_budget
+from search_budget import run_searches_with_deadline, search_deadline
+
+
+async def search(route, seconds=0.0, error=None):
+    await asyncio.sleep(seconds)
+    if error:
+        raise error
+    return {'success': True, 'route': route}
+
+
+def test_all_pairs_finishing_give_a_full_result():
+    async def main():
+        searches = {pair: search(pair) for pair in [('LHR', 'DXB'), ('LGW', 'DXB'), ('STN', 'DXB')]}
+        return await run_searches_with_deadline(searches, time.monotonic() + 1)
+
+    results, timed_out = asyncio.run(main())
+    assert list(results) == [('LHR', 'DXB'), ('LGW', 'DXB'), ('STN', 'DXB')]
+    assert results[('LGW', 'DXB')] == {'success': True, 'route': ('LGW', 'DXB')}
+    assert timed_out == []
+
+
+def test_slow_pair_gives_partial_results():
+    async def main():
+        finished = asyncio.Event()
+
+        async def slow():
+            result = await search(('LHR', 'JFK'), 0.2)
+            finished.set()
+            return result
+
+        searches = {('LHR', 'DXB'): search(('LHR', 'DXB')), ('LHR', 'JFK'): slow()}
+        started = time.monotonic()
+        outcome = await run_searches_with_deadline(searches, started + 0.05)
+        elapsed = time.monotonic() - started
+        # The slow search isn't cancelled: it finishes in the background for the caches
+        await asyncio.wait_for(finished.wait(), 1)
+        return outcome, elapsed
+
+    (results, timed_out), elapsed = asyncio.run(main())
+    assert list(results) == [('LHR', 'DXB')]
+    assert timed_out == [('LHR', 'JFK')]
+    assert elapsed < 0.15
+
+
+def test_failed_searches_are_left_out():
+    async def main():
+        searches = {'ok': search('ok'), 'broken': search('broken', error=ConnectionError('amadeus down'))}
+        return await run_searches_with_deadline(searches, time.monotonic() + 1)
+
+    results, timed_out = asyncio.run(main())
+    assert list(results) == ['ok'] and timed_out == []
+
+
+def test_searches_still_queued_at_the_deadline_never_start(monkeypatch):
+    monkeypatch.setattr(search_budget, 'SEARCH_CONCURRENCY', 1)
+
+    async def main():
+        started = []
+
+        async def tracked(route, seconds):
+            started.append(route)
+            return await search(route, seconds)
+
+        searches = {'first': tracked('first', 0.1), 'second': tracked('second', 0)}
+        outcome = await run_searches_with_deadline(searches, time.monotonic() + 0.05)
+        await asyncio.sleep(0.1)
+        return outcome, started
+
+    (results, timed_out), started = asyncio.run(main())
+    assert results == {} and timed_out == ['first', 'second']
+    assert started == ['first']
+
+
+def test_no_searches():
+    assert asyncio.run(run_searches_with_deadline({}, time.monotonic() + 1)) == ({}, [])
+
+
+def test_clients_can_only_shorten_the_deadline(monkeypatch):
+    monkeypatch.setattr(search_budget, 'SEARCH_DEADLINE_SECONDS', 20.0)
+    monkeypatch.setattr(search_budget.time, 'monotonic', lambda: 100.0)
+    assert search_deadline(None) == 120.0
+    assert search_deadline(5) == 105.0
+    assert search_deadline(60) == 120.0
+    assert search_deadline(-1) == 120.0
@@ -0,0 +1,96 @@
+import pytest
+
+from search_cache import NEGATIVE_STALE_GRACE, NEGATIVE_TTLS, SearchCache
+
+PARAMS = {'originLocationCode': 'LHR', 'destinationLocationCode': 'JER', 'departureDate': '2026-07-01', 'adults': 1}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('search_cache.time.monotonic', lambda: now[0])
+    return now
+
+
+def error(code):
+    return {'success': False, 'error': {'code': code, 'message': 'Amadeus said no'}}
+
+
+@pytest.mark.parametrize('result, reason', [
+    ({'success': True, 'data': []}, 'NO_OFFERS'),
+    (error(400), 400),
+    (error(404), 404),
+    (error(422), 422)
+])
+def test_negative_results_expire_after_their_ttl_and_grace(clock, result, reason):
+    cache = SearchCache()
+    assert cache.store_negative(PARAMS, result)
+    ttl, grace = NEGATIVE_TTLS[reason], NEGATIVE_STALE_GRACE[reason]
+
+    clock[0] += ttl - 1
+    cached = cache.get_negative(PARAMS)
+    assert cached['negative_cache'] == {'reason': reason, 'ttl': ttl, 'stale': False}
+
+    # Past the TTL it is still served, flagged stale, until the grace window ends
+    clock[0] += 2
+    assert cache.get_negative(PARAMS)['negative_cache']['stale']
+    clock[0] += grace
+    assert cache.get_negative(PARAMS) is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_successful_results_are_never_negatively_cached(clock):
+    cache = SearchCache()
+    assert not cache.store_negative(PARAMS, {'success': True, 'data': [{'id': '1'}]})
+    assert cache.get_negative(PARAMS) is None
+    assert cache.get_stats()['negative_stores'] == 0
+
+
+@pytest.mark.parametrize('code', [401, 429, 500, 503, 'NETWORK_ERROR'])
+def test_transient_errors_are_not_cached(clock, code):
+    cache = SearchCache()
+    assert not cache.store_negative(PARAMS, error(code))
+    assert cache.get_negative(PARAMS) is None
+
+
+def test_stale_entries_are_a_miss_for_get(clock):
+    cache = SearchCache()
+    cache.store_negative(PARAMS, error(400))
+    key = SearchCache.make_key(PARAMS)
+    assert cache.get(key) is not None
+    clock[0] += NEGATIVE_TTLS[400] + 1
+    assert cache.get(key) is None
+    assert cache.get_entry(key)[1]
+
+
+def test_only_one_refresh_per_stale_entry(clock):
+    cache = SearchCache()
+    cache.store_negative(PARAMS, {'success': True, 'data': []})
+    key = SearchCache.make_key(PARAMS)
+    assert cache.begin_refresh(key)
+    assert not cache.begin_refresh(key)
+    cache.end_refresh(key)
+    assert cache.begin_refresh(key)
+
+
+def test_keys_ignore_case_and_result_limit(clock):
+    cache = SearchCache()
+    cache.store_negative({**PARAMS, 'max': 50}, error(400))
+    assert cache.get_negative({**PARAMS, 'originLocationCode': 'lhr', 'max': 10}) is not None
+
+
+def test_cached_results_are_copies(clock):
+    cache = SearchCache()
+    cache.store_negative(PARAMS, error(400))
+    cache.get_negative(PARAMS)['error']['code'] = 500
+    assert cache.get_negative(PARAMS)['error']['code'] == 400
+
+
+def test_full_cache_evicts_expired_entries_first(clock):
+    cache = SearchCache(max_entries=2)
+    cache.store_negative({**PARAMS, 'adults': 1}, {'success': True, 'data': []})
+    cache.store_negative({**PARAMS, 'adults': 2}, error(400))
+    clock[0] += NEGATIVE_TTLS['NO_OFFERS'] + NEGATIVE_STALE_GRACE['NO_OFFERS'] + 1
+    cache.store_negative({**PARAMS, 'adults': 3}, error(400))
+    assert cache.get_negative({**PARAMS, 'adults': 2}) is not None
+    assert cache.get_stats()['evictions'] == 1
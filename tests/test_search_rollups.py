@@ -0,0 +1,169 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from search_rollups import DAILY_COLLECTION, HOURLY_COLLECTION, LEASE, STATE_ID, SearchRollups
+from tests.conftest import FakeCollection
+
+
+class Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length):
+        return self.rows
+
+
+class RollupCollection(FakeCollection):
+    """
+    Evaluates the two rollup pipelines: $match on a time window, group raw
+    events by hour (or hourly rollups by day) and $merge-replace the groups
+    """
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.before_merge = None
+
+    def aggregate(self, pipeline):
+        (field, window), = pipeline[0]['$match'].items()
+        daily = pipeline[-1]['$merge']['into'] == DAILY_COLLECTION
+        groups = {}
+        for doc in self.docs:
+            if not window['$gte'] <= doc[field] < window['$lt']:
+                continue
+            if daily:
+                key = (doc['hour'].replace(hour=0), doc['route'], doc['type'], doc['passengers'])
+                counts = (doc['searches'], doc['results'])
+            else:
+                key = (doc['timestamp'].replace(minute=0, second=0, microsecond=0), f"{doc['origin']}-{doc['destination']}",
+                       'round-trip' if doc.get('return_date') else 'one-way', doc['passengers'])
+                counts = (1, doc['results_count'])
+            searches, results = groups.get(key, (0, 0))
+            groups[key] = (searches + counts[0], results + counts[1])
+        if self.before_merge:
+            self.before_merge()
+        period = 'day' if daily else 'hour'
+        target = self.db[pipeline[-1]['$merge']['into']]
+        for key, (searches, results) in groups.items():
+            _id = dict(zip((period, 'route', 'type', 'passengers'), key))
+            target.docs = [doc for doc in target.docs if doc['_id'] != _id]
+            target.docs.append({**_id, '_id': _id, 'searches': searches, 'results': results})
+        return Rows([])
+
+
+@pytest.fixture
+def db(fake_db):
+    for name in ('flight_searches', HOURLY_COLLECTION, DAILY_COLLECTION):
+        fake_db.collections[name] = RollupCollection(fake_db)
+    return fake_db
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [datetime(2026, 3, 10, 12, 10)]
+    monkeypatch.setattr('search_rollups._utcnow', lambda: now[0])
+    return now
+
+
+def search(hour, minute=0, origin='LHR', destination='DXB', results=10):
+    return {'origin': origin, 'destination': destination, 'passengers': 1, 'return_date': '2026-03-20',
+            'results_count': results, 'timestamp': datetime(2026, 3, 10, hour, minute)}
+
+
+def daily_searches(db):
+    return sum(doc['searches'] for doc in db[DAILY_COLLECTION].docs)
+
+
+def watermark(db):
+    return db.rollup_state.docs[0].get('rolled_through')
+
+
+def test_settled_hours_are_rolled_up(db, clock):
+    asyncio.run(db.flight_searches.insert_many([search(10, 5), search(10, 50), search(11, 30, destination='JFK')]))
+    rollups = SearchRollups(db)
+    # From the first event's hour to the last hour settled by 12:10
+    assert asyncio.run(rollups.run_once()) == 2
+    assert watermark(db) == datetime(2026, 3, 10, 12)
+    assert {(doc['hour'].hour, doc['route'], doc['searches']) for doc in db[HOURLY_COLLECTION].docs} == {
+        (10, 'LHR-DXB', 2), (11, 'LHR-JFK', 1)
+    }
+    assert daily_searches(db) == 3
+
+
+def test_rolled_hours_are_not_counted_again(db, clock):
+    asyncio.run(db.flight_searches.insert_many([search(10, 5), search(11, 30)]))
+    rollups = SearchRollups(db)
+    asyncio.run(rollups.run_once())
+    # Nothing newly settled: the watermark stays and totals are unchanged
+    assert asyncio.run(rollups.run_once()) == 0
+    assert daily_searches(db) == 2
+
+    # Later runs re-roll the window before the watermark, replacing rather than adding to it
+    clock[0] = datetime(2026, 3, 10, 14, 10)
+    asyncio.run(db.flight_searches.insert_many([search(12, 15), search(13, 45)]))
+    assert asyncio.run(rollups.run_once()) == 2
+    assert daily_searches(db) == 4
+    assert watermark(db) == datetime(2026, 3, 10, 14)
+
+
+def test_late_events_within_the_reroll_window_are_counted(db, clock):
+    asyncio.run(db.flight_searches.insert_many([search(10, 5), search(11, 30)]))
+    rollups = SearchRollups(db)
+    asyncio.run(rollups.run_once())
+
+    # A buffered write for 11:40 lands after 11:00 was rolled up
+    clock[0] = datetime(2026, 3, 10, 13, 10)
+    asyncio.run(db.flight_searches.insert_one(search(11, 40)))
+    asyncio.run(rollups.run_once())
+    eleven, = [doc for doc in db[HOURLY_COLLECTION].docs if doc['hour'].hour == 11]
+    assert eleven['searches'] == 2
+    assert daily_searches(db) == 3
+
+
+def test_only_one_worker_rolls_up_at_a_time(db, clock):
+    asyncio.run(db.flight_searches.insert_many([search(10, 5), search(11, 30)]))
+
+    async def both():
+        return await asyncio.gather(SearchRollups(db).run_once(), SearchRollups(db).run_once())
+
+    assert sorted(asyncio.run(both())) == [0, 2]
+    assert daily_searches(db) == 2
+    state, = db.rollup_state.docs
+    assert 'lease_owner' not in state and 'lease_until' not in state
+
+
+def test_a_held_lease_is_respected_until_it_expires(db, clock):
+    asyncio.run(db.flight_searches.insert_one(search(10, 5)))
+    asyncio.run(db.rollup_state.insert_one({'_id': STATE_ID, 'lease_owner': 'other', 'lease_until': clock[0] + timedelta(minutes=1)}))
+    rollups = SearchRollups(db)
+    assert asyncio.run(rollups.run_once()) == 0
+    assert db.rollup_state.docs[0]['lease_owner'] == 'other'
+
+    # The other worker died; its lease runs out and this one takes over
+    clock[0] += LEASE
+    assert asyncio.run(rollups.run_once()) == 2
+    assert daily_searches(db) == 1
+
+
+def test_a_run_that_loses_its_lease_leaves_the_watermark(db, clock):
+    asyncio.run(db.flight_searches.insert_one(search(10, 5)))
+
+    def taken_over():
+        db.rollup_state.docs[0]['lease_owner'] = 'other'
+    db.flight_searches.before_merge = taken_over
+
+    assert asyncio.run(SearchRollups(db).run_once()) == 0
+    state, = db.rollup_state.docs
+    assert 'rolled_through' not in state
+    # ...and doesn't release the new owner's lease
+    assert state['lease_owner'] == 'other'
+
+
+def test_raw_events_are_kept_until_rolled_up_and_past_retention(db, clock):
+    old = {**search(10), 'timestamp': datetime(2026, 1, 1, 10)}
+    asyncio.run(db.flight_searches.insert_many([old, search(11, 30)]))
+    asyncio.run(SearchRollups(db).run_once())
+    assert [doc['timestamp'] for doc in db.flight_searches.docs] == [datetime(2026, 3, 10, 11, 30)]
+    assert daily_searches(db) == 2
@@ -0,0 +1,64 @@
+import asyncio
+
+from session_cache import SessionCache
+
+
+def user(user_id):
+    return {'user_id': user_id, 'email': f'{user_id}@example.com'}
+
+
+def test_get_returns_what_was_set(fake_db):
+    cache = SessionCache(fake_db)
+    cache.set('t1', {'user_id': 'u1'}, user('u1'), cache.generation)
+    assert cache.get('t1') == ({'user_id': 'u1'}, user('u1'))
+    assert cache.get('t2') is None
+    assert cache.get_stats()['hits'] == 1 and cache.get_stats()['misses'] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch, fake_db):
+    now = [1000.0]
+    monkeypatch.setattr('session_cache.time.monotonic', lambda: now[0])
+    cache = SessionCache(fake_db, ttl_seconds=300)
+    cache.set('t1', {}, user('u1'), cache.generation)
+    now[0] += 299
+    assert cache.get('t1') is not None
+    now[0] += 2
+    assert cache.get('t1') is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_least_recently_used_is_evicted(fake_db):
+    cache = SessionCache(fake_db, size=2)
+    for token in ('t1', 't2'):
+        cache.set(token, {}, user(token), cache.generation)
+    cache.get('t1')
+    cache.set('t3', {}, user('t3'), cache.generation)
+    assert cache.get('t2') is None
+    assert cache.get('t1') is not None and cache.get('t3') is not None
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_invalidations_evict_locally_and_are_published(fake_db):
+    cache = SessionCache(fake_db)
+    cache.set('t1', {}, user('u1'), cache.generation)
+    cache.set('t2', {}, user('u1'), cache.generation)
+    cache.set('t3', {}, user('u2'), cache.generation)
+
+    asyncio.run(cache.invalidate_token('t3'))
+    assert cache.get('t3') is None
+    asyncio.run(cache.invalidate_user('u1'))
+    assert cache.get('t1') is None and cache.get('t2') is None
+
+    published = fake_db.session_invalidations.docs
+    assert 'token_hash' in published[0] and 't3' not in published[0].values()
+    assert published[1]['user_id'] == 'u1'
+
+
+def test_lookup_racing_an_invalidation_is_not_cached(fake_db):
+    cache = SessionCache(fake_db)
+    generation = cache.generation
+    # Logout lands while the lookup is awaiting MongoDB
+    asyncio.run(cache.invalidate_token('t1'))
+    cache.set('t1', {}, user('u1'), generation)
+    assert cache.get('t1') is None
+    assert cache.get_stats()['stale_sets'] == 1
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight, run_until_disconnected
+
+
+def test_concurrent_callers_share_one_call():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+
+        async def search():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'success': True, 'data': ['offer']}
+
+        results = await asyncio.gather(*[flights.run(('LHR', 'DXB'), search) for _ in range(5)])
+        return flights, calls, results
+
+    flights, calls, results = asyncio.run(main())
+    assert len(calls) == 1
+    assert results == [{'success': True, 'data': ['offer']}] * 5
+    assert flights.get_stats() == {'started': 1, 'shared': 4, 'detached': 0, 'cancelled': 0, 'in_flight': 0}
+
+
+def test_different_keys_do_not_share():
+    async def main():
+        flights = SingleFlight()
+
+        async def search(route):
+            await asyncio.sleep(0)
+            return route
+
+        return await asyncio.gather(
+            flights.run('LHR-DXB', lambda: search('LHR-DXB')),
+            flights.run('LHR-JFK', lambda: search('LHR-JFK'))
+        )
+
+    assert asyncio.run(main()) == ['LHR-DXB', 'LHR-JFK']
+
+
+def test_errors_reach_every_waiter():
+    async def main():
+        flights = SingleFlight()
+
+        async def search():
+            await asyncio.sleep(0.01)
+            raise ConnectionError('amadeus down')
+
+        return await asyncio.gather(*[flights.run('LHR-DXB', search) for _ in range(3)], return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert len(errors) == 3
+    assert all(isinstance(error, ConnectionError) for error in errors)
+
+
+def test_call_is_cancelled_when_its_last_waiter_leaves():
+    async def main():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def search():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(flights.run('LHR-DXB', search))
+        second = asyncio.create_task(flights.run('LHR-DXB', search))
+        await started.wait()
+
+        # One of two waiters leaving only detaches it
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not cancelled.is_set()
+        second.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flights.get_stats()
+
+    stats = asyncio.run(main())
+    assert stats['detached'] == 1 and stats['cancelled'] == 1 and stats['in_flight'] == 0
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after=None):
+        self.disconnect_after = disconnect_after
+        self.polls = 0
+
+    async def is_disconnected(self):
+        self.polls += 1
+        return self.disconnect_after is not None and self.polls >= self.disconnect_after
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(singleflight, 'DISCONNECT_POLL_SECONDS', 0.01)
+    monkeypatch.setitem(singleflight.disconnect_stats, 'search', 0)
+
+
+def test_search_is_cancelled_when_the_client_disconnects():
+    async def main():
+        cancelled = asyncio.Event()
+
+        async def search():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        result = await run_until_disconnected(FakeRequest(disconnect_after=2), search(), 'search')
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return result
+
+    result = asyncio.run(main())
+    assert result['error']['code'] == 'CLIENT_DISCONNECTED'
+    assert singleflight.disconnect_stats['search'] == 1
+
+
+def test_search_result_is_returned_while_the_client_waits():
+    async def main():
+        async def search():
+            await asyncio.sleep(0.03)
+            return {'success': True, 'flights': []}
+
+        request = FakeRequest()
+        return await run_until_disconnected(request, search(), 'search'), request
+
+    result, request = asyncio.run(main())
+    assert result == {'success': True, 'flights': []}
+    assert request.polls >= 1
+    assert singleflight.disconnect_stats['search'] == 0
+
+
+def test_disconnect_leaves_shared_upstream_calls_running_for_other_waiters():
+    async def main():
+        flights = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.05)
+            return 'offers'
+
+        async def search():
+            return await flights.run('LHR-DXB', upstream)
+
+        staying = asyncio.create_task(run_until_disconnected(FakeRequest(), search(), 'search'))
+        leaving = await run_until_disconnected(FakeRequest(disconnect_after=1), search(), 'search')
+        return leaving, await staying, flights.get_stats()
+
+    leaving, staying, stats = asyncio.run(main())
+    assert leaving['error']['code'] == 'CLIENT_DISCONNECTED'
+    assert staying == 'offers'
+    assert stats['started'] == 1 and stats['detached'] == 1 and stats['cancelled'] == 0